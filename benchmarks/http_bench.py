@@ -0,0 +1,403 @@
+"""
+HTTP 压测脚本
+
+在临时SQLite文件上启动完整的服务(uvicorn, 独立线程), 写入指定数量的用户、客户和邮件任务后,
+用多个线程(标准库 http.client, 长连接)按权重混合请求各个接口, 统计每个路由的
+p50/p95/p99 延迟和每秒请求数, 结果保存为JSON, 便于对比不同版本的性能
+
+用法(在项目根目录执行):
+    python benchmarks/http_bench.py --customers 100000 --tasks 100000 --duration 30 --concurrency 32
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.client import HTTPConnection
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_USER = "bench_admin"
+BENCH_PASSWD = "bench123"
+
+# 默认请求混合: 路由 -> 权重
+DEFAULT_MIX = {
+    "login": 2,
+    "customers_query": 35,
+    "customers_query_by_id": 35,
+    "email_tasks_add": 23,
+    "email_tasks_batch_add": 5,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CRM 后端 HTTP 压测")
+    parser.add_argument("--users", type=int, default=10, help="用户数量")
+    parser.add_argument("--customers", type=int, default=10000, help="客户数量")
+    parser.add_argument("--tags", type=int, default=50, help="标签种类数量")
+    parser.add_argument("--tasks", type=int, default=10000, help="邮件任务数量")
+    parser.add_argument("--duration", type=float, default=20.0, help="每轮压测时长(秒)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="预热时长(秒), 不计入结果")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端线程数")
+    parser.add_argument("--batch-size", type=int, default=20, help="batch_add 每次的收件客户数")
+    parser.add_argument(
+        "--mix",
+        type=str,
+        default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+        help="请求权重, 例如 customers_query=50,email_tasks_add=50",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子")
+    parser.add_argument("--output", type=str, default=None, help="结果JSON文件路径")
+    return parser.parse_args()
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"未知的请求类型: {name}, 可选: {', '.join(DEFAULT_MIX)}")
+        weights[name] = int(weight)
+    return weights
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_environment(db_dir: str):
+    """在导入应用之前设置环境变量(配置在导入时读取)"""
+    os.chdir(ROOT_DIR)
+    sys.path.insert(0, ROOT_DIR)
+    os.environ["SQLITE_FILE_NAME"] = os.path.join(db_dir, "bench.db")
+    os.environ["INIT_SAMPLE_DATA"] = "false"
+    os.environ.setdefault("HOSTNAME", "127.0.0.1")
+    os.environ.setdefault("PORT", "0")
+    os.environ.setdefault("JWT_KEY", "bench")
+    os.environ.setdefault("LOG_CONSOLE_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_CONSOLE_FORMAT", "{time} - {level} - {message}")
+    os.environ.setdefault("LOG_FILE_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_FILE_PATH", os.path.join(db_dir, "bench.log"))
+    os.environ.setdefault("LOG_FILE_FORMAT", "{time} - {level} - {message}")
+
+
+def seed_database(args) -> Tuple[List[str], List[int]]:
+    """
+    创建压测管理员并用 init_data.generate_data 批量生成数据,
+    返回 (可发送的客户邮箱, 客户ID)
+    """
+    from sqlalchemy import insert
+    from sqlmodel import Session, select
+
+    from crm_backend.db.db import create_db_and_tables, engine
+    from crm_backend.db.init_data import generate_data
+    from crm_backend.models.customer import Customer
+    from crm_backend.models.user import User
+    from crm_backend.utils.security import get_passwd_hash
+
+    create_db_and_tables()
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.exec(
+            insert(User),  # type: ignore
+            params=[
+                {
+                    "name": BENCH_USER,
+                    "passwd": get_passwd_hash(BENCH_PASSWD),
+                    "email": "bench_admin@example.com",
+                    "is_active": True,
+                    "is_admin": True,
+                    "created_at": now,
+                    "updated_at": now,
+                    "last_login": now,
+                }
+            ],
+        )
+        session.commit()
+
+    # 历史任务都是已完成的(pending_ratio=0), 避免压测期间执行器去发送它们
+    generate_data(
+        users=args.users,
+        customers=args.customers,
+        tags_per_customer=3,
+        tasks=args.tasks,
+        tag_count=args.tags,
+        seed=args.seed,
+    )
+
+    with Session(engine) as session:
+        sendable_emails = list(
+            session.exec(select(Customer.email).where(Customer.is_blacklist == False)).all()  # noqa: E712
+        )
+        customer_ids = list(session.exec(select(Customer.id)).all())
+    return sendable_emails, customer_ids  # type: ignore
+
+
+def start_server(port: int):
+    import uvicorn
+
+    import main
+
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, name="bench_server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("服务启动失败")
+        time.sleep(0.05)
+    return server, thread
+
+
+class Client:
+    """一个压测线程使用的HTTP长连接"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.connection = HTTPConnection("127.0.0.1", port, timeout=60)
+        self.token: Optional[str] = None
+
+    def request(self, method: str, path: str, body: Any = None) -> Tuple[int, Any]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["X-Auth-Token"] = self.token
+        payload = json.dumps(body).encode() if body is not None else None
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (ConnectionError, OSError):
+            # 连接被服务端关闭时重连, 本次请求记为失败
+            self.connection.close()
+            self.connection = HTTPConnection("127.0.0.1", self.port, timeout=60)
+            return 0, None
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def login(self) -> int:
+        status, data = self.request(
+            "POST",
+            "/api/users/login",
+            {"name": BENCH_USER, "passwd": BENCH_PASSWD, "email": "bench_admin@example.com"},
+        )
+        if status == 200:
+            self.token = data["data"]["access_token"]
+        return status
+
+
+def build_operations(
+    client: Client, rng: random.Random, emails: List[str], customer_ids: List[int], batch_size: int
+) -> Dict[str, Callable[[], int]]:
+    def customers_query():
+        offset = rng.randint(0, max(len(customer_ids) - 10, 0)) if rng.random() < 0.2 else 0
+        return client.request("GET", f"/api/customers/query?limit=10&offset={offset}")[0]
+
+    def customers_query_by_id():
+        return client.request("GET", f"/api/customers/query/{rng.choice(customer_ids)}")[0]
+
+    def email_tasks_add():
+        return client.request(
+            "POST",
+            "/api/email_tasks/add",
+            {
+                "name": "压测单个邮件",
+                "send_by": "",
+                "send_to": rng.choice(emails),
+                "email": {"subject": "压测", "body": "<p>压测邮件</p>"},
+            },
+        )[0]
+
+    def email_tasks_batch_add():
+        return client.request(
+            "POST",
+            "/api/email_tasks/batch_add",
+            {
+                "name": "压测批量邮件",
+                "email": {"subject": "压测", "body": "<p>压测邮件</p>"},
+                "send_customer_by_emails": rng.sample(emails, k=min(batch_size, len(emails))),
+            },
+        )[0]
+
+    return {
+        "login": client.login,
+        "customers_query": customers_query,
+        "customers_query_by_id": customers_query_by_id,
+        "email_tasks_add": email_tasks_add,
+        "email_tasks_batch_add": email_tasks_batch_add,
+    }
+
+
+def run_load(args, port: int, emails: List[str], customer_ids: List[int], weights: Dict[str, int]):
+    """返回 {路由: [(开始时间, 耗时, 状态码)]}"""
+    samples: Dict[str, List[Tuple[float, float, int]]] = {name: [] for name in weights}
+    lock = threading.Lock()
+    names = [name for name, weight in weights.items() if weight > 0]
+    name_weights = [weights[name] for name in names]
+    deadline = [0.0]
+    measure_from = [0.0]
+
+    def set_deadline():
+        # 所有线程都登录完成后才开始计时
+        now = time.perf_counter()
+        measure_from[0] = now + args.warmup
+        deadline[0] = measure_from[0] + args.duration
+
+    started = threading.Barrier(args.concurrency + 1, action=set_deadline)
+
+    def worker(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(port)
+        client.login()
+        operations = build_operations(client, rng, emails, customer_ids, args.batch_size)
+        local: List[Tuple[str, float, float, int]] = []
+        started.wait()
+        while True:
+            name = rng.choices(names, weights=name_weights)[0]
+            begin = time.perf_counter()
+            if begin >= deadline[0]:
+                break
+            status = operations[name]()
+            local.append((name, begin, time.perf_counter() - begin, status))
+        client.connection.close()
+        with lock:
+            for name, begin, latency, status in local:
+                samples[name].append((begin, latency, status))
+
+    threads = [
+        threading.Thread(target=worker, args=(index,), daemon=True)
+        for index in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait()
+    for thread in threads:
+        thread.join()
+    return samples, measure_from[0]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(samples: Dict[str, List[Tuple[float, float, int]]], measure_from: float, duration: float):
+    report: Dict[str, Dict[str, Any]] = {}
+    all_latencies: List[float] = []
+    for name, rows in samples.items():
+        rows = [row for row in rows if row[0] >= measure_from]  # 去掉预热阶段
+        latencies = sorted(latency for _, latency, _ in rows)
+        all_latencies.extend(latencies)
+        status_counts: Dict[str, int] = {}
+        for _, _, status in rows:
+            status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+        report[name] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 2),
+            "errors": sum(count for status, count in status_counts.items() if status != "200"),
+            "status": status_counts,
+        }
+    all_latencies.sort()
+    report["total"] = {
+        "requests": len(all_latencies),
+        "rps": round(len(all_latencies) / duration, 2),
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "errors": sum(row["errors"] for row in report.values()),
+    }
+    return report
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: Dict[str, Dict[str, Any]]):
+    print(f"{'route':<24}{'requests':>10}{'rps':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'errors':>8}")
+    for name, row in report.items():
+        print(
+            f"{name:<24}{row['requests']:>10}{row['rps']:>10}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['errors']:>8}"
+        )
+
+
+def main():
+    args = parse_args()
+    weights = parse_mix(args.mix)
+    db_dir = tempfile.mkdtemp(prefix="crm_bench_")
+    prepare_environment(db_dir)
+
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level=os.environ["LOG_CONSOLE_LEVEL"])
+
+    seed_started = time.perf_counter()
+    emails, customer_ids = seed_database(args)
+    print(
+        f"数据准备完成: {args.users} 个用户, {args.customers} 个客户, {args.tasks} 个任务, "
+        f"耗时 {time.perf_counter() - seed_started:.1f}s ({db_dir})"
+    )
+
+    port = free_port()
+    server, server_thread = start_server(port)
+    try:
+        samples, measure_from = run_load(args, port, emails, customer_ids, weights)
+    finally:
+        server.should_exit = True
+        server_thread.join(timeout=30)
+
+    report = summarize(samples, measure_from, args.duration)
+    print_report(report)
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "params": {
+            "users": args.users,
+            "customers": args.customers,
+            "tags": args.tags,
+            "tasks": args.tasks,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "mix": weights,
+            "seed": args.seed,
+        },
+        "routes": report,
+    }
+    output = args.output or os.path.join(
+        ROOT_DIR, "benchmarks", "results", f"http_bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+SMTP发送压测
+
+在同一进程中启动本地SMTP替身服务器(benchmarks/smtp_stub.py), 通过 SmtpEmailBackend 并发发送邮件,
+对比连接池复用连接与每封邮件新建连接(--max-messages-per-connection 1)的发送速率
+
+用法(在项目根目录执行):
+    python benchmarks/smtp_bench.py --messages 5000 --concurrency 32 --pool-size 8
+    python benchmarks/smtp_bench.py --messages 5000 --concurrency 32 --pool-size 8 --max-messages-per-connection 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from functools import partial
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_stub import SmtpStubServer  # noqa: E402
+
+from crm_backend.utils.email_backend import SmtpEmailBackend  # noqa: E402
+from crm_backend.utils.smtp_client import SmtpConnection, SmtpConnectionPool  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SMTP发送压测")
+    parser.add_argument("--messages", type=int, default=2000, help="发送的邮件数量")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发发送的协程数")
+    parser.add_argument("--pool-size", type=int, default=8, help="连接池大小")
+    parser.add_argument(
+        "--max-messages-per-connection", type=int, default=100, help="单个连接发送的邮件数上限"
+    )
+    parser.add_argument("--data-latency", type=float, default=0.0, help="替身服务器每封邮件的处理耗时(秒)")
+    parser.add_argument("--reject-every", type=int, default=0, help="每N个收件人中有一个被拒收(0表示不拒收)")
+    return parser.parse_args()
+
+
+async def run(args):
+    server = SmtpStubServer(
+        username="bench", password="bench", data_latency=args.data_latency, reject_pattern="reject"
+    )
+    await server.start()
+    pool = SmtpConnectionPool(
+        partial(SmtpConnection, server.host, server.port, username="bench", password="bench", timeout=10.0),
+        size=args.pool_size,
+        max_messages_per_connection=args.max_messages_per_connection,
+    )
+    backend = SmtpEmailBackend(pool, sender="campaign@example.com")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(args.messages):
+        rejected = args.reject_every and index % args.reject_every == 0
+        queue.put_nowait(f"{'reject' if rejected else 'customer'}{index}@example.com")
+    results = {"succeeded": 0, "failed": 0}
+
+    async def sender():
+        while not queue.empty():
+            send_to = queue.get_nowait()
+            ok = await backend.send("压测邮件", "<p>你好</p>", "bench@example.com", send_to)
+            results["succeeded" if ok else "failed"] += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started_at
+    await backend.close()
+    await server.stop()
+
+    print(f"发送 {args.messages} 封, 耗时 {elapsed:.2f}s, {args.messages / elapsed:.0f} 封/秒")
+    print(f"结果: {results}")
+    print(f"连接池: {pool.stats()}")
+    print(f"服务器: {server.stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
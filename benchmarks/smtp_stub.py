@@ -0,0 +1,211 @@
+"""
+本地SMTP替身服务器
+
+只实现邮件任务执行器用到的SMTP命令(EHLO/HELO、AUTH PLAIN/LOGIN、MAIL、RCPT、DATA、RSET、NOOP、QUIT),
+支持 PIPELINING, 收到的邮件只计数(可选保留最近几封), 不做投递.
+可以在同一进程中启动(测试、压测), 也可以单独运行, 把服务配置为 EMAIL_BACKEND=smtp 指向它:
+    python benchmarks/smtp_stub.py --port 2525 --data-latency 0.05
+
+可选的故障模拟: 收件人包含 --reject-pattern 时返回550, 每个连接发送 --max-messages 封后返回421并断开
+"""
+import argparse
+import asyncio
+import base64
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class SmtpStubServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        username: str = "",
+        password: str = "",
+        data_latency: float = 0.0,
+        reject_pattern: str = "",
+        max_messages_per_connection: int = 0,
+        keep_messages: int = 0,
+    ):
+        self.host = host
+        self.port = port  # 为0时由系统分配, 启动后更新为实际端口
+        self.username = username
+        self.password = password
+        self.data_latency = data_latency  # 每封邮件DATA结束后回复前的等待(模拟服务器处理耗时)
+        self.reject_pattern = reject_pattern
+        self.max_messages_per_connection = max_messages_per_connection
+        self.messages: Deque[Tuple[str, List[str], bytes]] = deque(maxlen=keep_messages or None)
+        self.keep_messages = keep_messages
+        self.stats: Dict[str, int] = {
+            "connections": 0,
+            "messages": 0,
+            "rejected": 0,
+            "auth_failed": 0,
+        }
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> "SmtpStubServer":
+        """在独立线程的事件循环中启动, 返回时已经开始监听"""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats["connections"] += 1
+        authenticated = not self.username
+        mail_from: Optional[str] = None
+        recipients: List[str] = []
+        sent = 0
+
+        def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+
+        reply("220 smtp-stub ESMTP ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+                command = command.upper()
+
+                if command in ("EHLO", "HELO"):
+                    mail_from, recipients = None, []
+                    if command == "HELO":
+                        reply("250 smtp-stub")
+                    else:
+                        reply("250-smtp-stub\r\n250-PIPELINING\r\n250-8BITMIME\r\n250-SIZE 10485760\r\n250 AUTH PLAIN LOGIN")
+                elif command == "AUTH":
+                    mechanism, _, initial = argument.partition(" ")
+                    if mechanism.upper() == "PLAIN":
+                        _, username, password = base64.b64decode(initial).decode().split("\0")
+                    else:
+                        reply("334 VXNlcm5hbWU6")
+                        await writer.drain()
+                        username = base64.b64decode((await reader.readline()).strip()).decode()
+                        reply("334 UGFzc3dvcmQ6")
+                        await writer.drain()
+                        password = base64.b64decode((await reader.readline()).strip()).decode()
+                    if (username, password) == (self.username, self.password):
+                        authenticated = True
+                        reply("235 2.7.0 Authentication successful")
+                    else:
+                        self.stats["auth_failed"] += 1
+                        reply("535 5.7.8 Authentication credentials invalid")
+                elif command == "MAIL":
+                    if not authenticated:
+                        reply("530 5.7.0 Authentication required")
+                    else:
+                        mail_from, recipients = argument[5:].strip("<>"), []
+                        reply("250 2.1.0 OK")
+                elif command == "RCPT":
+                    address = argument[3:].strip("<>")
+                    if mail_from is None:
+                        reply("503 5.5.1 Need MAIL command")
+                    elif self.reject_pattern and self.reject_pattern in address:
+                        self.stats["rejected"] += 1
+                        reply("550 5.1.1 Mailbox unavailable")
+                    else:
+                        recipients.append(address)
+                        reply("250 2.1.5 OK")
+                elif command == "DATA":
+                    if not recipients:
+                        reply("554 5.5.1 No valid recipients")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line == b".\r\n":
+                            break
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    if self.data_latency:
+                        await asyncio.sleep(self.data_latency)
+                    self.stats["messages"] += 1
+                    if self.keep_messages:
+                        self.messages.append((mail_from or "", recipients, b"".join(lines)))
+                    mail_from, recipients = None, []
+                    sent += 1
+                    reply("250 2.0.0 OK queued")
+                    if self.max_messages_per_connection and sent >= self.max_messages_per_connection:
+                        reply("421 4.7.0 Too many messages on this connection")
+                        await writer.drain()
+                        break
+                elif command == "RSET":
+                    mail_from, recipients = None, []
+                    reply("250 2.0.0 OK")
+                elif command == "NOOP":
+                    reply("250 2.0.0 OK")
+                elif command == "QUIT":
+                    reply("221 2.0.0 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 5.5.2 Command not implemented")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地SMTP替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--username", default="", help="要求登录的用户名(为空表示不需要登录)")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--data-latency", type=float, default=0.0, help="每封邮件的处理耗时(秒)")
+    parser.add_argument("--reject-pattern", default="", help="收件人包含该字符串时拒收(550)")
+    parser.add_argument("--max-messages", type=int, default=0, help="单个连接最多接收的邮件数(0表示不限制)")
+    args = parser.parse_args()
+
+    server = SmtpStubServer(
+        args.host,
+        args.port,
+        username=args.username,
+        password=args.password,
+        data_latency=args.data_latency,
+        reject_pattern=args.reject_pattern,
+        max_messages_per_connection=args.max_messages,
+    ).start_in_thread()
+    print(f"SMTP替身服务器已启动: {server.host}:{server.port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"统计: {server.stats}")
+    except KeyboardInterrupt:
+        server.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
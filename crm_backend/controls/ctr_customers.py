@@ -1,15 +1,31 @@
-from datetime import timedelta
-from typing import List
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Depends, Query, Request
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import select
-from crm_backend.db.db import SessionDep
+from crm_backend.db.customer_tags import (
+    customer_ids_with_tags,
+    delete_customer_tags,
+    sync_customer_tags,
+)
+from crm_backend.db.customer_import import IMPORT_CHUNK_SIZE, upsert_customer_chunk
+from crm_backend.db.customer_search import apply_customer_search
+from crm_backend.db.db import AsyncSessionDep, SessionDep
+from crm_backend.db.row_counters import counter_statement
 from crm_backend.middleware.check_auth import check_auth_M
 from crm_backend.models.crm_http_exception import CrmHTTPException
 from crm_backend.models.customer import Customer, CustomerUpdateReq
-from crm_backend.models.response import CrmResponse
+from crm_backend.models.row_counter import COUNTER_CUSTOMERS, COUNTER_CUSTOMERS_BY_TAG
+from crm_backend.models.response import CrmResponse, fast_crm_response, rows_to_dicts
 from crm_backend.middleware.request_loger import request_logger_M
 from crm_backend.utils.jwt import jwt_encode
+from crm_backend.utils.export import ExportFormat, export_response
+from crm_backend.utils.import_stream import ImportFormat, iter_record_chunks
+from crm_backend.utils.pagination import page_result, paginate
+
 
+# 导入结果中最多返回的错误行数
+MAX_IMPORT_ERRORS = 1000
 
 customer_router = APIRouter(
     prefix="/customers",
@@ -32,42 +48,137 @@ def create_customer(request: Request, customer: Customer, session: SessionDep):
         )
     customer.created_by = request.state.user_id
     session.add(customer)
+    sync_customer_tags(session, customer)
     session.commit()
-    session.refresh(customer)
     return CrmResponse(data={"customer": customer}, msg="创建用户成功")
 
 
+# 批量导入客户(流式解析CSV/NDJSON请求体, 按名称/邮箱分块upsert)
+@customer_router.post("/import", response_model=CrmResponse)
+async def import_customers(
+    request: Request,
+    import_format: ImportFormat = Query("ndjson", alias="format", description="导入格式(ndjson/csv)"),
+):
+    inserted = updated = failed = 0
+    errors: List[Dict[str, Any]] = []
+    async for records in iter_record_chunks(
+        request.stream(), import_format, IMPORT_CHUNK_SIZE
+    ):
+        # 数据库写入在线程池中执行, 不阻塞事件循环
+        chunk_inserted, chunk_updated, chunk_errors = await run_in_threadpool(
+            upsert_customer_chunk, records, request.state.user_id
+        )
+        inserted += chunk_inserted
+        updated += chunk_updated
+        failed += len(chunk_errors)
+        errors.extend(chunk_errors[: MAX_IMPORT_ERRORS - len(errors)])
+
+    return CrmResponse(
+        data={
+            "inserted": inserted,
+            "updated": updated,
+            "failed": failed,
+            "errors": errors,
+            "errors_truncated": failed > len(errors),
+        },
+        msg=f"导入客户完成，新增 {inserted} 个，更新 {updated} 个，失败 {failed} 行",
+    )
+
+
 # 客户列表展示(支持分页,搜索,按标签筛选)
 @customer_router.get("/query", response_model=CrmResponse)
 @customer_router.post("/query", response_model=CrmResponse)
-def read_all_customers(
+async def read_all_customers(
     request: Request,
-    session: SessionDep,
+    session: AsyncSessionDep,
     offset: int = Query(0, ge=0, description="偏移量(从0开始)"),
     limit: int = Query(10, ge=1, le=100, description="每页数量(1-100)"),
     tags: List[str] = Query(default=[], description="标签筛选"),
+    cursor: Optional[str] = Query(
+        None,
+        description="分页游标(传入上一页返回的next_cursor, 传入后忽略offset, 不能与q同时使用)",
+    ),
+    q: Optional[str] = Query(
+        None,
+        max_length=100,
+        description="搜索关键字(按名称、邮箱、标签前缀匹配, 按相关度排序, 使用offset分页)",
+    ),
 ):
-    customers = session.exec(select(Customer).offset(offset).limit(limit)).all()
     if not request.state.is_admin:
         raise CrmHTTPException(
             status_code=403, detail="无权限查看其他客户信息，请联系管理员！"
         )
 
+    # 按列查询, 结果直接序列化返回, 不构造 Customer 对象
+    statement = select(*Customer.__table__.columns)  # type: ignore
     if tags:
-        customers = [
-            customer
-            for customer in customers
-            if set(tags).intersection(set(customer.tags))
-        ]
+        # 在数据库中按标签索引筛选, 保证分页是在筛选之后进行的
+        statement = statement.where(Customer.id.in_(customer_ids_with_tags(tags)))  # type: ignore
+
+    if q:
+        # 全文检索: 按相关度排序, 不支持游标分页
+        if cursor:
+            raise CrmHTTPException(status_code=400, detail="搜索时不支持游标分页, 请使用offset")
+        customers = (
+            await session.exec(apply_customer_search(statement, q).offset(offset).limit(limit))
+        ).all()
+        return fast_crm_response(rows_to_dicts(customers), msg="搜索客户成功")
+
+    # 总数直接读取行数计数器; 按多个标签筛选时同一客户可能命中多个标签, 计数相加不准确, 不返回总数
+    total = None
+    if not tags:
+        total = (await session.exec(counter_statement(COUNTER_CUSTOMERS))).one()
+    elif len(set(tags)) == 1:
+        total = (await session.exec(counter_statement(COUNTER_CUSTOMERS_BY_TAG, tags[0]))).one()
+
+    order_columns = (Customer.created_at, Customer.id)
+    customers, next_cursor = page_result(
+        (
+            await session.exec(
+                paginate(statement, order_columns, limit, offset=offset, cursor=cursor)
+            )
+        ).all(),
+        order_columns,
+        limit,
+    )
 
-    return CrmResponse(data=list(customers), msg="获取全部客户成功")
+    return fast_crm_response(
+        rows_to_dicts(customers),
+        msg="获取全部客户成功",
+        next_cursor=next_cursor,
+        total=total,
+    )
+
+
+# 客户导出(流式输出NDJSON/CSV, 支持按标签和创建时间筛选)
+@customer_router.get("/export")
+def export_customers(
+    request: Request,
+    export_format: ExportFormat = Query("ndjson", alias="format", description="导出格式(ndjson/csv)"),
+    tags: List[str] = Query(default=[], description="标签筛选"),
+    created_from: Optional[datetime] = Query(None, description="创建时间起(包含)"),
+    created_to: Optional[datetime] = Query(None, description="创建时间止(不包含)"),
+):
+    if not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限导出客户信息，请联系管理员！"
+        )
+
+    statement = select(*Customer.__table__.columns)  # type: ignore
+    if tags:
+        statement = statement.where(Customer.id.in_(customer_ids_with_tags(tags)))  # type: ignore
+    if created_from:
+        statement = statement.where(Customer.created_at >= created_from)
+    if created_to:
+        statement = statement.where(Customer.created_at < created_to)
+    return export_response(statement.order_by(Customer.id), export_format, "customers")  # type: ignore
 
 
 # 单个客户查询
 @customer_router.get("/query/{customer_id}", response_model=CrmResponse)
 @customer_router.post("/query/{customer_id}", response_model=CrmResponse)
-def read_customer(request: Request, customer_id: int, session: SessionDep):
-    find_customer = session.get(Customer, customer_id)
+async def read_customer(request: Request, customer_id: int, session: AsyncSessionDep):
+    find_customer = await session.get(Customer, customer_id)
     if not find_customer:
         raise CrmHTTPException(status_code=404, detail="客户未找到")
     if find_customer.created_by != request.state.user_id and not request.state.is_admin:
@@ -102,8 +213,8 @@ def update_customer(
         if need_update_key in old_customer.keys():
             new_customer[need_update_key] = need_update_customer[need_update_key]
     find_customer.sqlmodel_update(new_customer)
+    sync_customer_tags(session, find_customer)
     session.commit()
-    session.refresh(find_customer)
     return CrmResponse(data=find_customer.model_dump(), msg="更新单个客户成功")
 
 
@@ -117,6 +228,7 @@ def delete_customer(request: Request, customer_id: int, session: SessionDep):
         raise CrmHTTPException(
             status_code=403, detail="无权限修改其他客户信息，请联系管理员！"
         )
+    delete_customer_tags(session, customer_id)
     session.delete(find_customer)
     session.commit()
     return CrmResponse(data=find_customer.model_dump(), msg="删除客户成功")
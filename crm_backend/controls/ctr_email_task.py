@@ -1,18 +1,46 @@
-from fastapi import APIRouter, Depends, Query, Request
-from sqlmodel import select, text
-
-from crm_backend.db.db import SessionDep
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
+from sqlmodel import Session, select, text
+
+from crm_backend.db.customer_tags import customer_ids_with_tags
+from crm_backend.db.db import AsyncSessionDep, ReadSessionDep, SessionDep
+from crm_backend.db.email_content import (
+    email_task_list_statement,
+    email_task_rows_to_dicts,
+    get_or_create_email_content,
+)
+from crm_backend.db.email_task_batch import (
+    bulk_insert_email_tasks,
+    get_job_task_counts,
+    resolve_batch_recipients,
+    run_email_batch_job,
+)
+from crm_backend.db.email_task_stats import read_email_task_stats
+from crm_backend.db.row_counters import counter_statement, read_counter, read_counters_by_key
 from crm_backend.middleware.check_auth import check_auth_M
 from crm_backend.middleware.request_loger import request_logger_M
 from crm_backend.models.crm_http_exception import CrmHTTPException
 from crm_backend.models.customer import Customer
+from crm_backend.models.email_batch_job import EmailBatchJob
+from crm_backend.models.email_content import EmailContent
 from crm_backend.models.email_task import (
     BatchEmailTaskRequest,
+    Email,
     EmailTask,
     EmailTaskUpdateReq,
 )
-from crm_backend.models.response import CrmResponse
+from crm_backend.models.email_task_stat import (
+    STAT_BY_NAME,
+    STAT_BY_SENDED_HOUR,
+    STAT_BY_SENDER,
+)
+from crm_backend.models.response import CrmResponse, fast_crm_response
+from crm_backend.models.row_counter import COUNTER_CUSTOMERS, COUNTER_TASKS_BY_STATUS
 from crm_backend.utils.email_task_execer import EmailTaskExecer
+from crm_backend.utils.email_template import TemplateError, compile_email
+from crm_backend.utils.export import ExportFormat, export_response
+from crm_backend.utils.pagination import page_result, paginate
 
 
 email_router = APIRouter(
@@ -22,6 +50,31 @@ email_router = APIRouter(
 email_task_execer = EmailTaskExecer()  # 实例化任务执行器
 
 
+def check_email_template(email: Email):
+    """邮件内容为模板时, 在创建任务前校验语法(编译结果进入缓存, 发送时不再重新解析)"""
+    if not email.use_template:
+        return
+    try:
+        compile_email(email.subject, email.body)
+    except TemplateError as e:
+        raise CrmHTTPException(status_code=400, detail=f"邮件模板错误: {e}")
+
+
+def resolve_email_content(session: Session, email: Optional[Email], content_id: Optional[int]) -> int:
+    """
+    确定任务引用的邮件内容: 传入邮件内容时按哈希去重保存(校验模板), 否则引用已有的内容ID
+    :return: 邮件内容ID
+    """
+    if email is not None:
+        check_email_template(email)
+        return get_or_create_email_content(session, email)
+    if content_id is None:
+        raise CrmHTTPException(status_code=400, detail="请指定邮件内容(email)或已有的邮件内容ID(content_id)")
+    if session.get(EmailContent, content_id) is None:
+        raise CrmHTTPException(status_code=404, detail="邮件内容不存在")
+    return content_id
+
+
 # 创建邮件任务
 @email_router.post("/add", response_model=CrmResponse)
 def create_email_task(request: Request, email_task: EmailTask, session: SessionDep):
@@ -33,12 +86,15 @@ def create_email_task(request: Request, email_task: EmailTask, session: SessionD
         raise CrmHTTPException(status_code=404, detail="客户不存在")
     if find_customer.is_blacklist:
         raise CrmHTTPException(status_code=403, detail="客户在黑名单中，跳过邮件发送")
+    email_task.content_id = resolve_email_content(
+        session, Email(**email_task.email) if email_task.email else None, email_task.content_id
+    )
+    email_task.email = None  # 内容只保存在内容表中
 
     email_task.send_by = request.state.user_email
     email_task.send_to = find_customer.email
     session.add(email_task)
     session.commit()
-    session.refresh(email_task)
     email_task_execer.add_task(email_task)  # 添加任务到执行器并开始排队等待执行
     return CrmResponse(data={"email_task": email_task}, msg="邮件任务创建成功")
 
@@ -48,154 +104,76 @@ def create_email_task(request: Request, email_task: EmailTask, session: SessionD
 def create_batch_email_tasks(
     request: Request, batch_request: BatchEmailTaskRequest, session: SessionDep
 ):
-    created_tasks = []
     skipped_emails = []
-    processed_emails = set()  # 用于去重
+    content_id = resolve_email_content(session, batch_request.email, batch_request.content_id)
 
     try:
-        # 1. 按标签获取客户 - 使用简化的查询方法
-        customers_by_tags = []
-        if batch_request.send_customer_by_tags:
-            print(f"开始按标签查询客户: {batch_request.send_customer_by_tags}")
-
-            # 首先获取所有客户，然后在Python中过滤
-            print("使用Python过滤方法查询标签客户...")
-            all_customers_for_tags = session.exec(select(Customer)).all()
-            print(f"数据库中总共有 {len(all_customers_for_tags)} 个客户")
-
-            for tag in batch_request.send_customer_by_tags:
-                print(f"正在查找标签: '{tag}'")
-                tag_customers = []
-
-                for customer in all_customers_for_tags:
-                    if customer.tags:
-                        # 检查标签是否匹配
-                        if isinstance(customer.tags, list):
-                            if tag in customer.tags:
-                                tag_customers.append(customer)
-                                print(f"  ✅ 客户 {customer.email} 匹配标签 '{tag}'")
-                        elif isinstance(customer.tags, str):
-                            # 尝试解析JSON字符串
-                            try:
-                                import json
-
-                                tags_list = json.loads(customer.tags)
-                                if isinstance(tags_list, list) and tag in tags_list:
-                                    tag_customers.append(customer)
-                                    print(
-                                        f"  ✅ 客户 {customer.email} 匹配标签 '{tag}' (JSON解析)"
-                                    )
-                            except json.JSONDecodeError:
-                                # 如果不是JSON，尝试字符串包含
-                                if tag in customer.tags:
-                                    tag_customers.append(customer)
-                                    print(
-                                        f"  ✅ 客户 {customer.email} 匹配标签 '{tag}' (字符串包含)"
-                                    )
-                            except Exception as e:
-                                print(
-                                    f"  ❌ 解析客户 {customer.email} 的标签时出错: {e}"
-                                )
-                        else:
-                            print(
-                                f"  ⚠️ 客户 {customer.email} 的标签格式未知: {type(customer.tags)}"
-                            )
-                    else:
-                        print(f"  ❌ 客户 {customer.email} 没有标签")
-
-                print(f"标签 '{tag}' 找到 {len(tag_customers)} 个客户")
-                customers_by_tags.extend(tag_customers)
-
-        # 2. 按邮箱获取客户
-        customers_by_emails = []
-        if batch_request.send_customer_by_emails:
-            try:
-                customers = session.exec(
-                    select(Customer).where(
-                        Customer.email.in_(batch_request.send_customer_by_emails)  # type: ignore
-                    )
-                ).all()
-                customers_by_emails.extend(customers)
-                print(f"按邮箱查询找到 {len(customers_by_emails)} 个客户")
-            except Exception as e:
-                print(f"按邮箱查询客户时出错: {e}")
-                raise CrmHTTPException(
-                    status_code=500, detail=f"查询客户信息失败: {str(e)}"
-                )
-
-        # 3. 合并所有客户并去重（基于邮箱地址）
-        all_customers = []
-        for customer in customers_by_tags + customers_by_emails:
-            if customer.email not in processed_emails:
-                all_customers.append(customer)
-                processed_emails.add(customer.email)
+        # 1. 按标签和邮箱查出客户(只查邮箱和黑名单两列), 并按邮箱去重
+        recipients, customers_by_tags, customers_by_emails = resolve_batch_recipients(
+            session,
+            batch_request.send_customer_by_tags or [],
+            batch_request.send_customer_by_emails or [],
+        )
 
-        print(f"标签查询找到: {len(customers_by_tags)} 个客户")
-        print(f"邮箱查询找到: {len(customers_by_emails)} 个客户")
-        print(f"去重后总共: {len(all_customers)} 个客户")
+        print(f"标签查询找到: {customers_by_tags} 个客户")
+        print(f"邮箱查询找到: {customers_by_emails} 个客户")
+        print(f"去重后总共: {len(recipients)} 个客户")
 
-        if not all_customers:
+        if not recipients:
             # 提供更详细的错误信息
             error_msg = f"未找到符合条件的客户。"
             if batch_request.send_customer_by_tags:
                 error_msg += f" 请求的标签: {batch_request.send_customer_by_tags}"
             if batch_request.send_customer_by_emails:
                 error_msg += f" 请求的邮箱: {batch_request.send_customer_by_emails}"
-            error_msg += (
-                f" 数据库中总共有 {len(session.exec(select(Customer)).all())} 个客户。"
-            )
+            error_msg += f" 数据库中总共有 {read_counter(session, COUNTER_CUSTOMERS)} 个客户。"
 
             raise CrmHTTPException(status_code=404, detail=error_msg)
 
-        # 4. 为每个客户创建邮件任务
-        for customer in all_customers:
-            # 检查客户是否在黑名单中
-            if customer.is_blacklist:
-                skipped_emails.append(
-                    {"email": customer.email, "reason": "客户在黑名单中"}
-                )
-                continue
-
-            # 创建邮件任务，将 Email 对象转换为字典
-            email_task = EmailTask(
-                name=batch_request.name,
-                email=batch_request.email.dict(),
-                send_by=request.state.user_email,
-                send_to=customer.email,
-                status="待处理",
-            )
-
-            session.add(email_task)
-            created_tasks.append(email_task)
-
-        # 5. 提交所有任务
-        session.commit()
+        # 2. 跳过黑名单客户
+        send_to_list = []
+        for email, is_blacklist in recipients:
+            if is_blacklist:
+                skipped_emails.append({"email": email, "reason": "客户在黑名单中"})
+            else:
+                send_to_list.append(email)
+
+        # 3. 分块批量插入邮件任务, 由 RETURNING 直接拿到任务ID
+        task_ids = bulk_insert_email_tasks(
+            session,
+            name=batch_request.name,
+            content_id=content_id,
+            send_by=request.state.user_email,
+            send_to_list=send_to_list,
+        )
+        total_customers_in_db = read_counter(session, COUNTER_CUSTOMERS)
+        session.commit()  # 提交后不再使用会话, 写连接立即归还
 
-        # 6. 刷新所有任务以获取ID
-        for task in created_tasks:
-            session.refresh(task)
-            # 添加到任务执行器
-            email_task_execer.add_task(task)
+        # 4. 一次性把新任务的ID范围交给任务执行器
+        if task_ids:
+            email_task_execer.add_task_range(task_ids[0], task_ids[-1])
 
-        # 7. 返回结果
+        # 5. 返回结果(只返回任务ID范围, 不再序列化每一个任务)
         result = {
-            "created_tasks": [task.model_dump() for task in created_tasks],
-            "total_created": len(created_tasks),
+            "first_task_id": task_ids[0] if task_ids else None,
+            "last_task_id": task_ids[-1] if task_ids else None,
+            "content_id": content_id,
+            "total_created": len(task_ids),
             "skipped_emails": skipped_emails,
             "total_skipped": len(skipped_emails),
-            "total_customers_found": len(all_customers),
+            "total_customers_found": len(recipients),
             "debug_info": {
-                "customers_by_tags": len(customers_by_tags),
-                "customers_by_emails": len(customers_by_emails),
+                "customers_by_tags": customers_by_tags,
+                "customers_by_emails": customers_by_emails,
                 "tags_requested": batch_request.send_customer_by_tags,
                 "emails_requested": batch_request.send_customer_by_emails,
-                "total_customers_in_db": len(session.exec(select(Customer)).all()),
+                "total_customers_in_db": total_customers_in_db,
             },
         }
 
-        return CrmResponse(
-            data=result,
-            msg=f"批量创建邮件任务成功，共创建 {len(created_tasks)} 个任务，跳过 {len(skipped_emails)} 个黑名单客户",
+        return fast_crm_response(
+            result,
+            msg=f"批量创建邮件任务成功，共创建 {len(task_ids)} 个任务，跳过 {len(skipped_emails)} 个黑名单客户",
         )
 
     except CrmHTTPException:
@@ -209,35 +187,179 @@ def create_batch_email_tasks(
         )
 
 
+# 创建邮件任务(异步批量添加): 立即返回作业ID, 收件人在后台分块展开
+@email_router.post("/batch_add_async", response_model=CrmResponse)
+def create_batch_email_job(
+    request: Request,
+    batch_request: BatchEmailTaskRequest,
+    background_tasks: BackgroundTasks,
+    session: SessionDep,
+):
+    if not batch_request.send_customer_by_tags and not batch_request.send_customer_by_emails:
+        raise CrmHTTPException(status_code=400, detail="请至少指定客户标签或客户邮箱")
+    content_id = resolve_email_content(session, batch_request.email, batch_request.content_id)
+
+    # 作业在本进程后台执行, 由本进程的执行器续期租约
+    job = EmailBatchJob(
+        name=batch_request.name,
+        created_by=request.state.user_email,
+        lease_owner=email_task_execer.lease_owner,
+        lease_expires_at=datetime.utcnow() + timedelta(seconds=email_task_execer.lease_seconds),
+    )
+    session.add(job)
+    session.commit()
+
+    background_tasks.add_task(
+        run_email_batch_job,
+        job.id,  # type: ignore
+        batch_request.send_customer_by_tags or [],
+        batch_request.send_customer_by_emails or [],
+        content_id,
+        email_task_execer.add_task_range,
+    )
+    return fast_crm_response({"job_id": job.id, "content_id": content_id}, msg="批量作业已创建，正在后台处理")
+
+
+# 查询异步批量作业进度(已创建、黑名单跳过、排队中、已发送、发送失败)
+@email_router.get("/batch_jobs/{job_id}", response_model=CrmResponse)
+@email_router.post("/batch_jobs/{job_id}", response_model=CrmResponse)
+def read_batch_email_job(request: Request, job_id: int, session: ReadSessionDep):
+    job = session.get(EmailBatchJob, job_id)
+    if not job:
+        raise CrmHTTPException(status_code=404, detail="批量作业不存在")
+    if job.created_by != request.state.user_email and not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限查看此批量作业，请联系管理员！"
+        )
+    return fast_crm_response(
+        {**job.model_dump(), **get_job_task_counts(session, job_id)},
+        msg="查询批量作业成功",
+    )
+
+
+# 邮件推广看板: 按状态、推广任务名称、发送人、发送时间(小时)统计任务数量
+# 统计由触发器随任务状态变化增量维护, 这里只读取统计表, 频繁刷新也不会扫描邮件任务表
+@email_router.get("/dashboard", response_model=CrmResponse)
+@email_router.post("/dashboard", response_model=CrmResponse)
+def read_email_dashboard(
+    request: Request,
+    session: ReadSessionDep,
+    hours: int = Query(24, ge=1, le=24 * 31, description="按小时统计最近多少小时(UTC)的发送结果"),
+    name: Optional[str] = Query(None, description="只统计该推广任务名称"),
+):
+    if not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限查看邮件推广看板，请联系管理员！"
+        )
+    hour_from = (datetime.utcnow() - timedelta(hours=hours - 1)).strftime("%Y-%m-%d %H:00")
+    return fast_crm_response(
+        {
+            "by_status": read_counters_by_key(session, COUNTER_TASKS_BY_STATUS),
+            "by_name": read_email_task_stats(session, STAT_BY_NAME, key=name),
+            "by_send_by": read_email_task_stats(session, STAT_BY_SENDER),
+            "by_sended_hour": read_email_task_stats(
+                session, STAT_BY_SENDED_HOUR, key_from=hour_from
+            ),
+        },
+        msg="查询邮件推广看板成功",
+    )
+
+
 # 读取全部邮件任务
 @email_router.get("/query", response_model=CrmResponse)
 @email_router.post("/query", response_model=CrmResponse)
-def read_all_email_tasks(
+async def read_all_email_tasks(
     request: Request,
-    session: SessionDep,
+    session: AsyncSessionDep,
     offset: int = Query(0, ge=0, description="偏移量(从0开始)"),
     limit: int = Query(10, ge=1, le=100, description="每页数量(1-100)"),
+    cursor: Optional[str] = Query(
+        None, description="分页游标(传入上一页返回的next_cursor, 传入后忽略offset)"
+    ),
+    include_content: bool = Query(
+        False, description="是否返回邮件内容(主题和正文), 默认只返回 content_id"
+    ),
 ):
-    email_tasks = session.exec(select(EmailTask).offset(offset).limit(limit)).all()
     if not request.state.is_admin:
         raise CrmHTTPException(
             status_code=403, detail="无权限查看其他邮件任务，请联系管理员！"
         )
-    return CrmResponse(data=list(email_tasks), msg="查询邮件任务成功")
+    order_columns = (EmailTask.created_at, EmailTask.id)
+    email_tasks, next_cursor = page_result(
+        (
+            await session.exec(
+                paginate(
+                    email_task_list_statement(include_content),
+                    order_columns,
+                    limit,
+                    offset=offset,
+                    cursor=cursor,
+                )
+            )
+        ).all(),
+        order_columns,
+        limit,
+    )
+    # 邮件任务总数为各状态计数之和
+    total = (await session.exec(counter_statement(COUNTER_TASKS_BY_STATUS))).one()
+    return fast_crm_response(
+        email_task_rows_to_dicts(email_tasks, include_content),
+        msg="查询邮件任务成功",
+        next_cursor=next_cursor,
+        total=total,
+    )
+
+
+# 邮件任务导出(流式输出NDJSON/CSV, 支持按状态、收件客户标签和创建时间筛选)
+@email_router.get("/export")
+def export_email_tasks(
+    request: Request,
+    export_format: ExportFormat = Query("ndjson", alias="format", description="导出格式(ndjson/csv)"),
+    status: List[str] = Query(default=[], description="任务状态筛选"),
+    tags: List[str] = Query(default=[], description="按收件客户的标签筛选"),
+    created_from: Optional[datetime] = Query(None, description="创建时间起(包含)"),
+    created_to: Optional[datetime] = Query(None, description="创建时间止(不包含)"),
+):
+    if not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限导出邮件任务，请联系管理员！"
+        )
+
+    statement = select(*EmailTask.__table__.columns)  # type: ignore
+    if status:
+        statement = statement.where(EmailTask.status.in_(status))  # type: ignore
+    if tags:
+        statement = statement.where(
+            EmailTask.send_to.in_(  # type: ignore
+                select(Customer.email).where(
+                    Customer.id.in_(customer_ids_with_tags(tags))  # type: ignore
+                )
+            )
+        )
+    if created_from:
+        statement = statement.where(EmailTask.created_at >= created_from)
+    if created_to:
+        statement = statement.where(EmailTask.created_at < created_to)
+    return export_response(statement.order_by(EmailTask.id), export_format, "email_tasks")  # type: ignore
 
 
 # 单个邮件任务查询
 @email_router.get("/query/{task_id}", response_model=CrmResponse)
 @email_router.post("/query/{task_id}", response_model=CrmResponse)
-def read_email_task(request: Request, task_id: int, session: SessionDep):
-    find_email_task = session.get(EmailTask, task_id)
+async def read_email_task(request: Request, task_id: int, session: AsyncSessionDep):
+    find_email_task = await session.get(EmailTask, task_id)
     if not find_email_task:
         raise CrmHTTPException(status_code=404, detail="邮件任务不存在")
     if find_email_task.send_by != request.state.user_id and not request.state.is_admin:
         raise CrmHTTPException(
             status_code=403, detail="无权限查看此邮件任务，请联系管理员！"
         )
-    return CrmResponse(data=find_email_task.model_dump(), msg="查询邮件任务成功")
+    email_task = find_email_task.model_dump()
+    if find_email_task.content_id is not None:
+        content = await session.get(EmailContent, find_email_task.content_id)
+        if content is not None:
+            email_task["email"] = content.to_email().dict()
+    return CrmResponse(data=email_task, msg="查询邮件任务成功")
 
 
 # 更新邮件任务状态
@@ -263,9 +385,14 @@ def update_email_task(
     for need_update_key in email_task_update_req.update_key:
         if need_update_key in old_email_task.keys():
             new_email_task[need_update_key] = need_update_email_task[need_update_key]
+    if "email" in email_task_update_req.update_key and email_task_update_req.update_EmailTask.email:
+        # 修改邮件内容时改为引用新的内容(按哈希去重), 不改动其他任务共用的内容
+        new_email_task["content_id"] = resolve_email_content(
+            session, email_task_update_req.update_EmailTask.email, None
+        )
+        new_email_task["email"] = None
     find_email_task.sqlmodel_update(new_email_task)
     session.commit()
-    session.refresh(find_email_task)
 
     return CrmResponse(data=find_email_task.model_dump(), msg="更新单个邮件任务成功")
 
@@ -285,3 +412,13 @@ def delete_email_task(request: Request, task_id: int, session: SessionDep):
     session.delete(find_email_task)
     session.commit()
     return CrmResponse(data=find_email_task.model_dump(), msg="删除邮件任务成功")
+
+
+# 邮件任务执行器状态(worker数量、队列长度、发送吞吐量)
+@email_router.get("/executor/stats", response_model=CrmResponse)
+def read_executor_stats(request: Request):
+    if not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限查看邮件任务执行器状态，请联系管理员！"
+        )
+    return CrmResponse(data=email_task_execer.get_stats(), msg="查询执行器状态成功")
@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from crm_backend.controls.ctr_email_task import email_task_execer
+from crm_backend.db.email_content import load_email_content
+from crm_backend.utils.email_template import template_cache
+from crm_backend.utils.metrics import render_gauges, request_metrics
+from crm_backend.utils.security import passwd_hash_pool
+from crm_backend.utils.token_cache import token_cache
+
+
+metrics_router = APIRouter()
+
+
+# Prometheus 指标(请求耗时直方图、状态码、并发数, 以及邮件执行器、token缓存、邮件模板缓存、邮件内容缓存、密码哈希线程池的统计)
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    lines = request_metrics.render()
+    lines += render_gauges(
+        "crm_email_executor", "邮件任务执行器状态", email_task_execer.get_stats().items()
+    )
+    lines += render_gauges("crm_token_cache", "已验证token缓存统计", token_cache.stats().items())
+    lines += render_gauges(
+        "crm_email_template_cache", "邮件模板编译缓存统计", template_cache.stats().items()
+    )
+    content_cache = load_email_content.cache_info()
+    lines += render_gauges(
+        "crm_email_content_cache",
+        "邮件内容缓存统计",
+        [("size", content_cache.currsize), ("hits", content_cache.hits), ("misses", content_cache.misses)],
+    )
+    lines += render_gauges(
+        "crm_passwd_hash_pool", "密码哈希线程池统计", passwd_hash_pool.stats().items()
+    )
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
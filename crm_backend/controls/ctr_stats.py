@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Request
+
+from crm_backend.db.db import ReadSessionDep
+from crm_backend.db.row_counters import read_counter, read_counters_by_key
+from crm_backend.middleware.check_auth import check_auth_M
+from crm_backend.middleware.request_loger import request_logger_M
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.models.response import CrmResponse, fast_crm_response
+from crm_backend.models.row_counter import (
+    COUNTER_CUSTOMERS,
+    COUNTER_CUSTOMERS_BY_TAG,
+    COUNTER_TASKS_BY_SENDER,
+    COUNTER_TASKS_BY_STATUS,
+    COUNTER_USERS,
+)
+
+
+stats_router = APIRouter(
+    prefix="/stats",
+    dependencies=[Depends(request_logger_M), Depends(check_auth_M)],
+)
+
+
+# 数据统计(客户数、每个标签的客户数、用户数、各状态和各发送人的邮件任务数), 全部读取行数计数器
+@stats_router.get("/counts", response_model=CrmResponse)
+@stats_router.post("/counts", response_model=CrmResponse)
+def read_counts(request: Request, session: ReadSessionDep):
+    if not request.state.is_admin:
+        raise CrmHTTPException(
+            status_code=403, detail="无权限查看统计数据，请联系管理员！"
+        )
+    return fast_crm_response(
+        {
+            "customers": read_counter(session, COUNTER_CUSTOMERS),
+            "customers_by_tag": read_counters_by_key(session, COUNTER_CUSTOMERS_BY_TAG),
+            "users": read_counter(session, COUNTER_USERS),
+            "email_tasks": read_counter(session, COUNTER_TASKS_BY_STATUS),
+            "email_tasks_by_status": read_counters_by_key(session, COUNTER_TASKS_BY_STATUS),
+            "email_tasks_by_sender": read_counters_by_key(session, COUNTER_TASKS_BY_SENDER),
+        },
+        msg="查询统计数据成功",
+    )
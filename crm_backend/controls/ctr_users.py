@@ -1,15 +1,19 @@
 from datetime import timedelta
-from typing import Annotated
+from typing import Annotated, Optional
 from sqlmodel import select
 from fastapi import APIRouter, Depends, Query, Request
-from crm_backend.db.db import SessionDep
+from crm_backend.db.db import ReadSessionDep, SessionDep
+from crm_backend.db.row_counters import read_counter
 from crm_backend.middleware.check_auth import check_auth_M
 from crm_backend.middleware.request_loger import request_logger_M
 from crm_backend.models.crm_http_exception import CrmHTTPException
-from crm_backend.models.response import CrmResponse
+from crm_backend.models.response import CrmResponse, fast_crm_response, rows_to_dicts
+from crm_backend.models.row_counter import COUNTER_USERS
 from crm_backend.models.user import User, UserUpdateReq
-from crm_backend.utils.jwt import jwt_decode, jwt_encode
-from crm_backend.utils.security import get_passwd_hash, verify_passwd
+from crm_backend.utils.jwt import jwt_encode
+from crm_backend.utils.pagination import page_result, paginate
+from crm_backend.utils.security import get_passwd_hash_bounded, verify_passwd_async
+from crm_backend.utils.token_cache import token_cache
 
 
 user_router = APIRouter(prefix="/users", dependencies=[Depends(request_logger_M)])
@@ -17,28 +21,24 @@ user_router = APIRouter(prefix="/users", dependencies=[Depends(request_logger_M)
 
 @user_router.post("/add", response_model=CrmResponse)
 def create_user(user: User, session: SessionDep):
+    # 先计算密码哈希再访问数据库, 避免在占用写连接期间执行bcrypt
+    passwd_hash = get_passwd_hash_bounded(user.passwd)
     find_user = session.exec(select(User).where(user.name == User.name)).first()
     if find_user:
         raise CrmHTTPException(
             status_code=403, detail="相同用户名称已存在, 请更换用户名!"
         )
-    user.passwd = get_passwd_hash(user.passwd)
+    user.passwd = passwd_hash
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
-
-    find_user = session.exec(select(User).where(user.name == User.name)).first()
-
-    if not find_user:
-        raise CrmHTTPException(status_code=404, detail="用户不存在!")
+    session.commit()  # 提交后 user.id 已经生成, 不需要再查询一次
 
     token = jwt_encode(
         {
-            "user_id": find_user.id,
-            "user_email": find_user.email,
-            "username": find_user.name,
-            "is_admin": find_user.is_admin,
+            "user_id": user.id,
+            "user_email": user.email,
+            "username": user.name,
+            "is_admin": user.is_admin,
         },
         timedelta(days=1),
     )
@@ -54,22 +54,43 @@ def create_user(user: User, session: SessionDep):
 )
 def read_all_users(
     request: Request,
-    session: SessionDep,
+    session: ReadSessionDep,
     offset: int = Query(0, ge=0, description="偏移量（从0开始）"),
     limit: int = Query(10, ge=1, le=100, description="每页数量（1-100）"),
+    cursor: Optional[str] = Query(
+        None, description="分页游标（传入上一页返回的next_cursor, 传入后忽略offset）"
+    ),
 ):
     if not request.state.is_admin:
         raise CrmHTTPException(
             status_code=403, detail="无权限修改其他用户信息，请联系管理员！"
         )
-    users = session.exec(select(User).offset(offset).limit(limit)).all()
-    return CrmResponse(data=list(users), msg="获取全部用户成功")
+    order_columns = (User.created_at, User.id)
+    users, next_cursor = page_result(
+        session.exec(
+            paginate(
+                select(*User.__table__.columns),  # type: ignore
+                order_columns,
+                limit,
+                offset=offset,
+                cursor=cursor,
+            )
+        ).all(),
+        order_columns,
+        limit,
+    )
+    return fast_crm_response(
+        rows_to_dicts(users),
+        msg="获取全部用户成功",
+        next_cursor=next_cursor,
+        total=read_counter(session, COUNTER_USERS),
+    )
 
 
 # 读取单个用户
 @user_router.get("/query/{user_id}", response_model=CrmResponse)
 @user_router.post("/query/{user_id}", response_model=CrmResponse)
-def read_user(request: Request, user_id: int, session: SessionDep):
+def read_user(request: Request, user_id: int, session: ReadSessionDep):
     find_user = session.get(User, user_id)
     if not find_user:
         raise CrmHTTPException(status_code=404, detail="用户不存在")
@@ -89,20 +110,34 @@ def read_user(request: Request, user_id: int, session: SessionDep):
     dependencies=[Depends(check_auth_M)],
 )
 def update_user(
-    request: Request, user_id: int, user_update_req: UserUpdateReq, session: SessionDep
+    request: Request,
+    user_id: int,
+    user_update_req: UserUpdateReq,
+    session: SessionDep,
+    read_session: ReadSessionDep,
 ):
-    find_user = session.get(User, user_id)
     need_update_user = user_update_req.update_user.model_dump()
     if not need_update_user:
         raise CrmHTTPException(status_code=404, detail="用户新数据未找到！")
-    if not find_user:
+    # 先在只读会话上检查用户是否存在和权限, 无权限的请求不会占用bcrypt名额
+    if read_session.get(User, user_id) is None:
         raise CrmHTTPException(status_code=404, detail="用户旧数据未找到！")
-
-    if find_user.id != request.state.user_id and not request.state.is_admin:
+    if user_id != request.state.user_id and not request.state.is_admin:
         raise CrmHTTPException(
             status_code=403, detail="无权限修改其他用户信息，请联系管理员！"
         )
 
+    # 只有修改了密码时才重新计算哈希, 否则会把已有的哈希值再哈希一次;
+    # 哈希在访问写连接之前计算, 避免在占用写连接期间执行bcrypt
+    passwd_hash = None
+    if "passwd" in user_update_req.update_key:
+        if not need_update_user.get("passwd"):
+            raise CrmHTTPException(status_code=400, detail="新密码不能为空")
+        passwd_hash = get_passwd_hash_bounded(need_update_user["passwd"])
+    find_user = session.get(User, user_id)
+    if not find_user:
+        raise CrmHTTPException(status_code=404, detail="用户旧数据未找到！")
+
     old_user = find_user.model_dump()
     new_user = old_user
     for need_update_key in user_update_req.update_key:
@@ -110,10 +145,11 @@ def update_user(
         if need_update_key in old_user.keys():
             new_user[need_update_key] = need_update_user[need_update_key]
 
-    new_user["passwd"] = get_passwd_hash(new_user["passwd"])
+    if passwd_hash is not None:
+        new_user["passwd"] = passwd_hash
     find_user.sqlmodel_update(new_user)
     session.commit()
-    session.refresh(find_user)
+    token_cache.revoke_user(user_id)  # 用户信息变化后, 之前签发的token(其中的权限等数据)不再有效
     return CrmResponse(data=find_user.model_dump(), msg="更新单个用户成功")
 
 
@@ -133,17 +169,20 @@ def delete_user(request: Request, user_id: int, session: SessionDep):
         )
     session.delete(find_user)
     session.commit()
+    token_cache.revoke_user(user_id)
     return CrmResponse(data=find_user.model_dump(), msg="删除用户成功")
 
 
 # 登录功能
 @user_router.post("/login", response_model=CrmResponse)
-async def login(user: User, session: SessionDep):
+async def login(user: User, session: ReadSessionDep):
     find_user = session.exec(select(User).where(User.name == user.name)).first()
     if not find_user:
         raise CrmHTTPException(status_code=400, detail="用户或密码错误")
-    if not verify_passwd(user.passwd, find_user.passwd):
+    if not await verify_passwd_async(user.passwd, find_user.passwd):
         raise CrmHTTPException(status_code=400, detail="用户或密码错误")
+    if not find_user.is_active:
+        raise CrmHTTPException(status_code=403, detail="用户已被禁用")
 
     token = jwt_encode(
         {
@@ -159,8 +198,8 @@ async def login(user: User, session: SessionDep):
 
 
 @user_router.post("/login/{token}", response_model=CrmResponse)
-async def token_login(token: str, session: SessionDep):
-    is_valid, decode_data = jwt_decode(token)
+async def token_login(token: str, session: ReadSessionDep):
+    is_valid, decode_data = token_cache.decode(token)
     if not decode_data:
         raise CrmHTTPException(status_code=400, detail="授权token不合法, 拒绝访问!!!")
 
@@ -0,0 +1,168 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, or_, select
+
+from crm_backend.db.customer_tags import normalize_tags, replace_tags_bulk
+from crm_backend.db.db import engine
+from crm_backend.models.customer import Customer, CustomerImportRow
+
+
+# 导入时每个事务处理的行数
+IMPORT_CHUNK_SIZE = 1000
+
+# (行号, 解析后的数据或解析错误信息)
+ImportRecord = Tuple[int, Dict[str, Any] | str]
+
+
+# (行号, 待插入或更新的列值; 带 "id" 的是更新)
+PendingWrite = Tuple[int, Dict[str, Any]]
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def _write_pending(session: Session, pending: List[PendingWrite]) -> None:
+    to_insert = [values for _, values in pending if "id" not in values]
+    to_update = [values for _, values in pending if "id" in values]
+    tags_by_customer: Dict[int, Any] = {}
+    if to_insert:
+        inserted_ids = session.exec(
+            insert(Customer).returning(Customer.id, sort_by_parameter_order=True),  # type: ignore
+            params=to_insert,
+        ).scalars()
+        for customer_id, values in zip(inserted_ids, to_insert):
+            tags_by_customer[customer_id] = values["tags"]
+    if to_update:
+        session.exec(update(Customer), params=to_update)  # type: ignore
+        for values in to_update:
+            tags_by_customer[values["id"]] = values["tags"]
+    replace_tags_bulk(session, tags_by_customer)
+
+
+def _commit_pending(
+    session: Session, pending: List[PendingWrite], errors: List[Dict[str, Any]]
+) -> Tuple[int, int]:
+    """
+    写入并提交; 违反唯一约束时(例如与并发写入的客户冲突)回滚后对半重试,
+    只把真正冲突的行记为错误, 其余行照常写入
+    :return: (插入数量, 更新数量)
+    """
+    if not pending:
+        return 0, 0
+    try:
+        _write_pending(session, pending)
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        if len(pending) == 1:
+            errors.append({"row": pending[0][0], "error": f"写入失败: {e.orig}"})
+            return 0, 0
+        middle = len(pending) // 2
+        first = _commit_pending(session, pending[:middle], errors)
+        second = _commit_pending(session, pending[middle:], errors)
+        return first[0] + second[0], first[1] + second[1]
+    updated = sum(1 for _, values in pending if "id" in values)
+    return len(pending) - updated, updated
+
+
+def upsert_customer_chunk(
+    records: List[ImportRecord], created_by: int
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """
+    校验并写入一块客户数据, 正常情况下整块在一个事务中提交:
+    按邮箱或名称匹配已有客户则更新, 否则插入; 两者分别匹配到不同客户时记为错误
+    :return: (插入数量, 更新数量, 每行错误 [{"row": 行号, "error": 原因}])
+    """
+    errors: List[Dict[str, Any]] = []
+    rows: Dict[str, Tuple[int, CustomerImportRow]] = {}  # 邮箱 -> (行号, 数据)
+    for row_number, record in records:
+        if isinstance(record, str):
+            errors.append({"row": row_number, "error": record})
+            continue
+        try:
+            row = CustomerImportRow.model_validate(record)
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": _format_validation_error(e)})
+            continue
+        if row.email in rows:  # 同一块内重复的邮箱以最后一行为准
+            errors.append(
+                {
+                    "row": rows[row.email][0],
+                    "error": f"与第 {row_number} 行邮箱重复, 以后者为准",
+                }
+            )
+            del rows[row.email]
+        rows[row.email] = (row_number, row)
+
+    if not rows:
+        return 0, 0, errors
+
+    with Session(engine) as session:
+        names = [row.name for _, row in rows.values()]
+        existing = session.exec(
+            select(Customer.id, Customer.name, Customer.email).where(
+                or_(
+                    Customer.email.in_(list(rows)),  # type: ignore
+                    Customer.name.in_(names),  # type: ignore
+                )
+            )
+        ).all()
+        id_by_email = {email: customer_id for customer_id, _, email in existing}
+        id_by_name = {name: customer_id for customer_id, name, _ in existing}
+
+        now = datetime.utcnow()
+        pending: List[PendingWrite] = []
+        claimed_names: Dict[str, int] = {}  # 本块内已使用的名称 -> 行号
+        claimed_ids: Dict[int, int] = {}  # 本块内已匹配的已有客户ID -> 行号
+        for row_number, row in rows.values():
+            email_match: Optional[int] = id_by_email.get(row.email)
+            name_match: Optional[int] = id_by_name.get(row.name)
+            if email_match and name_match and email_match != name_match:
+                errors.append(
+                    {"row": row_number, "error": "客户名称和邮箱分别属于不同的已有客户"}
+                )
+                continue
+            if row.name in claimed_names:
+                errors.append(
+                    {
+                        "row": row_number,
+                        "error": f"客户名称与第 {claimed_names[row.name]} 行重复",
+                    }
+                )
+                continue
+            customer_id = email_match or name_match
+            if customer_id and customer_id in claimed_ids:
+                errors.append(
+                    {
+                        "row": row_number,
+                        "error": f"与第 {claimed_ids[customer_id]} 行匹配到同一个已有客户",
+                    }
+                )
+                continue
+            claimed_names[row.name] = row_number
+
+            values = {
+                "name": row.name,
+                "email": row.email,
+                "is_blacklist": row.is_blacklist,
+                "tags": normalize_tags(row.tags),
+                "updated_at": now,
+            }
+            if customer_id:
+                claimed_ids[customer_id] = row_number
+                pending.append((row_number, {"id": customer_id, **values}))
+            else:
+                pending.append(
+                    (row_number, {**values, "created_by": created_by, "created_at": now})
+                )
+
+        inserted, updated = _commit_pending(session, pending, errors)
+
+    return inserted, updated, errors
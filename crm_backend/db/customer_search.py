@@ -0,0 +1,107 @@
+import re
+from loguru import logger
+from sqlalchemy import column, func, literal_column, table, text
+from sqlmodel import Session
+
+from crm_backend.db.db import engine
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.models.customer import Customer
+
+
+# 客户全文检索
+# customer_fts 是 SQLite FTS5 无内容表(content='', 只保存倒排索引, 不重复保存客户数据),
+# 查询时用 rowid(即客户ID) 关联回 customer 表; JSON 格式的 tags 展开为空格分隔的文本后再索引.
+# customer 表上的触发器负责同步索引, 所有写入路径(单个增删改、批量导入)都会自动更新索引
+
+# 把 tags(JSON数组) 展开为空格分隔的文本, 历史数据中不合法的JSON按原文索引
+_TAGS_TEXT = (
+    "CASE WHEN json_valid({row}.tags) "
+    "THEN (SELECT group_concat(value, ' ') FROM json_each({row}.tags)) "
+    "ELSE {row}.tags END"
+)
+
+_FTS_DDL = [
+    # unicode61 分词(中文连续字符作为一个词), 并为2、3个字符的前缀建立索引, 加快前缀查询
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts USING fts5(
+        name, email, tags,
+        content='',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS customer_fts_ai AFTER INSERT ON customer BEGIN
+        INSERT INTO customer_fts(rowid, name, email, tags)
+        VALUES (new.id, new.name, new.email, {_TAGS_TEXT.format(row="new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS customer_fts_ad AFTER DELETE ON customer BEGIN
+        INSERT INTO customer_fts(customer_fts, rowid, name, email, tags)
+        VALUES ('delete', old.id, old.name, old.email, {_TAGS_TEXT.format(row="old")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS customer_fts_au AFTER UPDATE OF name, email, tags ON customer BEGIN
+        INSERT INTO customer_fts(customer_fts, rowid, name, email, tags)
+        VALUES ('delete', old.id, old.name, old.email, {_TAGS_TEXT.format(row="old")});
+        INSERT INTO customer_fts(rowid, name, email, tags)
+        VALUES (new.id, new.name, new.email, {_TAGS_TEXT.format(row="new")});
+    END
+    """,
+]
+
+# bm25 各列的权重(name, email, tags): 名称命中排在最前面
+_BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+customer_fts = table("customer_fts", column("rowid"))
+
+
+def ensure_customer_fts():
+    """
+    创建全文检索表和同步触发器(已存在时跳过)
+    检索表为新建的, 或索引的文档数与客户数不一致时(例如触发器创建之前写入的数据), 重建索引
+    """
+    with Session(engine) as session:
+        connection = session.connection()
+        existed = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_fts'"
+        ).first()
+        for ddl in _FTS_DDL:
+            connection.exec_driver_sql(ddl)
+
+        indexed = connection.exec_driver_sql("SELECT count(*) FROM customer_fts_docsize").scalar()
+        total = connection.exec_driver_sql("SELECT count(*) FROM customer").scalar()
+        if not existed or indexed != total:
+            logger.info(f"开始重建客户全文检索索引, 共 {total} 个客户...")
+            connection.exec_driver_sql("INSERT INTO customer_fts(customer_fts) VALUES ('delete-all')")
+            connection.exec_driver_sql(
+                "INSERT INTO customer_fts(rowid, name, email, tags) "
+                f"SELECT id, name, email, {_TAGS_TEXT.format(row='customer')} FROM customer"
+            )
+            logger.info("客户全文检索索引重建完成")
+        session.commit()
+
+
+def build_match_query(q: str) -> str:
+    """
+    把用户输入转换为 FTS5 查询: 按非文字字符切分, 每个词加引号(避免被当作查询语法)并做前缀匹配,
+    多个词之间为 AND, 例如 "zhang@company" -> "zhang"* "company"*
+    """
+    tokens = re.findall(r"[^\W_]+", q)
+    if not tokens:
+        raise CrmHTTPException(status_code=400, detail="搜索关键字不能为空")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def apply_customer_search(statement, q: str):
+    """
+    给客户查询加上全文检索条件, 并按相关度(bm25, 越小越相关)排序, 相关度相同时按ID排序
+    statement 必须是以 customer 表为主表的查询
+    """
+    rank = func.bm25(literal_column("customer_fts"), *_BM25_WEIGHTS)
+    return (
+        statement.join(customer_fts, customer_fts.c.rowid == Customer.id)
+        .where(text("customer_fts MATCH :match").bindparams(match=build_match_query(q)))
+        .order_by(rank, Customer.id)
+    )
@@ -0,0 +1,124 @@
+import json
+from typing import Any, Dict, Iterable, List
+from loguru import logger
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, select
+from crm_backend.db.db import engine
+from crm_backend.models.customer import Customer, CustomerTag
+
+
+# 每批回填的客户数量, 避免一次性把整张客户表读进内存
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def normalize_tags(tags: Any) -> List[str]:
+    """
+    把 Customer.tags 统一转换为去重后的标签列表
+    历史数据里 tags 可能是列表, 也可能是JSON字符串或普通字符串
+    """
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        try:
+            tags = json.loads(tags)
+        except json.JSONDecodeError:
+            tags = [tags]
+        if isinstance(tags, str):
+            tags = [tags]
+    if not isinstance(tags, list):
+        return []
+
+    normalized = []
+    for tag in tags:
+        if isinstance(tag, str) and tag and tag not in normalized:
+            normalized.append(tag)
+    return normalized
+
+
+def sync_customer_tags(session: Session, customer: Customer):
+    """
+    按 customer.tags 重建该客户在标签索引表中的行
+    与客户本身的写入在同一个事务中, 由调用方负责 commit
+    """
+    if customer.id is None:
+        session.flush()  # 新建的客户需要先flush拿到ID
+    delete_customer_tags(session, customer.id)  # type: ignore
+    tags = normalize_tags(customer.tags)
+    if tags:
+        session.exec(
+            insert(CustomerTag),  # type: ignore
+            params=[{"tag": tag, "customer_id": customer.id} for tag in tags],
+        )
+
+
+def delete_customer_tags(session: Session, customer_id: int):
+    """删除某个客户在标签索引表中的全部行"""
+    session.exec(
+        delete(CustomerTag).where(CustomerTag.customer_id == customer_id)  # type: ignore
+    )
+
+
+def replace_tags_bulk(session: Session, tags_by_customer: Dict[int, Any]):
+    """
+    批量重建多个客户的标签索引(一条DELETE加一次批量INSERT)
+    :param tags_by_customer: 客户ID -> 该客户的 tags
+    """
+    if not tags_by_customer:
+        return
+    session.exec(
+        delete(CustomerTag).where(
+            CustomerTag.customer_id.in_(list(tags_by_customer))  # type: ignore
+        )
+    )
+    params = [
+        {"tag": tag, "customer_id": customer_id}
+        for customer_id, tags in tags_by_customer.items()
+        for tag in normalize_tags(tags)
+    ]
+    if params:
+        session.exec(insert(CustomerTag), params=params)  # type: ignore
+
+
+def customer_ids_with_tags(tags: Iterable[str]):
+    """
+    返回包含任一标签的客户ID子查询, 可直接用于 Customer.id.in_(...)
+    查询走 (tag, customer_id) 主键索引, 代价只与命中的客户数量有关
+    """
+    return select(CustomerTag.customer_id).where(
+        CustomerTag.tag.in_(list(tags))  # type: ignore
+    )
+
+
+def backfill_customer_tags():
+    """
+    标签索引表为空而客户表有数据时(例如从旧版本升级), 从 Customer.tags 回填索引
+    """
+    with Session(engine) as session:
+        has_tag_rows = session.exec(select(CustomerTag.customer_id).limit(1)).first()
+        if has_tag_rows is not None:
+            return
+        customer_count = session.exec(select(func.count()).select_from(Customer)).one()
+        if not customer_count:
+            return
+
+        logger.info(f"开始回填客户标签索引, 共 {customer_count} 个客户...")
+        last_id = 0
+        while True:
+            rows = session.exec(
+                select(Customer.id, Customer.tags)
+                .where(Customer.id > last_id)  # type: ignore
+                .order_by(Customer.id)  # type: ignore
+                .limit(BACKFILL_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+            params = [
+                {"tag": tag, "customer_id": customer_id}
+                for customer_id, tags in rows
+                for tag in normalize_tags(tags)
+            ]
+            if params:
+                session.exec(insert(CustomerTag), params=params)  # type: ignore
+            last_id = rows[-1][0]
+        session.commit()
+        logger.info("客户标签索引回填完成")
@@ -1,7 +1,12 @@
-from typing import Annotated
+import os
+from typing import Annotated, Any, AsyncIterator, List, Optional, Union
+from urllib.parse import quote
 from fastapi import Depends
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
 from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from crm_backend.db.sql_profiler import install_sql_profiler
 from crm_backend.utils.config import load_config
 
 
@@ -10,27 +15,195 @@ config = load_config()
 # 创建引擎
 sqlite_file_name = config.SQLITE_FILE_NAME
 sqlite_url = f"sqlite:///{sqlite_file_name}"  # 通常是"sqlite:///your_database.db""
+# 只读连接使用URI方式打开(mode=ro), 在驱动层面禁止写入
+sqlite_read_url = (
+    f"sqlite:///file:{quote(os.path.abspath(sqlite_file_name))}?mode=ro&uri=true"
+)
 
 connect_args = {"check_same_thread": False}
 # 使用check_same_thread=False可以让FastAPI在不同线程中使用同一个SQLite数据库
 # 这很有必要,因为单个请求可能会使用多个线程 （例如在依赖项中）
 # 不用担心 我们会按照代码结构确保每个请求使用一个单独的sqlmodel会话,这实际上就是check_same_thread想要实现的
+
+
+def _apply_sqlite_pragmas(dbapi_connection, read_only: bool):
+    """每个新建的SQLite连接都按配置设置一遍 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size = {int(config.SQLITE_CACHE_SIZE)}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = ON")
+    else:
+        # journal_mode 是持久化在数据库文件中的, 由写连接设置即可
+        if config.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+    cursor.close()
+
+
+# 写引擎: 只有一个连接, 所有写入在进程内排队串行执行,
+# 不再在SQLite文件锁上互相争抢("database is locked")
 engine = create_engine(
-    sqlite_url, connect_args=connect_args
+    sqlite_url, connect_args=connect_args, pool_size=1, max_overflow=0
 )  # 这是传给底层SQLite驱动的参数
+event.listen(
+    engine, "connect", lambda conn, _: _apply_sqlite_pragmas(conn, read_only=False)
+)
+
+# 邮件执行器的写引擎: 认领任务、租约续期、状态批量写入和批量作业都走这里,
+# 不与请求共用写连接, 长时间的请求(批量创建任务、导入客户)不会让执行器等待连接池而错过租约续期;
+# 两个写连接之间的文件锁由 busy_timeout 排队, 连接池等待时间设得较短, 超时后由调用方下次重试
+task_engine = create_engine(
+    sqlite_url,
+    connect_args=connect_args,
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=config.SQLITE_TASK_POOL_TIMEOUT,
+)
+event.listen(
+    task_engine, "connect", lambda conn, _: _apply_sqlite_pragmas(conn, read_only=False)
+)
+
+# 读引擎: 只读连接池, WAL模式下读取不会阻塞写入, 也不会被写入阻塞,
+# 只读接口、导出和邮件执行器的查询都走这里
+read_engine = create_engine(
+    sqlite_read_url,
+    connect_args=connect_args,
+    pool_size=config.SQLITE_READ_POOL_SIZE,
+    max_overflow=config.SQLITE_READ_POOL_SIZE,
+)
+event.listen(
+    read_engine, "connect", lambda conn, _: _apply_sqlite_pragmas(conn, read_only=True)
+)
+
+# 异步引擎(可选): 配置 DB_ASYNC=true 时通过 aiosqlite 只读访问同一个SQLite文件,
+# 热点查询接口可以直接 await 查询, 不再占用 FastAPI 的线程池
+async_engine = None
+if config.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async_engine = create_async_engine(
+        sqlite_read_url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        pool_size=config.SQLITE_READ_POOL_SIZE,
+        max_overflow=config.SQLITE_READ_POOL_SIZE,
+    )
+    event.listen(
+        async_engine.sync_engine,
+        "connect",
+        lambda conn, _: _apply_sqlite_pragmas(conn, read_only=True),
+    )
+
+# 统计每个请求执行的SQL条数和耗时, 并记录慢查询
+install_sql_profiler(engine)
+install_sql_profiler(task_engine)
+install_sql_profiler(read_engine)
+if async_engine is not None:
+    install_sql_profiler(async_engine.sync_engine)
 
 
 # 添加一个为所有表模型创建表
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    # create_all 不会给已存在的表补建索引, 这里逐个检查并补上新增的索引
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+# create_all 也不会给已存在的表补充新增的列, 这里用 ALTER TABLE ADD COLUMN 补上
+# 只适用于可为空(或有服务端默认值)的新列, 其余表结构变化需要手动迁移
+def add_missing_columns():
+    with engine.begin() as connection:
+        inspector = inspect(connection)  # 写引擎只有一个连接, 检查表结构也复用它
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing_columns = {
+                column["name"] for column in inspector.get_columns(table.name)
+            }
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.exec_driver_sql(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                )
 
 
 # Session 会存储内存中的对象并跟踪数据所需更改的内容,然后它使用engine与数据库进行通信
 # 我们会使用yield创建一个FastAPI依赖项,为每个请求提供一个新的Session 这确保我们每个请求使用一个单独的对话
 # 然后我们创建一个Annotated的依赖项SessionDep来简化其他也会用到此依赖的代码
+# 提交后不让对象过期(expire_on_commit=False), 对象上已经是最新的值, 不需要 refresh 重新查询;
+# 提交后不再访问数据库, 写连接在 commit 时就归还给连接池, 不会被占用到请求结束
 def get_session():
-    with Session(engine) as session:
+    with Session(engine, expire_on_commit=False) as session:
         yield session
 
 
 SessionDep = Annotated[Session, Depends(get_session)]
+
+
+# 只读会话依赖项: 使用只读连接池, 供只查询不写入的接口使用
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
+
+
+ReadSessionDep = Annotated[Session, Depends(get_read_session)]
+
+
+class _BufferedResult:
+    """在线程池中一次性取出的查询结果, 提供与 ScalarResult 相同的常用方法"""
+
+    def __init__(self, rows: List[Any]):
+        self._rows = rows
+
+    def all(self) -> List[Any]:
+        return self._rows
+
+    def first(self) -> Optional[Any]:
+        return self._rows[0] if self._rows else None
+
+    def one(self) -> Any:
+        if len(self._rows) != 1:
+            raise ValueError(f"期望1行结果, 实际为{len(self._rows)}行")
+        return self._rows[0]
+
+
+class ThreadPoolAsyncSession:
+    """
+    未开启 DB_ASYNC 时 AsyncSessionDep 提供的会话: 包装同步 Session,
+    把查询放到线程池执行, 使用方式与 AsyncSession 的 exec/get 相同
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def exec(self, statement, **kwargs) -> _BufferedResult:
+        return _BufferedResult(
+            await run_in_threadpool(
+                lambda: list(self.sync_session.exec(statement, **kwargs).all())
+            )
+        )
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+
+# 异步会话依赖项: 开启 DB_ASYNC 时为 aiosqlite 上的 AsyncSession,
+# 否则退回到在线程池中执行的同步会话, 路由代码都是 await session.exec(...)
+AnyAsyncSession = Union[AsyncSession, ThreadPoolAsyncSession]
+
+
+async def get_async_session() -> AsyncIterator[AnyAsyncSession]:
+    if async_engine is not None:
+        async with AsyncSession(async_engine) as session:
+            yield session
+    else:
+        with Session(read_engine) as session:
+            yield ThreadPoolAsyncSession(session)
+
+
+AsyncSessionDep = Annotated[AnyAsyncSession, Depends(get_async_session)]
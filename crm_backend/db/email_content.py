@@ -0,0 +1,91 @@
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import orjson
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select
+
+from crm_backend.db.db import read_engine
+from crm_backend.models.email_content import EmailContent
+from crm_backend.models.email_task import Email, EmailTask
+from crm_backend.utils.config import load_config
+
+
+config = load_config()
+
+
+def email_content_hash(email: Email) -> str:
+    """邮件内容的SHA-256(按键排序后的JSON), 内容相同的邮件得到同一个哈希"""
+    return hashlib.sha256(orjson.dumps(email.dict(), option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def get_or_create_email_content(session: Session, email: Email) -> int:
+    """
+    返回邮件内容的ID, 相同内容已存在时直接复用(只按哈希查一次索引, 不重复写入正文)
+    与任务的写入在同一个事务中, 由调用方负责 commit
+    """
+    digest = email_content_hash(email)
+    content_id = session.exec(select(EmailContent.id).where(EmailContent.hash == digest)).first()
+    if content_id is not None:
+        return content_id
+    session.exec(
+        insert(EmailContent)  # type: ignore
+        .values(
+            hash=digest,
+            subject=email.subject,
+            body=email.body,
+            use_template=email.use_template,
+            created_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["hash"])
+    )
+    return session.exec(select(EmailContent.id).where(EmailContent.hash == digest)).one()
+
+
+# 内容写入后不会修改, 按ID缓存; 同一次推广的所有任务只查询一次数据库
+# 不存在的ID会抛出异常, 不会被缓存
+@lru_cache(maxsize=config.EMAIL_CONTENT_CACHE_SIZE)
+def load_email_content(content_id: int) -> Email:
+    with Session(read_engine) as session:
+        content = session.get(EmailContent, content_id)
+    if content is None:
+        raise LookupError(f"邮件内容 {content_id} 不存在")
+    return content.to_email()
+
+
+def task_email(task: EmailTask) -> Email:
+    """任务的邮件内容: 新任务从内容表读取(带缓存), 旧数据直接使用任务上保存的JSON"""
+    if task.content_id is not None:
+        return load_email_content(task.content_id)
+    return task.get_email()
+
+
+def email_task_list_statement(include_content: bool):
+    """
+    邮件任务列表的查询: 默认不返回邮件内容(只有 content_id);
+    include_content 为真时关联内容表, 把主题和正文一起查出
+    """
+    columns: List[Any] = list(EmailTask.__table__.columns)  # type: ignore
+    if not include_content:
+        return select(*[column for column in columns if column.name != "email"])
+    return select(
+        *columns,
+        EmailContent.subject.label("content_subject"),  # type: ignore
+        EmailContent.body.label("content_body"),  # type: ignore
+        EmailContent.use_template.label("content_use_template"),  # type: ignore
+    ).outerjoin(EmailContent, EmailContent.id == EmailTask.content_id)  # type: ignore
+
+
+def email_task_rows_to_dicts(rows: Sequence[Any], include_content: bool) -> List[Dict[str, Any]]:
+    """把 email_task_list_statement 的查询结果转换为字典, 关联出的内容合并为 email 字段"""
+    tasks = [row._asdict() for row in rows]
+    if include_content:
+        for task in tasks:
+            subject: Optional[str] = task.pop("content_subject")
+            body = task.pop("content_body")
+            use_template = task.pop("content_use_template")
+            if subject is not None:
+                task["email"] = Email(subject=subject, body=body, use_template=use_template).dict()
+    return tasks
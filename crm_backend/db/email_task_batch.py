@@ -0,0 +1,226 @@
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+from sqlalchemy import insert, or_, update
+from sqlmodel import Session, select
+
+from crm_backend.db.customer_tags import customer_ids_with_tags
+from crm_backend.db.db import read_engine, task_engine
+from crm_backend.db.email_task_stats import read_email_task_stats
+from crm_backend.models.customer import Customer
+from crm_backend.models.email_batch_job import (
+    JOB_STATUS_DONE,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    EmailBatchJob,
+)
+from crm_backend.models.email_task import (
+    TASK_STATUS_FAILED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SENDING,
+    TASK_STATUS_SUCCESS,
+    EmailTask,
+)
+from crm_backend.models.email_task_stat import STAT_BY_JOB
+
+
+# 批量创建邮件任务时每条INSERT语句写入的任务数量
+BATCH_INSERT_CHUNK_SIZE = 1000
+
+
+def resolve_batch_recipients(
+    session: Session, tags: Sequence[str], emails: Sequence[str]
+) -> Tuple[List[Tuple[str, bool]], int, int]:
+    """
+    按标签和邮箱查出批量发送的客户, 只查询邮箱和黑名单两列, 不加载完整的客户对象
+    :return: (按邮箱去重后的 [(邮箱, 是否黑名单)], 标签命中数, 邮箱命中数)
+    """
+    by_tags: Sequence[Tuple[str, bool]] = []
+    if tags:
+        by_tags = session.exec(
+            select(Customer.email, Customer.is_blacklist).where(
+                Customer.id.in_(customer_ids_with_tags(tags))  # type: ignore
+            )
+        ).all()
+
+    by_emails: Sequence[Tuple[str, bool]] = []
+    if emails:
+        by_emails = session.exec(
+            select(Customer.email, Customer.is_blacklist).where(
+                Customer.email.in_(emails)  # type: ignore
+            )
+        ).all()
+
+    # 合并并按邮箱去重, 保持先标签后邮箱的顺序
+    recipients: Dict[str, bool] = {}
+    for email, is_blacklist in list(by_tags) + list(by_emails):
+        recipients.setdefault(email, is_blacklist)
+    return list(recipients.items()), len(by_tags), len(by_emails)
+
+
+def bulk_insert_email_tasks(
+    session: Session,
+    name: str,
+    content_id: int,
+    send_by: str,
+    send_to_list: Sequence[str],
+    job_id: Optional[int] = None,
+) -> List[int]:
+    """
+    分块批量插入邮件任务, 通过 INSERT ... RETURNING 直接拿到生成的ID,
+    不需要逐个 refresh; 由调用方负责 commit
+    所有任务引用同一份邮件内容(content_id), 正文不随收件人数量重复写入
+    :return: 新任务的ID列表(升序)
+    """
+    now = datetime.utcnow()
+    task_ids: List[int] = []
+    for start in range(0, len(send_to_list), BATCH_INSERT_CHUNK_SIZE):
+        rows = [
+            {
+                "name": name,
+                "content_id": content_id,
+                "send_by": send_by,
+                "send_to": send_to,
+                "status": TASK_STATUS_PENDING,
+                # 批量插入不会经过模型的 default_factory, 需要显式给出时间
+                "created_at": now,
+                "sended_at": now,
+                "job_id": job_id,
+            }
+            for send_to in send_to_list[start : start + BATCH_INSERT_CHUNK_SIZE]
+        ]
+        task_ids.extend(
+            session.exec(
+                insert(EmailTask).returning(EmailTask.id),  # type: ignore
+                params=rows,
+            ).scalars()
+        )
+    task_ids.sort()
+    return task_ids
+
+
+def resolve_batch_customer_ids(
+    session: Session, tags: Sequence[str], emails: Sequence[str]
+) -> List[int]:
+    """按标签索引和邮箱索引查出命中客户的ID(去重, 升序)"""
+    customer_ids = set()
+    if tags:
+        customer_ids.update(session.exec(customer_ids_with_tags(tags)).all())
+    if emails:
+        customer_ids.update(
+            session.exec(
+                select(Customer.id).where(Customer.email.in_(emails))  # type: ignore
+            ).all()
+        )
+    return sorted(customer_ids)  # type: ignore
+
+
+def _read_chunk_recipients(customer_ids: Sequence[int]) -> List[Tuple[str, bool]]:
+    """在只读连接上取出一块客户的邮箱和黑名单状态, 读事务随会话关闭立即结束"""
+    with Session(read_engine) as session:
+        return list(
+            session.exec(
+                select(Customer.email, Customer.is_blacklist).where(
+                    Customer.id.in_(customer_ids)  # type: ignore
+                )
+            ).all()
+        )
+
+
+def run_email_batch_job(
+    job_id: int,
+    tags: Sequence[str],
+    emails: Sequence[str],
+    content_id: int,
+    on_tasks_created: Callable[[int, int], None],
+):
+    """
+    在后台分块展开批量作业的收件人: 先通过索引查出全部命中客户的ID(只有整数),
+    再按块取出客户的邮箱和黑名单状态, 跳过黑名单, 批量插入邮件任务并更新作业进度,
+    每块单独提交, 提交后立即通过 on_tasks_created(首个ID, 最后ID) 交给任务执行器发送
+    客户数据都在只读连接上查询, 执行器的写连接(task_engine)上的事务只包含插入任务和更新进度
+    """
+    with Session(task_engine) as session:
+        job = session.get(EmailBatchJob, job_id)
+        if not job:
+            logger.warning(f"批量作业 {job_id} 不存在")
+            return
+        name, created_by = job.name, job.created_by
+        try:
+            job.status = JOB_STATUS_RUNNING
+            session.commit()
+
+            with Session(read_engine) as read_session:
+                customer_ids = resolve_batch_customer_ids(read_session, tags, emails)
+            for start in range(0, len(customer_ids), BATCH_INSERT_CHUNK_SIZE):
+                rows = _read_chunk_recipients(
+                    customer_ids[start : start + BATCH_INSERT_CHUNK_SIZE]
+                )
+                send_to_list = [email for email, is_blacklist in rows if not is_blacklist]
+                task_ids = bulk_insert_email_tasks(
+                    session,
+                    name=name,
+                    content_id=content_id,
+                    send_by=created_by,
+                    send_to_list=send_to_list,
+                    job_id=job_id,
+                )
+                job.total_customers += len(rows)
+                job.created_count += len(task_ids)
+                job.skipped_count += len(rows) - len(send_to_list)
+                session.commit()
+                if task_ids:
+                    on_tasks_created(task_ids[0], task_ids[-1])
+
+            job.status = JOB_STATUS_DONE
+            job.finished_at = datetime.utcnow()
+            session.commit()
+            logger.info(
+                f"批量作业 {job_id} 完成, 创建 {job.created_count} 个任务, 跳过 {job.skipped_count} 个黑名单客户"
+            )
+        except Exception as e:
+            session.rollback()
+            logger.error(f"批量作业 {job_id} 执行失败: {e}")
+            job.status = JOB_STATUS_FAILED
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            session.commit()
+
+
+def get_job_task_counts(session: Session, job_id: int) -> Dict[str, int]:
+    """从邮件任务统计表读取批量作业下各状态的任务数量, 不再按作业统计全部任务"""
+    counts = read_email_task_stats(session, STAT_BY_JOB, key=str(job_id)).get(str(job_id), {})
+    return {
+        "queued": counts.get(TASK_STATUS_PENDING, 0)
+        + counts.get(TASK_STATUS_SENDING, 0),
+        "sent": counts.get(TASK_STATUS_SUCCESS, 0),
+        "failed": counts.get(TASK_STATUS_FAILED, 0),
+    }
+
+
+def fail_interrupted_batch_jobs():
+    """
+    把执行进程已经退出(租约已过期)的未完成批量作业标记为失败(已创建的任务仍会继续发送)
+    其他进程正在执行的作业持有未过期的租约, 不受影响; 启动时和租约续期时调用
+    """
+    now = datetime.utcnow()
+    with Session(task_engine) as session:
+        result = session.exec(
+            update(EmailBatchJob)  # type: ignore
+            .where(EmailBatchJob.status.in_([JOB_STATUS_QUEUED, JOB_STATUS_RUNNING]))  # type: ignore
+            .where(
+                or_(
+                    EmailBatchJob.lease_expires_at.is_(None),  # type: ignore
+                    EmailBatchJob.lease_expires_at < now,  # type: ignore
+                )
+            )
+            .values(
+                status=JOB_STATUS_FAILED,
+                error="执行作业的进程已退出, 作业被中断",
+                finished_at=now,
+            )
+        )
+        session.commit()
+    if result.rowcount:
+        logger.warning(f"{result.rowcount} 个批量作业因执行进程退出被中断")
@@ -0,0 +1,138 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Collection, List, Optional
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from crm_backend.db.db import task_engine
+from crm_backend.models.email_batch_job import (
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    EmailBatchJob,
+)
+from crm_backend.models.email_task import (
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SENDING,
+    EmailTask,
+)
+
+
+# 邮件任务租约
+# 多个执行器(多个 uvicorn worker 或多台主机)共享同一个数据库时, 每个执行器用
+# 一条 UPDATE ... WHERE id IN (SELECT ... LIMIT n) RETURNING id 认领一批待处理任务,
+# SQLite 的写锁保证同一时刻只有一个执行器在认领, 同一个任务不会被两个执行器同时持有.
+# 持有者定时续期; 进程崩溃后租约过期, 任务会被其他执行器(或重启后的进程)重新认领.
+# 所有写入都使用执行器专用的写引擎(task_engine), 在写锁内读取最新数据
+
+
+def new_lease_owner() -> str:
+    """生成执行器ID: 主机名:进程号:随机串, 进程重启后ID不同, 不会误认旧进程的租约"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _lease_available(now: datetime):
+    return or_(
+        EmailTask.lease_expires_at.is_(None),  # type: ignore
+        EmailTask.lease_expires_at < now,  # type: ignore
+    )
+
+
+def claim_email_tasks(
+    owner: str,
+    lease_seconds: float,
+    limit: int,
+    after_id: int = 0,
+    exclude_senders: Collection[str] = (),
+) -> List[int]:
+    """
+    原子地认领最多 limit 个ID大于 after_id 的待处理任务(没有租约或租约已过期)
+    :param exclude_senders: 不认领这些发件人的任务(执行器中已达到发件人并发上限的发件人)
+    :return: 认领到的任务ID(升序)
+    """
+    now = datetime.utcnow()
+    candidates = (
+        select(EmailTask.id)
+        .where(EmailTask.status == TASK_STATUS_PENDING)
+        .where(EmailTask.id > after_id)  # type: ignore
+        .where(_lease_available(now))
+    )
+    if exclude_senders:
+        candidates = candidates.where(EmailTask.send_by.not_in(exclude_senders))  # type: ignore
+    candidates = candidates.order_by(EmailTask.id).limit(limit)  # type: ignore
+    with Session(task_engine) as session:
+        task_ids = list(
+            session.exec(
+                update(EmailTask)  # type: ignore
+                .where(EmailTask.id.in_(candidates))  # type: ignore
+                .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds))
+                .returning(EmailTask.id)
+            ).scalars()
+        )
+        session.commit()
+    task_ids.sort()
+    return task_ids
+
+
+def renew_email_task_leases(owner: str, lease_seconds: float) -> int:
+    """给执行器持有的全部未完成任务续期, 返回续期的任务数"""
+    with Session(task_engine) as session:
+        result = session.exec(
+            update(EmailTask)  # type: ignore
+            .where(EmailTask.lease_owner == owner)
+            .where(EmailTask.status.in_([TASK_STATUS_PENDING, TASK_STATUS_SENDING]))  # type: ignore
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+        session.commit()
+    return result.rowcount
+
+
+def renew_batch_job_leases(owner: str, lease_seconds: float) -> int:
+    """给执行器所在进程正在执行的批量作业续期, 返回续期的作业数"""
+    with Session(task_engine) as session:
+        result = session.exec(
+            update(EmailBatchJob)  # type: ignore
+            .where(EmailBatchJob.lease_owner == owner)
+            .where(EmailBatchJob.status.in_([JOB_STATUS_QUEUED, JOB_STATUS_RUNNING]))  # type: ignore
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+        session.commit()
+    return result.rowcount
+
+
+def release_email_task_leases(owner: str) -> int:
+    """
+    执行器关闭时释放持有的租约: 还没开始发送的待处理任务, 其他执行器可以立即认领, 不需要等租约过期
+    "发送中"的任务不释放: 邮件可能已经交给SMTP服务器, 立即重新排队会重复发送;
+    它们的租约不再续期, 过期后由 reclaim_expired_email_tasks 恢复
+    """
+    with Session(task_engine) as session:
+        result = session.exec(
+            update(EmailTask)  # type: ignore
+            .where(EmailTask.lease_owner == owner)
+            .where(EmailTask.status == TASK_STATUS_PENDING)
+            .values(lease_owner=None, lease_expires_at=None)
+        )
+        session.commit()
+    return result.rowcount
+
+
+def reclaim_expired_email_tasks() -> Optional[int]:
+    """
+    把租约已过期(或没有租约, 例如旧版本留下)的"发送中"任务恢复为待处理, 重新排队
+    持有者崩溃或长时间失联时才会出现, 正常运行中的执行器会在租约过期前续期
+    :return: 被恢复任务中最小的ID, 没有任务被恢复时返回 None
+    """
+    with Session(task_engine) as session:
+        task_ids = list(
+            session.exec(
+                update(EmailTask)  # type: ignore
+                .where(EmailTask.status == TASK_STATUS_SENDING)
+                .where(_lease_available(datetime.utcnow()))
+                .values(status=TASK_STATUS_PENDING, lease_owner=None, lease_expires_at=None)
+                .returning(EmailTask.id)
+            ).scalars()
+        )
+        session.commit()
+    return min(task_ids) if task_ids else None
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from typing import Dict, Optional
+from loguru import logger
+from sqlmodel import Session, select
+
+from crm_backend.db.db import engine
+from crm_backend.models.email_task import TASK_STATUS_FAILED, TASK_STATUS_SUCCESS
+from crm_backend.models.email_task_stat import (
+    STAT_BY_JOB,
+    STAT_BY_NAME,
+    STAT_BY_SENDED_HOUR,
+    STAT_BY_SENDER,
+    EmailTaskStat,
+)
+
+
+# 邮件任务分维度状态统计
+# emailtask 表上的触发器在任务插入、删除, 以及状态/名称/发送人/发送时间/作业变化时,
+# 在同一个事务里把旧行的计数减一、新行的计数加一; 执行器批量写入状态时也会自动更新.
+# 首次创建触发器时按邮件任务表重建一次, 统计触发器创建之前写入的数据
+
+# 维度 -> (取值表达式, 参与统计的条件), {row} 为 new 或 old
+_DIMENSIONS = {
+    STAT_BY_NAME: ("{row}.name", "1"),
+    STAT_BY_SENDER: ("{row}.send_by", "1"),
+    # 发送时间在任务创建时就有默认值, 只有发送完成(成功或失败)的任务才按发送时间统计
+    STAT_BY_SENDED_HOUR: (
+        "strftime('%Y-%m-%d %H:00', {row}.sended_at)",
+        f"{{row}}.status IN ('{TASK_STATUS_SUCCESS}', '{TASK_STATUS_FAILED}')",
+    ),
+    STAT_BY_JOB: ("CAST({row}.job_id AS TEXT)", "{row}.job_id IS NOT NULL"),
+}
+
+
+def _increment(row: str) -> str:
+    return "\n    ".join(
+        f"INSERT INTO emailtaskstat(dimension, key, status, value) "
+        f"SELECT '{dimension}', {key.format(row=row)}, {row}.status, 1 WHERE {condition.format(row=row)} "
+        "ON CONFLICT(dimension, key, status) DO UPDATE SET value = value + 1;"
+        for dimension, (key, condition) in _DIMENSIONS.items()
+    )
+
+
+def _decrement(row: str) -> str:
+    return "\n    ".join(
+        f"UPDATE emailtaskstat SET value = value - 1 WHERE dimension = '{dimension}' "
+        f"AND key = {key.format(row=row)} AND status = {row}.status AND {condition.format(row=row)};"
+        for dimension, (key, condition) in _DIMENSIONS.items()
+    )
+
+
+_TRACKED_COLUMNS = ("status", "name", "send_by", "sended_at", "job_id")
+
+_STAT_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS emailtaskstat_ai AFTER INSERT ON emailtask BEGIN
+    {_increment("new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS emailtaskstat_ad AFTER DELETE ON emailtask BEGIN
+    {_decrement("old")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS emailtaskstat_au AFTER UPDATE OF {", ".join(_TRACKED_COLUMNS)} ON emailtask
+    WHEN {" OR ".join(f"old.{column} IS NOT new.{column}" for column in _TRACKED_COLUMNS)}
+    BEGIN
+    {_decrement("old")}
+    {_increment("new")}
+    END
+    """,
+]
+
+
+def _rebuild_sql():
+    yield "DELETE FROM emailtaskstat"
+    for dimension, (key, condition) in _DIMENSIONS.items():
+        yield (
+            f"INSERT INTO emailtaskstat(dimension, key, status, value) "
+            f"SELECT '{dimension}', {key.format(row='emailtask')}, status, count(*) FROM emailtask "
+            f"WHERE {condition.format(row='emailtask')} GROUP BY 2, 3"
+        )
+
+
+def ensure_email_task_stats():
+    """
+    创建邮件任务统计触发器(已存在时跳过)
+    触发器是新建的(首次启动或从旧版本升级)时, 按邮件任务表重建统计;
+    触发器存在期间统计与任务在同一事务中更新, 不需要每次启动都重新 GROUP BY 整张表
+    """
+    with Session(engine) as session:
+        connection = session.connection()
+        existed = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'emailtaskstat_ai'"
+        ).first()
+        for ddl in _STAT_TRIGGERS:
+            connection.exec_driver_sql(ddl)
+        if not existed:
+            logger.info("开始重建邮件任务统计...")
+            for sql in _rebuild_sql():
+                connection.exec_driver_sql(sql)
+            logger.info("邮件任务统计重建完成")
+        session.commit()
+
+
+def read_email_task_stats(
+    session: Session,
+    dimension: str,
+    key: Optional[str] = None,
+    key_from: Optional[str] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    读取某个维度的统计: {维度取值: {状态: 任务数}}, 跳过已经减为0的行
+    :param key: 只读取这一个取值
+    :param key_from: 只读取不小于该值的取值(例如发送时间的最近若干小时)
+    """
+    statement = select(EmailTaskStat.key, EmailTaskStat.status, EmailTaskStat.value).where(
+        EmailTaskStat.dimension == dimension, EmailTaskStat.value > 0
+    )
+    if key is not None:
+        statement = statement.where(EmailTaskStat.key == key)
+    if key_from is not None:
+        statement = statement.where(EmailTaskStat.key >= key_from)
+    stats: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for stat_key, status, value in session.exec(statement.order_by(EmailTaskStat.key)).all():
+        stats[stat_key][status] = value
+    return dict(stats)
@@ -1,9 +1,22 @@
-from datetime import datetime
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import func, insert
 from sqlmodel import Session, select
 from crm_backend.models.user import User
-from crm_backend.models.customer import Customer
-from crm_backend.models.email_task import EmailTask, Email
-from crm_backend.db.db import engine
+from crm_backend.models.customer import Customer, CustomerTag
+from crm_backend.models.email_task import (
+    TASK_STATUS_FAILED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SUCCESS,
+    EmailTask,
+    Email,
+)
+from crm_backend.db.customer_tags import sync_customer_tags
+from crm_backend.db.db import create_db_and_tables, engine
+from crm_backend.db.email_content import get_or_create_email_content
 from loguru import logger
 
 from crm_backend.utils.security import get_passwd_hash
@@ -13,8 +26,8 @@ def init_sample_users():
     """初始化示例用户数据"""
     with Session(engine) as session:
         # 检查是否已有用户数据
-        existing_users = session.exec(select(User)).all()
-        if existing_users:
+        existing_user = session.exec(select(User.id).limit(1)).first()
+        if existing_user is not None:
             logger.info("用户数据已存在，跳过初始化")
             return
 
@@ -64,19 +77,19 @@ def init_sample_customers():
     """初始化示例客户数据"""
     with Session(engine) as session:
         # 检查是否已有客户数据
-        existing_customers = session.exec(select(Customer)).all()
-        if existing_customers:
+        existing_customer = session.exec(select(Customer.id).limit(1)).first()
+        if existing_customer is not None:
             logger.info("客户数据已存在，跳过初始化")
             return
 
-        # 获取用户ID作为创建者
-        users = session.exec(select(User)).all()
-        if not users:
+        # 获取用户ID作为创建者(优先使用管理员)
+        admin_user = session.exec(
+            select(User).order_by(User.is_admin.desc(), User.id).limit(1)  # type: ignore
+        ).first()
+        if not admin_user:
             logger.warning("没有找到用户，无法创建客户数据")
             return
 
-        admin_user = next((u for u in users if u.is_admin), users[0])
-
         if not admin_user.id:
             return
 
@@ -131,6 +144,7 @@ def init_sample_customers():
 
         for customer in sample_customers:
             session.add(customer)
+            sync_customer_tags(session, customer)
 
         session.commit()
         logger.info(f"成功创建 {len(sample_customers)} 个示例客户")
@@ -140,21 +154,21 @@ def init_sample_email_tasks():
     """初始化示例邮件任务数据"""
     with Session(engine) as session:
         # 检查是否已有邮件任务数据
-        existing_tasks = session.exec(select(EmailTask)).all()
-        if existing_tasks:
+        existing_task = session.exec(select(EmailTask.id).limit(1)).first()
+        if existing_task is not None:
             logger.info("邮件任务数据已存在，跳过初始化")
             return
 
-        # 获取用户和客户数据
-        users = session.exec(select(User)).all()
-        customers = session.exec(select(Customer)).all()
+        # 获取用户和客户数据(只需确认存在, 不加载整张表)
+        admin_user = session.exec(
+            select(User).order_by(User.is_admin.desc(), User.id).limit(1)  # type: ignore
+        ).first()
+        has_customer = session.exec(select(Customer.id).limit(1)).first() is not None
 
-        if not users or not customers:
+        if not admin_user or not has_customer:
             logger.warning("没有找到用户或客户，无法创建邮件任务数据")
             return
 
-        admin_user = next((u for u in users if u.is_admin), users[0])
-
         # 创建示例邮件任务
         sample_tasks = [
             EmailTask(
@@ -162,10 +176,13 @@ def init_sample_email_tasks():
                 status="待处理",
                 send_by=admin_user.email,
                 send_to="zhangsan@company.com",
-                email={
-                    "subject": "欢迎加入我们的大家庭！",
-                    "body": "<h1>欢迎！</h1><p>感谢您选择我们的服务，我们将为您提供最优质的产品和服务。</p>",
-                },
+                content_id=get_or_create_email_content(
+                    session,
+                    Email(
+                        subject="欢迎加入我们的大家庭！",
+                        body="<h1>欢迎！</h1><p>感谢您选择我们的服务，我们将为您提供最优质的产品和服务。</p>",
+                    ),
+                ),
                 created_at=datetime.utcnow(),
                 sended_at=datetime.utcnow(),
             ),
@@ -174,10 +191,13 @@ def init_sample_email_tasks():
                 status="发送成功",
                 send_by=admin_user.email,
                 send_to="lisi@company.com",
-                email={
-                    "subject": "新产品上线通知",
-                    "body": "<h1>新产品发布！</h1><p>我们刚刚发布了全新的产品系列，快来了解一下吧！</p>",
-                },
+                content_id=get_or_create_email_content(
+                    session,
+                    Email(
+                        subject="新产品上线通知",
+                        body="<h1>新产品发布！</h1><p>我们刚刚发布了全新的产品系列，快来了解一下吧！</p>",
+                    ),
+                ),
                 created_at=datetime.utcnow(),
                 sended_at=datetime.utcnow(),
             ),
@@ -186,10 +206,13 @@ def init_sample_email_tasks():
                 status="待处理",
                 send_by=admin_user.email,
                 send_to="wangwu@company.com",
-                email={
-                    "subject": "客户满意度调查",
-                    "body": "<h1>您的意见很重要</h1><p>我们非常重视您的使用体验，请花几分钟时间完成满意度调查。</p>",
-                },
+                content_id=get_or_create_email_content(
+                    session,
+                    Email(
+                        subject="客户满意度调查",
+                        body="<h1>您的意见很重要</h1><p>我们非常重视您的使用体验，请花几分钟时间完成满意度调查。</p>",
+                    ),
+                ),
                 created_at=datetime.utcnow(),
                 sended_at=datetime.utcnow(),
             ),
@@ -218,3 +241,197 @@ def init_all_sample_data():
     except Exception as e:
         logger.error(f"初始化示例数据时发生错误: {e}")
         raise
+
+
+# ---------------- 批量生成测试数据 ----------------
+# 用于在本地复现生产规模的性能问题: 按指定数量批量插入用户、客户(含标签)和邮件任务,
+# 使用固定种子的随机数, 相同参数生成的数据完全一致
+
+GENERATED_USER_PASSWD = "user123"  # 生成的用户统一使用该密码
+GENERATE_CHUNK_SIZE = 5000  # 每个事务插入的行数
+
+_SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤"
+_GIVEN_NAMES = "伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华玉兰飞鹏辉建华晶宇浩然子轩欣怡梓涵一诺宇轩思远雨泽嘉怡"
+_EMAIL_DOMAINS = ["qq.com", "163.com", "126.com", "gmail.com", "outlook.com", "company.com", "example.com"]
+_TAG_CATEGORIES = ["VIP客户", "企业客户", "个人客户", "潜在客户", "长期合作", "新客户", "活跃客户", "沉睡客户"]
+_CAMPAIGNS = ["欢迎新客户邮件", "产品推广邮件", "客户关怀邮件", "节日促销邮件", "满意度调查邮件", "会员续费提醒"]
+
+
+def _random_name(rng: random.Random, number: int) -> str:
+    """生成不重复的客户/用户名称(名称唯一, 最长20个字符)"""
+    given = "".join(rng.choice(_GIVEN_NAMES) for _ in range(rng.randint(1, 2)))
+    return f"{rng.choice(_SURNAMES)}{given}{number}"
+
+
+def _random_time(rng: random.Random, now: datetime, days: int = 365) -> datetime:
+    return now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+
+
+def _next_number(session: Session, model) -> int:
+    """
+    从当前最大ID之后开始编号, 编号直接作为新行的ID(不需要 RETURNING 取回ID),
+    并保证重复执行时生成的名称和邮箱不冲突
+    """
+    return (session.exec(select(func.max(model.id))).one() or 0) + 1
+
+
+def generate_data(
+    users: int,
+    customers: int,
+    tags_per_customer: int,
+    tasks: int,
+    tag_count: int = 200,
+    blacklist_ratio: float = 0.05,
+    pending_ratio: float = 0.0,
+    seed: int = 42,
+) -> Dict[str, int]:
+    """
+    批量生成测试数据(可重复执行, 数据追加到现有数据之后)
+    所有用户共用一个预先计算好的bcrypt哈希, 不会为每个用户单独计算;
+    使用Core层批量INSERT(executemany)并显式指定ID, 每块一个事务
+    :param tags_per_customer: 每个客户的标签数量(从 tag_count 个标签中随机选取)
+    :param pending_ratio: 邮件任务中"待处理"的比例, 其余为发送成功/失败(默认0, 避免启动后执行器开始发送)
+    :return: 各类数据的生成数量
+    :raises ValueError: 需要生成客户, 但数据库中没有用户且 users 为0
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    passwd_hash = get_passwd_hash(GENERATED_USER_PASSWD)
+    tag_pool = [f"{rng.choice(_TAG_CATEGORIES)}{index}" for index in range(max(tag_count, 1))]
+    tags_per_customer = min(tags_per_customer, len(tag_pool))
+    started_at = time.perf_counter()
+
+    with Session(engine) as session:
+        # 用户
+        first_number = _next_number(session, User)
+        user_emails: List[str] = []
+        user_ids: List[int] = []
+        for start in range(0, users, GENERATE_CHUNK_SIZE):
+            rows = []
+            for number in range(first_number + start, first_number + min(start + GENERATE_CHUNK_SIZE, users)):
+                created_at = _random_time(rng, now)
+                rows.append(
+                    {
+                        "id": number,
+                        "name": f"user{number}",
+                        "passwd": passwd_hash,
+                        "email": f"user{number}@{rng.choice(_EMAIL_DOMAINS)}",
+                        "is_active": rng.random() > 0.05,
+                        "is_admin": rng.random() < 0.02,
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                        "last_login": _random_time(rng, now, days=30),
+                    }
+                )
+            session.exec(insert(User.__table__), params=rows)  # type: ignore
+            user_ids.extend(row["id"] for row in rows)
+            user_emails.extend(row["email"] for row in rows)
+            session.commit()
+        if not user_ids:
+            user_ids = list(session.exec(select(User.id).limit(1000)).all())  # type: ignore
+            user_emails = list(session.exec(select(User.email).limit(1000)).all())
+        if customers and not user_ids:
+            # 客户的 created_by 不能为空, 必须至少有一个用户作为创建者
+            raise ValueError("数据库中没有用户, 无法生成客户, 请同时生成用户(--users 大于0)")
+        logger.info(f"已生成 {users} 个用户")
+
+        # 客户和标签索引
+        first_number = _next_number(session, Customer)
+        customer_emails: List[str] = []
+        for start in range(0, customers, GENERATE_CHUNK_SIZE):
+            rows = []
+            for number in range(first_number + start, first_number + min(start + GENERATE_CHUNK_SIZE, customers)):
+                created_at = _random_time(rng, now)
+                rows.append(
+                    {
+                        "id": number,
+                        "name": _random_name(rng, number),
+                        "email": f"customer{number}@{rng.choice(_EMAIL_DOMAINS)}",
+                        "is_blacklist": rng.random() < blacklist_ratio,
+                        "tags": rng.sample(tag_pool, k=tags_per_customer),
+                        "created_by": rng.choice(user_ids),
+                        "created_at": created_at,
+                        "updated_at": created_at,
+                    }
+                )
+            session.exec(insert(Customer.__table__), params=rows)  # type: ignore
+            tag_rows = [
+                {"tag": tag, "customer_id": row["id"]} for row in rows for tag in row["tags"]
+            ]
+            if tag_rows:
+                session.exec(insert(CustomerTag.__table__), params=tag_rows)  # type: ignore
+            session.commit()
+            customer_emails.extend(row["email"] for row in rows if not row["is_blacklist"])
+            logger.info(f"已生成 {min(start + GENERATE_CHUNK_SIZE, customers)}/{customers} 个客户")
+        if not customer_emails:
+            customer_emails = list(
+                session.exec(
+                    select(Customer.email).where(Customer.is_blacklist == False).limit(10000)  # noqa: E712
+                ).all()
+            )
+
+        # 邮件任务
+        generated_tasks = 0
+        if customer_emails and user_emails:
+            finished_statuses = [TASK_STATUS_SUCCESS] * 19 + [TASK_STATUS_FAILED]
+            # 每个推广任务的邮件内容只保存一份
+            content_ids = {
+                campaign: get_or_create_email_content(
+                    session, Email(subject=campaign, body=f"<h1>{campaign}</h1><p>测试邮件内容</p>")
+                )
+                for campaign in _CAMPAIGNS
+            }
+            for start in range(0, tasks, GENERATE_CHUNK_SIZE):
+                rows = []
+                for _ in range(start, min(start + GENERATE_CHUNK_SIZE, tasks)):
+                    created_at = _random_time(rng, now)
+                    pending = rng.random() < pending_ratio
+                    campaign = rng.choice(_CAMPAIGNS)
+                    rows.append(
+                        {
+                            "name": campaign,
+                            "status": TASK_STATUS_PENDING if pending else rng.choice(finished_statuses),
+                            "send_by": rng.choice(user_emails),
+                            "send_to": rng.choice(customer_emails),
+                            "content_id": content_ids[campaign],
+                            "created_at": created_at,
+                            "sended_at": created_at
+                            if pending
+                            else created_at + timedelta(seconds=rng.randint(1, 3600)),
+                        }
+                    )
+                session.exec(insert(EmailTask.__table__), params=rows)  # type: ignore
+                session.commit()
+                generated_tasks += len(rows)
+                logger.info(f"已生成 {generated_tasks}/{tasks} 个邮件任务")
+        elif tasks:
+            logger.warning("没有可发送的客户或用户，跳过邮件任务生成")
+
+    logger.info(f"测试数据生成完成, 耗时 {time.perf_counter() - started_at:.1f}s")
+    return {"users": users, "customers": customers, "tasks": generated_tasks}
+
+
+if __name__ == "__main__":
+    # python -m crm_backend.db.init_data --users 100 --customers 1000000 --tags-per-customer 3 --tasks 2000000
+    parser = argparse.ArgumentParser(description="批量生成测试数据")
+    parser.add_argument("--users", type=int, default=100, help="用户数量")
+    parser.add_argument("--customers", type=int, default=10000, help="客户数量")
+    parser.add_argument("--tags-per-customer", type=int, default=3, help="每个客户的标签数量")
+    parser.add_argument("--tag-count", type=int, default=200, help="标签种类数量")
+    parser.add_argument("--tasks", type=int, default=10000, help="邮件任务数量")
+    parser.add_argument("--blacklist-ratio", type=float, default=0.05, help="黑名单客户比例")
+    parser.add_argument("--pending-ratio", type=float, default=0.0, help="待处理邮件任务比例")
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    generate_data(
+        users=args.users,
+        customers=args.customers,
+        tags_per_customer=args.tags_per_customer,
+        tasks=args.tasks,
+        tag_count=args.tag_count,
+        blacklist_ratio=args.blacklist_ratio,
+        pending_ratio=args.pending_ratio,
+        seed=args.seed,
+    )
@@ -0,0 +1,159 @@
+from typing import Dict, Optional
+from loguru import logger
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from crm_backend.db.db import engine
+from crm_backend.models.row_counter import (
+    COUNTER_CUSTOMERS,
+    COUNTER_CUSTOMERS_BY_TAG,
+    COUNTER_TASKS_BY_SENDER,
+    COUNTER_TASKS_BY_STATUS,
+    COUNTER_USERS,
+    RowCounter,
+)
+
+
+# 行数计数器
+# 计数由 customer、customertag、emailtask、user 表上的触发器维护, 与数据本身的写入在同一个事务中,
+# 所有写入路径(接口、批量导入、批量创建任务、执行器更新状态)都会自动更新, 读取计数是一次主键查询.
+# 触发器新建时(首次启动或从旧版本升级)按各表的实际数据重建一次, 修正触发器创建之前写入的数据;
+# 之后的启动只做一次廉价的一致性检查(用户数和客户数), 不一致时才重建
+
+
+def _increment(kind: str, key: str) -> str:
+    return (
+        f"INSERT INTO rowcounter(kind, key, value) VALUES ('{kind}', {key}, 1) "
+        "ON CONFLICT(kind, key) DO UPDATE SET value = value + 1;"
+    )
+
+
+def _decrement(kind: str, key: str) -> str:
+    return f"UPDATE rowcounter SET value = value - 1 WHERE kind = '{kind}' AND key = {key};"
+
+
+def _trigger(name: str, event: str, table: str, body: str, when: str = "") -> str:
+    when_clause = f" WHEN {when}" if when else ""
+    return (
+        f'CREATE TRIGGER IF NOT EXISTS {name} {event} ON "{table}"{when_clause} BEGIN\n'
+        f"    {body}\nEND"
+    )
+
+
+_COUNTER_TRIGGERS = [
+    _trigger("rowcounter_customer_ai", "AFTER INSERT", "customer", _increment(COUNTER_CUSTOMERS, "''")),
+    _trigger("rowcounter_customer_ad", "AFTER DELETE", "customer", _decrement(COUNTER_CUSTOMERS, "''")),
+    _trigger("rowcounter_user_ai", "AFTER INSERT", "user", _increment(COUNTER_USERS, "''")),
+    _trigger("rowcounter_user_ad", "AFTER DELETE", "user", _decrement(COUNTER_USERS, "''")),
+    # 客户标签以标签索引表为准(每个(标签, 客户)一行), 客户改标签时是删除旧行再插入新行
+    _trigger(
+        "rowcounter_customertag_ai", "AFTER INSERT", "customertag",
+        _increment(COUNTER_CUSTOMERS_BY_TAG, "new.tag"),
+    ),
+    _trigger(
+        "rowcounter_customertag_ad", "AFTER DELETE", "customertag",
+        _decrement(COUNTER_CUSTOMERS_BY_TAG, "old.tag"),
+    ),
+    _trigger(
+        "rowcounter_customertag_au", "AFTER UPDATE OF tag", "customertag",
+        _decrement(COUNTER_CUSTOMERS_BY_TAG, "old.tag") + _increment(COUNTER_CUSTOMERS_BY_TAG, "new.tag"),
+        when="old.tag IS NOT new.tag",
+    ),
+    _trigger(
+        "rowcounter_emailtask_ai", "AFTER INSERT", "emailtask",
+        _increment(COUNTER_TASKS_BY_STATUS, "new.status") + _increment(COUNTER_TASKS_BY_SENDER, "new.send_by"),
+    ),
+    _trigger(
+        "rowcounter_emailtask_ad", "AFTER DELETE", "emailtask",
+        _decrement(COUNTER_TASKS_BY_STATUS, "old.status") + _decrement(COUNTER_TASKS_BY_SENDER, "old.send_by"),
+    ),
+    _trigger(
+        "rowcounter_emailtask_au_status", "AFTER UPDATE OF status", "emailtask",
+        _decrement(COUNTER_TASKS_BY_STATUS, "old.status") + _increment(COUNTER_TASKS_BY_STATUS, "new.status"),
+        when="old.status IS NOT new.status",
+    ),
+    _trigger(
+        "rowcounter_emailtask_au_sender", "AFTER UPDATE OF send_by", "emailtask",
+        _decrement(COUNTER_TASKS_BY_SENDER, "old.send_by") + _increment(COUNTER_TASKS_BY_SENDER, "new.send_by"),
+        when="old.send_by IS NOT new.send_by",
+    ),
+]
+
+# 按各表的实际数据重新计算全部计数器
+_REBUILD_SQL = [
+    "DELETE FROM rowcounter",
+    f"INSERT INTO rowcounter(kind, key, value) SELECT '{COUNTER_CUSTOMERS}', '', count(*) FROM customer",
+    f'INSERT INTO rowcounter(kind, key, value) SELECT \'{COUNTER_USERS}\', \'\', count(*) FROM "user"',
+    f"INSERT INTO rowcounter(kind, key, value) "
+    f"SELECT '{COUNTER_CUSTOMERS_BY_TAG}', tag, count(*) FROM customertag GROUP BY tag",
+    f"INSERT INTO rowcounter(kind, key, value) "
+    f"SELECT '{COUNTER_TASKS_BY_STATUS}', status, count(*) FROM emailtask GROUP BY status",
+    f"INSERT INTO rowcounter(kind, key, value) "
+    f"SELECT '{COUNTER_TASKS_BY_SENDER}', send_by, count(*) FROM emailtask GROUP BY send_by",
+]
+
+
+# 一致性检查: 用户表很小, 客户表的 count(*) 走最小的索引; 任一计数与实际行数不符时重建
+_CHECK_SQL = (
+    f"SELECT (SELECT count(*) FROM \"user\") = "
+    f"(SELECT coalesce(sum(value), 0) FROM rowcounter WHERE kind = '{COUNTER_USERS}') "
+    f"AND (SELECT count(*) FROM customer) = "
+    f"(SELECT coalesce(sum(value), 0) FROM rowcounter WHERE kind = '{COUNTER_CUSTOMERS}')"
+)
+
+
+def ensure_row_counters():
+    """
+    创建计数器触发器(已存在时跳过)
+    触发器有缺失(首次启动或从旧版本升级)或一致性检查不通过时, 按实际数据重建全部计数;
+    多个进程同时启动时, 只有第一个创建触发器的进程重建
+    """
+    with Session(engine) as session:
+        connection = session.connection()
+        existing = connection.exec_driver_sql(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'rowcounter_*'"
+        ).scalar_one()
+        for ddl in _COUNTER_TRIGGERS:
+            connection.exec_driver_sql(ddl)
+        if existing < len(_COUNTER_TRIGGERS):
+            logger.info("计数器触发器是新建的, 开始重建行数计数器...")
+        elif not connection.exec_driver_sql(_CHECK_SQL).scalar_one():
+            logger.warning("行数计数器与实际数据不一致, 开始重建...")
+        else:
+            session.commit()
+            return
+        for sql in _REBUILD_SQL:
+            connection.exec_driver_sql(sql)
+        session.commit()
+    logger.info("行数计数器重建完成")
+
+
+def counter_statement(kind: str, key: Optional[str] = None):
+    """
+    读取计数的查询, 结果总是一行一个整数
+    不传 key 时返回该类型所有键的合计(例如全部状态的邮件任务数)
+    同步会话用 session.exec(...).one(), 异步会话用 (await session.exec(...)).one()
+    """
+    statement = select(func.coalesce(func.sum(RowCounter.value), 0)).where(
+        RowCounter.kind == kind
+    )
+    if key is not None:
+        statement = statement.where(RowCounter.key == key)
+    return statement
+
+
+def read_counter(session: Session, kind: str, key: Optional[str] = None) -> int:
+    return session.exec(counter_statement(kind, key)).one()
+
+
+def counters_by_key_statement(kind: str):
+    """某类型下每个键的计数(跳过已经减为0的键), 按计数从大到小排列"""
+    return (
+        select(RowCounter.key, RowCounter.value)
+        .where(RowCounter.kind == kind, RowCounter.value > 0)
+        .order_by(RowCounter.value.desc(), RowCounter.key)  # type: ignore
+    )
+
+
+def read_counters_by_key(session: Session, kind: str) -> Dict[str, int]:
+    return dict(session.exec(counters_by_key_statement(kind)).all())  # type: ignore
@@ -0,0 +1,113 @@
+import sqlite3
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from typing import Any, List, Optional, Tuple
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from crm_backend.utils.config import load_config
+
+
+config = load_config()
+
+# 同一个请求中同一条SQL执行达到该次数时, 认为可能存在N+1查询
+REPEATED_STATEMENT_THRESHOLD = 10
+# 慢查询日志中参数的最大长度, 批量写入的参数可能有上千行
+MAX_LOGGED_PARAMS_LENGTH = 500
+
+
+class SqlRequestStats:
+    """一个请求内执行的SQL条数、总耗时以及每条SQL的执行次数"""
+
+    __slots__ = ("statements", "total_time", "statement_counts", "closed")
+
+    def __init__(self):
+        self.statements = 0
+        self.total_time = 0.0
+        self.statement_counts: Counter = Counter()
+        self.closed = False  # 响应发送完后不再统计(例如后台任务中的SQL)
+
+    def record(self, statement: str, elapsed: float):
+        self.statements += 1
+        self.total_time += elapsed
+        self.statement_counts[statement] += 1
+
+    def repeated_statements(self) -> List[Tuple[str, int]]:
+        return [
+            (statement, count)
+            for statement, count in self.statement_counts.items()
+            if count >= REPEATED_STATEMENT_THRESHOLD
+        ]
+
+
+# 当前请求的SQL统计; FastAPI 在线程池中执行同步路由时会复制上下文, 因此线程中的查询也能统计到
+_request_stats: ContextVar[Optional[SqlRequestStats]] = ContextVar(
+    "sql_request_stats", default=None
+)
+
+
+def start_request_stats() -> Tuple[SqlRequestStats, Token]:
+    stats = SqlRequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request_stats(token: Token):
+    _request_stats.reset(token)
+
+
+def _format_params(parameters: Any) -> str:
+    text = repr(parameters)
+    if len(text) > MAX_LOGGED_PARAMS_LENGTH:
+        return text[:MAX_LOGGED_PARAMS_LENGTH] + "...(已截断)"
+    return text
+
+
+def _full_scans(cursor: Any, statement: str, parameters: Any) -> List[str]:
+    """用 EXPLAIN QUERY PLAN 找出慢查询中没有走索引的全表扫描"""
+    if not isinstance(cursor, sqlite3.Cursor):
+        return []
+    try:
+        plan_cursor = cursor.connection.cursor()
+        plan = plan_cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        plan_cursor.close()
+    except sqlite3.Error:
+        return []
+    return [
+        row[-1]
+        for row in plan
+        if str(row[-1]).startswith("SCAN ")
+        and "USING" not in str(row[-1])
+        and "VIRTUAL TABLE" not in str(row[-1])  # 全文检索等虚拟表按自己的索引查询
+    ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_sql_started_at", None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+
+    stats = _request_stats.get()
+    if stats is not None and not stats.closed:
+        stats.record(statement, elapsed)
+
+    if elapsed * 1000 >= config.SQL_SLOW_QUERY_MS:
+        message = f"慢查询 {elapsed * 1000:.1f}ms: {statement} 参数: {_format_params(parameters)}"
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            scans = _full_scans(cursor, statement, parameters)
+            if scans:
+                message += f" 全表扫描: {'; '.join(scans)}"
+        logger.warning(message)
+
+
+def install_sql_profiler(engine: Engine):
+    """给引擎注册SQL执行事件, 统计每个请求的SQL条数和耗时, 并记录慢查询"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -1,7 +1,7 @@
 from fastapi import Request
 
 from crm_backend.models.crm_http_exception import CrmHTTPException
-from crm_backend.utils.jwt import jwt_decode
+from crm_backend.utils.token_cache import token_cache
 
 
 def check_auth_M(request: Request):
@@ -10,8 +10,8 @@ def check_auth_M(request: Request):
     if not token:
         raise CrmHTTPException(status_code=400, detail="授权token不存在, 拒绝访问!!!")
 
-    # 只判断是否没过期合法, 解析出来的值暂时用不上, 用_表示忽略
-    is_valid, decodedata = jwt_decode(token)
+    # 判断是否没过期合法, 同一个token重复请求时命中缓存, 跳过签名校验
+    is_valid, decodedata = token_cache.decode(token)
 
     if not is_valid:
         raise CrmHTTPException(status_code=400, detail="授权token合法, 拒绝访问!!!")
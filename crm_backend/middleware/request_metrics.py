@@ -0,0 +1,46 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from crm_backend.utils.metrics import UNMATCHED_ROUTE, RequestMetrics
+
+
+class RequestMetricsMiddleware:
+    """
+    记录请求耗时、状态码和并发数的ASGI中间件
+
+    直接实现ASGI接口而不是使用 BaseHTTPMiddleware, 不会额外创建任务或包装请求体,
+    流式响应也按完整发送结束计时. 路由模板在请求处理完后从 scope["route"] 读取
+    (由路由匹配时写入), 因此同一个路由的不同路径参数会归到同一组指标
+    """
+
+    def __init__(self, app: ASGIApp, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.metrics.request_started()
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            self.metrics.request_finished(
+                scope["method"],
+                route_path,
+                status_code,
+                time.perf_counter() - started_at,
+            )
@@ -0,0 +1,59 @@
+from loguru import logger
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from crm_backend.db.sql_profiler import end_request_stats, start_request_stats
+from crm_backend.utils.config import load_config
+
+
+config = load_config()
+
+
+class SqlProfilerMiddleware:
+    """
+    按请求统计SQL执行情况的ASGI中间件
+
+    请求结束后, SQL条数超过 SQL_STATEMENT_BUDGET 或同一条SQL重复执行多次(疑似N+1)时输出警告;
+    DEBUG 模式下在响应头 X-SQL-Stats 中返回本次请求的SQL条数和耗时
+    (响应头发出之后执行的SQL, 例如流式导出中的查询, 只计入日志)
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = start_request_stats()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and config.DEBUG:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (
+                        b"x-sql-stats",
+                        f"statements={stats.statements}; time_ms={stats.total_time * 1000:.2f}".encode(),
+                    )
+                ]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                stats.closed = True  # 之后执行的是后台任务, 不计入本次请求
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stats.closed = True
+            end_request_stats(token)
+            request_line = f"[{scope['method']}]{scope['path']}"
+            budget = config.SQL_STATEMENT_BUDGET
+            if budget > 0 and stats.statements > budget:
+                logger.warning(
+                    f"{request_line} 执行了 {stats.statements} 条SQL, 超出预算 {budget} 条, "
+                    f"SQL总耗时 {stats.total_time * 1000:.1f}ms"
+                )
+            for statement, count in stats.repeated_statements():
+                logger.warning(f"{request_line} 同一条SQL执行了 {count} 次, 可能存在N+1查询: {statement}")
+            if config.DEBUG:
+                logger.debug(
+                    f"{request_line} SQL {stats.statements} 条, 耗时 {stats.total_time * 1000:.1f}ms"
+                )
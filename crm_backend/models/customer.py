@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import Field, SQLModel
 
 
@@ -17,13 +17,25 @@ class Customer(CustomerBase, table=True):
     created_by: int
     tags: list[str] = Field(sa_column=Column(JSON), default=[], description="客户标签")
     created_at: datetime = Field(
-        default_factory=datetime.utcnow, description="创建时间"
+        default_factory=datetime.utcnow, description="创建时间", index=True
     )
     updated_at: datetime = Field(
         default_factory=datetime.utcnow, description="更新时间"
     )
 
 
+# 客户标签索引表: Customer.tags 的规范化副本, 每个(标签, 客户)一行
+# 主键 (tag, customer_id) 本身就是按标签查找客户的索引, 按标签筛选时只会扫描命中的行
+# 由 crm_backend/db/customer_tags.py 在客户创建、更新、删除时同步维护
+class CustomerTag(SQLModel, table=True):
+    __table_args__ = (Index("ix_customertag_customer_id", "customer_id"),)
+
+    tag: str = Field(primary_key=True, description="标签名称")
+    customer_id: int = Field(
+        primary_key=True, foreign_key="customer.id", description="客户ID"
+    )
+
+
 class CustomerPublic(CustomerBase):
     id: int
     name: str
@@ -42,6 +54,14 @@ class CustomerUpdate(CustomerBase):
     )
 
 
+# 批量导入时每一行客户数据的校验模型(不是表模型, 所以会执行字段校验)
+class CustomerImportRow(SQLModel):
+    name: str = Field(min_length=1, max_length=20, description="客户名称")
+    email: str = Field(min_length=3, max_length=255, description="邮箱")
+    is_blacklist: bool = Field(default=False, description="是否黑名单")
+    tags: list[str] = Field(default=[], description="客户标签")
+
+
 class CustomerUpdateReq(BaseModel):
     update_key: List[str] = Field(description="需要更新的字段列表")
     update_Customer: CustomerUpdate = Field(description="需要更新的用户数据")
@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+# 批量邮件任务作业状态
+JOB_STATUS_QUEUED = "排队中"
+JOB_STATUS_RUNNING = "处理中"
+JOB_STATUS_DONE = "已完成"
+JOB_STATUS_FAILED = "失败"
+
+
+# 异步批量创建邮件任务的作业, 记录收件人分块展开的进度
+# 已发送/发送失败等数量由 EmailTask.job_id 关联的任务实时统计, 不存放在这里
+class EmailBatchJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(max_length=100, description="推广任务名称")
+    status: str = Field(
+        default=JOB_STATUS_QUEUED, description="作业状态(排队中/处理中/已完成/失败)"
+    )
+    created_by: str = Field(description="创建作业的用户邮箱")
+    total_customers: int = Field(default=0, description="已处理的客户数量")
+    created_count: int = Field(default=0, description="已创建的邮件任务数量")
+    skipped_count: int = Field(default=0, description="因黑名单跳过的客户数量")
+    error: Optional[str] = Field(default=None, description="作业失败原因")
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow, description="创建时间"
+    )
+    finished_at: Optional[datetime] = Field(default=None, description="完成时间")
+    # 作业租约: 作业在创建它的进程中后台执行, 该进程的执行器定时续期;
+    # 进程退出后租约过期, 其他进程(或重启后的进程)把作业标记为失败
+    lease_owner: Optional[str] = Field(
+        default=None, max_length=100, description="执行作业的执行器ID"
+    )
+    lease_expires_at: Optional[datetime] = Field(
+        default=None, description="租约到期时间(UTC), 执行器运行期间定时续期"
+    )
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+from crm_backend.models.email_task import Email
+
+
+# 邮件内容(按内容寻址): 同样的主题、正文和模板标记只保存一份, 由 hash(内容的SHA-256) 唯一确定
+# 邮件任务通过 EmailTask.content_id 引用, 一次批量发送不论多少收件人, 正文都只写入一次
+# 内容写入后不再修改, 可以放心缓存
+class EmailContent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    hash: str = Field(max_length=64, unique=True, description="内容的SHA-256(十六进制)")
+    subject: str = Field(max_length=255, description="邮件主题")
+    body: str = Field(description="邮件内容(支持HTML格式)")
+    use_template: bool = Field(default=False, description="主题和内容是否为模板")
+    created_at: datetime = Field(
+        default_factory=datetime.utcnow, description="创建时间"
+    )
+
+    def to_email(self) -> Email:
+        return Email(subject=self.subject, body=self.body, use_template=self.use_template)
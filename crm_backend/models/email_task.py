@@ -1,38 +1,74 @@
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import Field, SQLModel
 
 
+# 邮件任务状态
+TASK_STATUS_PENDING = "待处理"
+TASK_STATUS_SENDING = "发送中"
+TASK_STATUS_SUCCESS = "发送成功"
+TASK_STATUS_FAILED = "发送失败"
+
+
 class Email(SQLModel):
     subject: str = Field(max_length=255, description="邮件主题")
     body: str = Field(description="邮件内容(支持HTML格式)")
+    use_template: bool = Field(
+        default=False,
+        description='主题和内容是否为模板(支持 {{customer.name}} 等合并字段和 {% if tag "标签" %} 条件), 发送时按收件客户渲染',
+    )
 
     def dict(self) -> Dict[str, Any]:
-        return {"subject": self.subject, "body": self.body}
+        email = {"subject": self.subject, "body": self.body}
+        if self.use_template:
+            email["use_template"] = True
+        return email
 
 
 class EmailTask(SQLModel, table=True):
+    # 按批量作业统计各状态的任务数量时使用
+    __table_args__ = (Index("ix_emailtask_job_id_status", "job_id", "status"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(max_length=100, description="推广任务名称")
     status: str = Field(
-        default="待处理", description="任务状态(待处理/发送中/发送成功/发送失败)"
+        default="待处理",
+        description="任务状态(待处理/发送中/发送成功/发送失败)",
+        index=True,
     )
     send_by: str = Field(description="用户邮箱")
     send_to: str = Field(
         description="发送对象邮箱",
     )
-    email: Dict[str, Any] = Field(
-        sa_column=Column(JSON), description="邮件内容，包含主题和正文"
+    email: Optional[Dict[str, Any]] = Field(
+        default=None,
+        sa_column=Column(JSON),
+        description="邮件内容，包含主题和正文(旧数据; 新任务的内容保存在 EmailContent 中, 这里为空)",
+    )
+    content_id: Optional[int] = Field(
+        default=None, foreign_key="emailcontent.id", description="邮件内容ID"
     )
     created_at: datetime = Field(
-        default_factory=datetime.utcnow, description="创建时间"
+        default_factory=datetime.utcnow, description="创建时间", index=True
     )
     sended_at: datetime = Field(
         default_factory=datetime.utcnow,
         description="发送时间(如果任务状态为发送成功或发送失败时才有值)",
     )
+    job_id: Optional[int] = Field(
+        default=None,
+        description="所属的异步批量作业ID(单独创建或同步批量创建的任务为空)",
+    )
+    # 任务租约: 执行器按批认领任务时写入, 多个进程(或主机)共享同一个数据库时,
+    # 只有持有未过期租约的执行器会发送该任务; 进程崩溃后租约过期, 任务由其他执行器重新认领
+    lease_owner: Optional[str] = Field(
+        default=None, max_length=100, index=True, description="认领任务的执行器ID"
+    )
+    lease_expires_at: Optional[datetime] = Field(
+        default=None, description="租约到期时间(UTC), 执行器运行期间定时续期"
+    )
 
     # 添加便捷方法来处理 Email 对象
     def set_email(self, email: Email):
@@ -48,7 +84,10 @@ class EmailTask(SQLModel, table=True):
 
 class BatchEmailTaskRequest(SQLModel):
     name: str = Field(max_length=100, description="推广任务名称")
-    email: Email = Field(description="邮件内容，包含主题和正文")
+    email: Optional[Email] = Field(default=None, description="邮件内容，包含主题和正文")
+    content_id: Optional[int] = Field(
+        default=None, description="引用已有的邮件内容ID(不传 email 时使用, 重复发送同一推广内容)"
+    )
     send_customer_by_tags: Optional[List[str]] = Field(
         default=[],
         description="按客户标签决定批量发送给对应包含了该标签的客户",
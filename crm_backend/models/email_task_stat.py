@@ -0,0 +1,18 @@
+from sqlmodel import Field, SQLModel
+
+
+# 邮件任务统计维度
+STAT_BY_NAME = "name"  # 按推广任务名称(key 为任务名称)
+STAT_BY_SENDER = "send_by"  # 按发送人(key 为用户邮箱)
+STAT_BY_SENDED_HOUR = "sended_hour"  # 按发送时间所在小时(key 形如 2025-01-01 08:00, 只统计已发送完成的任务)
+STAT_BY_JOB = "job"  # 按异步批量作业(key 为作业ID)
+
+
+# 邮件任务分维度的状态统计: 每个(维度, 键, 状态)一行, 由 emailtask 表上的触发器在任务创建、
+# 状态变化、删除时同步维护, 看板直接读取, 不再对整张邮件任务表 GROUP BY
+# 见 crm_backend/db/email_task_stats.py
+class EmailTaskStat(SQLModel, table=True):
+    dimension: str = Field(primary_key=True, description="统计维度")
+    key: str = Field(primary_key=True, description="维度取值")
+    status: str = Field(primary_key=True, description="任务状态")
+    value: int = Field(default=0, description="任务数量")
@@ -0,0 +1,18 @@
+from sqlmodel import Field, SQLModel
+
+
+# 计数器类型
+COUNTER_CUSTOMERS = "customers"  # 客户总数
+COUNTER_CUSTOMERS_BY_TAG = "customers_by_tag"  # 每个标签的客户数(key 为标签)
+COUNTER_USERS = "users"  # 用户总数
+COUNTER_TASKS_BY_STATUS = "email_tasks_by_status"  # 每个状态的邮件任务数(key 为状态)
+COUNTER_TASKS_BY_SENDER = "email_tasks_by_sender"  # 每个发送人的邮件任务数(key 为用户邮箱)
+
+
+# 行数计数器: 每个(类型, 键)一行, 由数据库触发器在增删改时同步维护
+# 列表总数、统计接口直接读取这里的计数, 不再对整张表 count(*)
+# 见 crm_backend/db/row_counters.py
+class RowCounter(SQLModel, table=True):
+    kind: str = Field(primary_key=True, description="计数器类型")
+    key: str = Field(default="", primary_key=True, description="计数键(总数类计数器为空)")
+    value: int = Field(default=0, description="行数")
@@ -14,6 +14,45 @@ class Config(BaseModel):
     LOG_FILE_PATH: str
     LOG_FILE_FORMAT: str
     INIT_SAMPLE_DATA: bool = True  # 是否初始化示例数据
+    DB_ASYNC: bool = False  # 热点查询接口是否使用异步数据库驱动(aiosqlite)
+    SQLITE_WAL: bool = True  # 是否启用WAL日志模式(读写互不阻塞)
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # PRAGMA synchronous, WAL模式下NORMAL即可保证一致性
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 遇到数据库锁时的等待时间(毫秒)
+    SQLITE_MMAP_SIZE: int = 268435456  # 内存映射读取的大小(字节), 0表示不使用
+    SQLITE_CACHE_SIZE: int = -65536  # 每个连接的页缓存大小, 负数表示KiB(默认64MB)
+    SQLITE_READ_POOL_SIZE: int = 8  # 只读连接池的常驻连接数
+    SQLITE_TASK_POOL_TIMEOUT: float = 5.0  # 邮件执行器等待写连接的最长时间(秒)
+    EMAIL_QUEUE_REFILL_SIZE: int = 500  # 邮件队列每次从数据库取出的待处理任务ID数量上限
+    EMAIL_QUEUE_POLL_INTERVAL: float = 5.0  # 邮件队列空闲时轮询数据库的间隔(秒)
+    EMAIL_WORKER_COUNT: int = 8  # 并发发送邮件的worker数量
+    EMAIL_PREFETCH_PER_WORKER: int = 4  # 每个worker预先认领的任务数, 执行器最多持有 worker数量×该值 个未开始的任务
+    EMAIL_SENDER_CONCURRENCY: int = 0  # 同一发件人同时发送的邮件数上限(0表示不限制)
+    EMAIL_STATS_LOG_INTERVAL: float = 60.0  # 输出发送吞吐量统计日志的间隔(秒)
+    EMAIL_STATUS_FLUSH_INTERVAL: float = 0.5  # 邮件任务状态批量写入数据库的间隔(秒)
+    EMAIL_STATUS_FLUSH_BATCH_SIZE: int = 500  # 状态缓冲达到该数量时立即写入数据库
+    EMAIL_LEASE_SECONDS: float = 60.0  # 执行器认领任务的租约时长(秒), 每隔三分之一租约时长续期一次
+    EMAIL_WORKER_ID: str = ""  # 执行器ID(租约持有者), 为空时使用"主机名:进程号:随机串"
+    EMAIL_TEMPLATE_CACHE_SIZE: int = 256  # 已编译邮件模板的缓存数量
+    EMAIL_CONTENT_CACHE_SIZE: int = 64  # 执行器缓存的邮件内容数量(每次推广一份)
+    EMAIL_BACKEND: str = "simulated"  # 邮件发送方式(simulated: 模拟发送, smtp: 通过SMTP服务器发送)
+    SMTP_HOST: str = "localhost"  # SMTP服务器地址
+    SMTP_PORT: int = 25  # SMTP服务器端口
+    SMTP_SECURITY: str = "none"  # 连接加密方式(none/starttls/tls)
+    SMTP_USERNAME: str = ""  # SMTP登录用户名(为空表示不登录)
+    SMTP_PASSWORD: str = ""  # SMTP登录密码
+    SMTP_FROM: str = ""  # 发件人地址(为空时使用任务的发送人邮箱)
+    SMTP_POOL_SIZE: int = 8  # SMTP连接池大小(同时发送的连接数)
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = 100  # 单个连接发送该数量邮件后重建(0表示不限制)
+    SMTP_IDLE_TIMEOUT: float = 60.0  # 空闲超过该时间(秒)的连接不再复用
+    SMTP_TIMEOUT: float = 30.0  # 连接和每条命令的超时时间(秒)
+    SMTP_RETRY_ATTEMPTS: int = 2  # 网络错误或临时错误(4xx)时更换连接重试的次数
+    TOKEN_CACHE_SIZE: int = 10000  # 已验证token缓存的最大条目数(0表示不缓存)
+    PASSWD_HASH_WORKERS: int = 4  # 执行bcrypt计算的线程数
+    PASSWD_HASH_QUEUE_LIMIT: int = 64  # bcrypt计算排队数量上限, 超出时返回503
+    METRICS_ENABLED: bool = True  # 是否统计请求耗时并提供 /metrics 接口
+    DEBUG: bool = False  # 调试模式, 开启后在响应头 X-SQL-Stats 中返回每个请求的SQL统计
+    SQL_SLOW_QUERY_MS: float = 100.0  # 慢查询阈值(毫秒), 超过时记录SQL和参数
+    SQL_STATEMENT_BUDGET: int = 50  # 单个请求的SQL条数上限, 超过时输出警告(0表示不检查)
 
 
 def load_config() -> Config:
@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+from loguru import logger
+from sqlalchemy import bindparam, update
+from sqlmodel import Session
+
+from crm_backend.db.db import task_engine
+from crm_backend.models.email_task import TASK_STATUS_SENDING, EmailTask
+
+
+class EmailStatusWriter:
+    """
+    邮件任务状态的批量写入器(write-behind)
+
+    worker 只把状态变化放进内存缓冲区, 由写入器每隔 flush_interval 秒
+    或缓冲区达到 batch_size 条时, 在一个事务里批量UPDATE到数据库;
+    同一任务在一次刷新前的多次变化(发送中 -> 发送成功)只写最后一次.
+    数据库写入在线程池中执行, 不阻塞事件循环.
+    指定 lease_owner 时只写入仍由该执行器持有租约的任务(租约已被其他执行器收回的任务不覆盖),
+    最终状态写入的同时释放租约.
+    所有方法(除 flush_blocking 外)都必须在执行器的事件循环中调用
+    """
+
+    def __init__(
+        self,
+        flush_interval: float,
+        batch_size: int,
+        on_flushed: Optional[Callable[[Iterable[int]], None]] = None,
+        lease_owner: Optional[str] = None,
+    ):
+        self.flush_interval = flush_interval
+        self.lease_owner = lease_owner
+        self.lease_lost = 0  # 因租约已被收回而没有写入的状态数
+        self.batch_size = max(batch_size, 1)
+        self._on_flushed = on_flushed  # 写入成功后回调, 参数为已写入的任务ID
+        self._pending: Dict[int, Dict] = {}  # 任务ID -> 待写入的字段
+        self._full = asyncio.Event()  # 缓冲区已满, 需要立即刷新
+        self._flush_lock = asyncio.Lock()  # 保证刷新按顺序进行
+
+    def put(self, task_id: int, status: str):
+        """记录一次状态变化, 非"发送中"的状态同时记录发送时间"""
+        values: Dict = {"id": task_id, "status": status}
+        if status != TASK_STATUS_SENDING:
+            values["sended_at"] = datetime.utcnow()
+        previous = self._pending.get(task_id)
+        if previous and "sended_at" in previous and "sended_at" not in values:
+            return  # 已有最终状态, 不再被"发送中"覆盖
+        self._pending[task_id] = values
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, task_id: int) -> bool:
+        """任务是否还有状态没有写入数据库"""
+        return task_id in self._pending
+
+    async def run(self):
+        """定时刷新循环"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """把当前缓冲区写入数据库"""
+        async with self._flush_lock:
+            self._full.clear()
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, list(batch.values()))
+            except Exception as e:
+                logger.error(f"批量写入 {len(batch)} 个邮件任务状态失败, 稍后重试: {e}")
+                # 放回缓冲区, 刷新期间产生的新状态不会被旧值覆盖
+                batch.update(self._pending)
+                self._pending = batch
+                return
+            if self._on_flushed:
+                self._on_flushed(batch.keys())
+
+    def flush_blocking(self, loop: asyncio.AbstractEventLoop, timeout: float = 10.0):
+        """从其他线程(例如应用关闭时)刷新缓冲区, 并等待写入完成"""
+        asyncio.run_coroutine_threadsafe(self.flush(), loop).result(timeout=timeout)
+
+    def _write(self, rows: List[Dict]):
+        # 按主键批量UPDATE(executemany), 所有状态在一个事务里提交
+        # 只有"发送中"的行没有 sended_at, 需要分开两组执行
+        with Session(task_engine) as session:
+            sending = [row for row in rows if "sended_at" not in row]
+            finished = [row for row in rows if "sended_at" in row]
+            if self.lease_owner is None:
+                for group in (sending, finished):
+                    if group:
+                        session.exec(update(EmailTask), params=group)  # type: ignore
+                session.commit()
+                return
+
+            written = 0
+            for group, statement in (
+                (sending, self._leased_update(release=False)),
+                (finished, self._leased_update(release=True)),
+            ):
+                if group:
+                    written += session.exec(
+                        statement,  # type: ignore
+                        params=[{f"b_{key}": value for key, value in row.items()} for row in group],
+                    ).rowcount
+            session.commit()
+        if written < len(rows):
+            self.lease_lost += len(rows) - written
+            logger.warning(f"{len(rows) - written} 个邮件任务的租约已被收回, 状态没有写入")
+
+    def _leased_update(self, release: bool):
+        """
+        只更新仍由本执行器持有且租约未过期的任务; release 为真时(最终状态)同时释放租约
+        租约过期后任务可能已被其他执行器认领, 不能再覆盖它的状态
+        """
+        # 使用表对象(Core UPDATE), 按自定义参数 executemany, 不走ORM按主键批量更新
+        table = EmailTask.__table__  # type: ignore
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .where(table.c.lease_owner == self.lease_owner)
+            .where(table.c.lease_expires_at > datetime.utcnow())
+        )
+        if not release:
+            return statement.values(status=bindparam("b_status"))
+        return statement.values(
+            status=bindparam("b_status"),
+            sended_at=bindparam("b_sended_at"),
+            lease_owner=None,
+            lease_expires_at=None,
+        )
@@ -1,14 +1,41 @@
 import asyncio
-import random
 import threading
-from typing import List
-from crm_backend.db.db import engine
-from sqlmodel import Session
-from crm_backend.models.crm_http_exception import CrmHTTPException
-from crm_backend.models.email_task import EmailTask
+import time
+from datetime import datetime, timedelta
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+from crm_backend.db.customer_tags import normalize_tags
+from crm_backend.db.db import read_engine
+from crm_backend.db.email_content import task_email
+from crm_backend.db.email_task_batch import fail_interrupted_batch_jobs
+from crm_backend.db.email_task_lease import (
+    claim_email_tasks,
+    new_lease_owner,
+    reclaim_expired_email_tasks,
+    release_email_task_leases,
+    renew_batch_job_leases,
+    renew_email_task_leases,
+)
+from sqlmodel import Session, select
+from crm_backend.models.customer import Customer
+from crm_backend.models.email_task import (
+    TASK_STATUS_FAILED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SENDING,
+    TASK_STATUS_SUCCESS,
+    Email,
+    EmailTask,
+)
+from crm_backend.utils.config import load_config
+from crm_backend.utils.email_backend import create_email_backend
+from crm_backend.utils.email_status_writer import EmailStatusWriter
+from crm_backend.utils.email_template import RecipientContext, compile_email
 from loguru import logger
 
 
+config = load_config()
+
+
 # 单例装饰器-确保类只有一个实例
 # 避免创建多个任务执行器导致状态不一致
 def singleton(cls):
@@ -22,117 +49,416 @@ def singleton(cls):
     return wrapper
 
 
+class EmailSendStats:
+    """
+    邮件发送统计: 累计成功/失败数, 以及最近一个时间窗口内的吞吐量和平均耗时
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window  # 吞吐量统计窗口(秒)
+        self.started_at = time.monotonic()
+        self.succeeded = 0
+        self.failed = 0
+        # 最近完成的任务 (完成时间, 耗时), 超出窗口的记录在读取时丢弃
+        self._recent: Deque[Tuple[float, float]] = deque()
+        # 执行器线程写入, 请求线程读取, 需要加锁
+        self._lock = threading.Lock()
+
+    def record(self, is_success: bool, latency: float):
+        with self._lock:
+            if is_success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self._recent.append((time.monotonic(), latency))
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0][0] < now - self.window:
+                self._recent.popleft()
+            recent_count = len(self._recent)
+            total_latency = sum(latency for _, latency in self._recent)
+            succeeded, failed = self.succeeded, self.failed
+        window = min(self.window, max(now - self.started_at, 1e-6))
+        return {
+            "succeeded": succeeded,
+            "failed": failed,
+            "throughput_per_sec": round(recent_count / window, 3),
+            "avg_latency_sec": round(total_latency / recent_count, 3)
+            if recent_count
+            else 0.0,
+        }
+
+
 # 使用单例装饰器
 @singleton
 class EmailTaskExecer:
     """
     任务执行器，用于处理任务的执行逻辑
+
+    待执行的任务以数据库为准(EmailTask.status == 待处理, status 列有索引),
+    由一个分发协程按ID顺序从数据库认领一小批任务(写入租约)放入队列,
+    再由固定数量(EMAIL_WORKER_COUNT)的worker协程并发取出执行,
+    所以进程重启不会丢任务, 积压再多也不会把任务对象全部加载到内存
+
+    每个进程的执行器是独立的, 多个进程(或主机)共享同一个数据库时靠租约协调:
+    只发送自己认领到的任务, 定时续期, 状态只在仍持有租约时写入;
+    进程崩溃后它持有的任务在租约过期后由其他执行器重新认领
     """
 
-    def __init__(self, task_list: List[EmailTask] = []):
-        self.task_list: List[EmailTask] = task_list  # 待执行的任务列表
-        self._loop = None
+    def __init__(self):
+        self.worker_count = max(config.EMAIL_WORKER_COUNT, 1)
+        self.lease_owner = config.EMAIL_WORKER_ID or new_lease_owner()  # 租约持有者ID
+        self.lease_seconds = max(config.EMAIL_LEASE_SECONDS, 1.0)
+        # 执行器队列中最多持有的未开始任务数, 只认领空闲的容量,
+        # 避免一个进程囤积大量租约, 其他进程(或主机)分不到任务
+        prefetch = self.worker_count * max(config.EMAIL_PREFETCH_PER_WORKER, 1)
+        self.max_held = max(min(prefetch, config.EMAIL_QUEUE_REFILL_SIZE), 1)
+        # 分发协程与worker之间的队列, 队列满时分发协程等待(背压)
+        self._queue: asyncio.Queue[int] = asyncio.Queue(maxsize=self.max_held)
+        self._inflight: Set[int] = set()  # 已放入队列、正在执行或状态尚未落库的任务ID
+        self._executing: Set[int] = set()  # 正在执行的任务ID
+        self._last_id = 0  # 已认领的最大任务ID, 下一批从它之后开始认领
+        self._wakeup = asyncio.Event()  # 有新任务时唤醒分发协程
+        # 每个发件人正在发送的任务数, 以及因达到并发上限而暂存的任务ID(EMAIL_SENDER_CONCURRENCY > 0 时使用)
+        # 暂存的任务不占用worker, 同一发件人的任务发送完成后由该worker接着执行下一个暂存任务
+        self._sender_active: Dict[str, int] = {}
+        self._sender_parked: Dict[str, Deque[int]] = {}
+        self._parked: Set[int] = set()
+        self.stats = EmailSendStats()
+        self.backend = create_email_backend(config)  # 邮件发送后端(模拟发送或SMTP连接池)
+        # 状态变化先进入写入器的缓冲区, 批量写入数据库后才从 _inflight 中移除,
+        # 避免分发协程在状态落库前把同一个任务再取出来
+        self._status_writer = EmailStatusWriter(
+            flush_interval=config.EMAIL_STATUS_FLUSH_INTERVAL,
+            batch_size=config.EMAIL_STATUS_FLUSH_BATCH_SIZE,
+            on_flushed=self._on_status_flushed,
+            lease_owner=self.lease_owner,
+        )
+        self._loop = asyncio.new_event_loop()
         self._thread = None
-        # 获取数据库会话，用于操作数据库数据
-        self._session = Session(engine)
+        self._run_future = None
         self._start_background_loop()
 
     def _start_background_loop(self):
         """启动后台事件循环"""
 
         def run_loop():
-            self._loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self._loop)
             self._loop.run_forever()
 
         self._thread = threading.Thread(target=run_loop, daemon=True)
         self._thread.start()
 
-    def _update_task_status(self, task: EmailTask, new_status: str):
-        find_email_task = self._session.get(EmailTask, task.id)
-        if not find_email_task:
-            raise CrmHTTPException(
-                status_code=404,
-                detail=f"更新Task {task.id} - {task.name}失败，数据库没有该邮件任务",
-            )
-        new_task = find_email_task
-        new_task.status = new_status
-        find_email_task.sqlmodel_update(new_task)
-        self._session.commit()
-        self._session.refresh(find_email_task)
+    def start(self):
+        """
+        恢复租约已过期的任务并启动分发协程和worker, 需要在数据表创建之后调用
+        """
+        self._reclaim_expired_tasks()
+        self._run_future = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def stop(self):
+        """
+        应用关闭时调用: 停止分发协程和worker, 把缓冲区中的任务状态写入数据库,
+        释放还没开始发送的任务的租约(其他执行器可以立即认领; 被中断的"发送中"任务等租约过期后恢复),
+        最后关闭发送后端的连接
+        """
+        if self._run_future:
+            self._run_future.cancel()
+        self._status_writer.flush_blocking(self._loop)
+        released = release_email_task_leases(self.lease_owner)
+        if released:
+            logger.info(f"已释放 {released} 个待处理邮件任务的租约")
+        asyncio.run_coroutine_threadsafe(self.backend.close(), self._loop).result(timeout=10.0)
+
+    def _reclaim_expired_tasks(self):
+        """
+        租约已过期的"发送中"任务(持有者崩溃或失联)恢复为待处理重新排队,
+        只处理过期的租约, 不影响其他执行器正在发送的任务
+        """
+        first_id = reclaim_expired_email_tasks()
+        if first_id is not None:
+            logger.info(f"已恢复租约过期的邮件任务(最小ID {first_id})")
+            self._loop.call_soon_threadsafe(self._on_new_tasks, first_id)
+
+    def _free_capacity(self) -> int:
+        """
+        还可以认领的任务数: 队列的空位
+        暂存的任务不占队列(它们的发件人不会再被认领), 但数量达到持有上限时也暂停认领
+        """
+        if len(self._parked) >= self.max_held:
+            return 0
+        return self.max_held - self._queue.qsize()
+
+    def _on_capacity_freed(self):
+        # 队列每次只空出一个位置, 空位刚好达到一半、或暂存的任务刚好降到上限以下时, 唤醒分发协程认领下一批
+        if self._free_capacity() == (self.max_held + 1) // 2 or len(self._parked) == self.max_held - 1:
+            self._wakeup.set()
+
+    def _claim_pending_ids(self, limit: int, exclude_senders: List[str]) -> List[int]:
+        """按ID顺序从数据库认领下一批待处理任务, 跳过已达到并发上限的发件人"""
+        return claim_email_tasks(
+            self.lease_owner,
+            self.lease_seconds,
+            limit,
+            after_id=self._last_id,
+            exclude_senders=exclude_senders,
+        )
+
+    def _update_task_status(self, task_id: int, new_status: str):
+        """记录任务状态变化, 由状态写入器批量写入数据库"""
+        self._status_writer.put(task_id, new_status)
+
+    def _on_status_flushed(self, task_ids: Iterable[int]):
+        """状态已写入数据库, 已结束的任务不再需要占用 _inflight"""
+        for task_id in task_ids:
+            if task_id not in self._executing:
+                self._inflight.discard(task_id)
 
     def add_task(self, task: EmailTask):
         """
-        添加任务到待执行列表
+        通知执行器有新任务, 任务本身已经保存在数据库中
         :param task: EmailTask 实例
         """
-        self.task_list.append(task)
-        if self._loop:
-            asyncio.run_coroutine_threadsafe(self._delayed_execute(), self._loop)
+        self.add_task_range(task.id, task.id)  # type: ignore
         logger.debug(f"任务队列添加任务: {task.name}")
 
-    async def _delayed_execute(self):
-        """延迟执行任务"""
-        # 两秒之后开始执行任务
-        await asyncio.sleep(2)  # 两秒后执行
-        await self.execute()
+    def add_task_range(self, first_id: int, last_id: int):
+        """
+        通知执行器ID在 [first_id, last_id] 之间的新任务已经保存在数据库中
+        批量创建任务时只需要调用一次
+        """
+        self._loop.call_soon_threadsafe(self._on_new_tasks, first_id)
+        logger.debug(f"任务队列添加任务: {first_id} ~ {last_id}")
 
-    async def execute(self):
-        # 这里可以添加任务执行的具体逻辑
-        if not self.task_list:
-            raise ValueError("任务列表为空，无法执行任务。")
-        task = self.task_list.pop(0)  # 获取并移除第一个任务
+    def _on_new_tasks(self, first_id: int):
+        # 新任务的ID在已取出的范围之内时, 让分发协程从它之前开始取
+        if first_id <= self._last_id:
+            self._last_id = first_id - 1
+        self._wakeup.set()
+
+    def get_stats(self) -> Dict[str, float]:
+        """执行器当前状态和发送吞吐量"""
+        return {
+            "workers": self.worker_count,
+            "queued": self._queue.qsize(),
+            "inflight": len(self._inflight),
+            "parked": len(self._parked),
+            "pending_status_writes": self._status_writer.pending_count(),
+            "lease_lost": self._status_writer.lease_lost,
+            **self.stats.snapshot(),
+            **self.backend.stats(),
+        }
+
+    async def _run(self):
+        """启动分发协程、worker和统计日志"""
+        await asyncio.gather(
+            self._dispatch(),
+            self._log_stats(),
+            self._status_writer.run(),
+            self._keep_leases(),
+            *(self._worker(index) for index in range(self.worker_count)),
+        )
+
+    async def _dispatch(self):
+        """
+        分发协程: 从数据库认领待处理任务放入队列, 每次最多认领空闲的容量;
+        空闲容量不到一半或没有任务时, 等待唤醒(worker取走任务、有新任务)或定时轮询
+        """
+        while True:
+            self._wakeup.clear()
+            limit = self._free_capacity()
+            task_ids: List[int] = []
+            if limit >= (self.max_held + 1) // 2:
+                task_ids = await asyncio.to_thread(
+                    self._claim_pending_ids, limit, list(self._sender_parked)
+                )
+                if not task_ids:
+                    # 已取到末尾, 下次从头检查一遍, 避免漏掉ID更小的待处理任务
+                    self._last_id = 0
+            if not task_ids:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), timeout=config.EMAIL_QUEUE_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._last_id = task_ids[-1]
+            for task_id in task_ids:
+                if task_id in self._inflight:
+                    continue
+                self._inflight.add(task_id)
+                await self._queue.put(task_id)
+
+    async def _keep_leases(self):
+        """
+        定时(租约时长的三分之一)给持有的任务和本进程执行中的批量作业续期,
+        并收回其他执行器过期的租约、把执行进程已退出的批量作业标记为失败
+        """
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if self._inflight:
+                    await asyncio.to_thread(
+                        renew_email_task_leases, self.lease_owner, self.lease_seconds
+                    )
+                await asyncio.to_thread(renew_batch_job_leases, self.lease_owner, self.lease_seconds)
+                await asyncio.to_thread(self._reclaim_expired_tasks)
+                await asyncio.to_thread(fail_interrupted_batch_jobs)
+            except Exception as e:
+                logger.error(f"邮件任务租约续期失败: {e}")
+
+    async def _worker(self, index: int):
+        """worker协程: 从队列中取出任务ID并执行, 再接着执行同一发件人暂存的任务"""
+        while True:
+            task_id: Optional[int] = await self._queue.get()
+            self._on_capacity_freed()
+            while task_id is not None:
+                task_id = await self._run_task(index, task_id)
+
+    async def _run_task(self, index: int, task_id: int) -> Optional[int]:
+        """执行一个任务, 返回同一发件人下一个暂存的任务ID(没有时返回 None)"""
+        self._executing.add(task_id)
+        next_id = None
+        try:
+            next_id = await self.execute(task_id)
+        except Exception as e:
+            logger.error(f"worker {index} 执行任务 {task_id} 时发生错误: {e}")
+            self._update_task_status(task_id, TASK_STATUS_FAILED)
+        finally:
+            self._executing.discard(task_id)
+            if task_id not in self._status_writer and task_id not in self._parked:
+                self._inflight.discard(task_id)
+        return next_id
+
+    async def _log_stats(self):
+        """定时输出发送吞吐量"""
+        while True:
+            await asyncio.sleep(config.EMAIL_STATS_LOG_INTERVAL)
+            stats = self.get_stats()
+            if stats["succeeded"] or stats["failed"]:
+                logger.info(f"邮件发送统计: {stats}")
+
+    def _try_acquire_sender(self, send_by: str, task_id: int) -> bool:
+        """
+        占用发件人的一个发送名额; 已达到 EMAIL_SENDER_CONCURRENCY 时把任务暂存起来并返回 False,
+        worker 不在这里等待, 可以继续执行其他发件人的任务
+        """
+        limit = config.EMAIL_SENDER_CONCURRENCY
+        active = self._sender_active.get(send_by, 0)
+        if limit > 0 and active >= limit:
+            self._parked.add(task_id)
+            self._sender_parked.setdefault(send_by, deque()).append(task_id)
+            return False
+        self._sender_active[send_by] = active + 1
+        return True
+
+    def _release_sender(self, send_by: str) -> Optional[int]:
+        """归还发件人的发送名额, 返回该发件人下一个暂存的任务ID"""
+        active = self._sender_active.get(send_by, 0) - 1
+        if active > 0:
+            self._sender_active[send_by] = active
+        else:
+            self._sender_active.pop(send_by, None)
+        parked = self._sender_parked.get(send_by)
+        if not parked:
+            return None
+        next_id = parked.popleft()
+        if not parked:
+            # 该发件人不再被排除, 下次从头认领, 拾回之前跳过的任务
+            del self._sender_parked[send_by]
+            self._on_new_tasks(1)
+        self._parked.discard(next_id)
+        self._on_capacity_freed()
+        return next_id
+
+    def _load_task(self, task_id: int) -> Tuple[Optional[EmailTask], Optional[Email]]:
+        """读取任务和它引用的邮件内容(内容按ID缓存, 同一次推广只查询一次)"""
+        with Session(read_engine) as session:
+            task = session.get(EmailTask, task_id)
+        if not task or task.status != TASK_STATUS_PENDING or task.lease_owner != self.lease_owner:
+            return task, None
+        # 剩余租约不足三分之一说明续期没有按时执行, 租约随时可能被其他执行器收回, 先不发送
+        # (任务保持待处理, 租约过期后重新认领), 避免同一封邮件被发送两次
+        if task.lease_expires_at is None or task.lease_expires_at < datetime.utcnow() + timedelta(
+            seconds=self.lease_seconds / 3
+        ):
+            logger.warning(f"任务 {task_id} 的租约即将过期, 暂不发送")
+            return task, None
+        return task, task_email(task)
+
+    def _render_email(self, task: EmailTask, email: Email) -> Email:
+        """
+        按收件客户渲染模板邮件(在线程中执行, 不占用事件循环)
+        模板已在创建任务时编译并缓存, 这里只查询客户的名称和标签并填入合并字段
+        """
+        subject, body = compile_email(email.subject, email.body)
+        ctx = None
+        if not (subject.is_static and body.is_static):
+            with Session(read_engine) as session:
+                customer = session.exec(
+                    select(Customer.name, Customer.tags).where(Customer.email == task.send_to)
+                ).first()
+            name, tags = customer if customer else ("", [])
+            ctx = RecipientContext(name, task.send_to, normalize_tags(tags), task.send_by)
+        return Email(subject=subject.render(ctx), body=body.render(ctx))
+
+    async def execute(self, task_id: int) -> Optional[int]:
+        """
+        执行任务; 发件人已达到并发上限时只暂存任务
+        :return: 同一发件人下一个暂存的任务ID, 由调用的worker接着执行
+        """
+        task, email = await asyncio.to_thread(self._load_task, task_id)
+        if not task or email is None:
+            return None  # 任务已被删除、已被处理或租约已被其他执行器收回
 
         # 执行任务的逻辑
         # 例如发送邮件、记录日志等锁屏
         # 这里只是一个示例，实际执行逻辑需要根据业务需求来实现
         # 例如发送邮件
+        if not self._try_acquire_sender(task.send_by, task_id):
+            return None
+        try:
+            await self._send_task(task, email)
+        except Exception as e:
+            logger.error(f"执行任务 {task_id} 时发生错误: {e}")
+            self._update_task_status(task_id, TASK_STATUS_FAILED)
+        finally:
+            next_id = self._release_sender(task.send_by)
+        return next_id
+
+    async def _send_task(self, task: EmailTask, email: Email):
+        task_id: int = task.id  # type: ignore
         logger.info(f"开始执行任务: {task.name}")
-        self._update_task_status(task, "发送中")
+        self._update_task_status(task_id, TASK_STATUS_SENDING)
         # 这里可以调用发送邮件的函数
-        email = task.get_email()
+        if email.use_template:
+            email = await asyncio.to_thread(self._render_email, task, email)
+        started_at = time.monotonic()
         is_success = await self.send_email(
             email.subject,
             email.body,
             task.send_by,
             task.send_to,
         )
+        self.stats.record(is_success, time.monotonic() - started_at)
         if is_success:
             logger.info(f"任务 {task.name} 执行成功.")
-            self._update_task_status(task, "发送成功")
+            self._update_task_status(task_id, TASK_STATUS_SUCCESS)
 
         else:
             logger.error(f"任务 {task.name} 执行失败!(网络问题，请稍后重试).")
-            self._update_task_status(task, "发送失败")
+            self._update_task_status(task_id, TASK_STATUS_FAILED)
 
     async def send_email(
         self, subject: str, body: str, send_by: str, send_to: str
     ) -> bool:
         """
-        模拟发送邮件的函数
+        通过配置的发送后端(EMAIL_BACKEND)发送邮件
         :param subject: 邮件主题
         :param body: 邮件内容
         """
-        is_success = False  # 默认表示没有发送成功
-        delay = random.randint(2, 10)  # 模拟发送邮件的延迟
-
-        # 这里可以集成实际的邮件发送逻辑
-        logger.info(f"邮件主题: {subject}")
-        logger.info(f"邮件内容: {body}")
-        logger.info(f"发送者: {send_by}")
-        logger.info(f"接收者: {send_to}")
-
-        # 模拟实际网络延迟 (2~10秒)
-        await asyncio.sleep(delay)  # 模拟发送邮件的延迟
-
-        # 模拟可能会发送成功或失败
-        # 这里假设如果发送时长超过了7秒，则认定为失败
-        if delay > 7:
-            is_success = False
-        else:
-            is_success = True
-
-        if is_success:
-            return True
-
-        return False
+        return await self.backend.send(subject, body, send_by, send_to)
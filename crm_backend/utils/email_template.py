@@ -0,0 +1,197 @@
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from crm_backend.utils.config import load_config
+
+
+config = load_config()
+
+
+# 邮件模板
+# 语法:
+#   {{ customer.name }}  {{ customer.email }}  {{ sender.email }}    合并字段, 正文中会做HTML转义
+#   {% if tag "VIP客户" %} ... {% else %} ... {% endif %}               按收件客户的标签选择内容, 可嵌套
+#   {% if not tag "VIP客户" %} ... {% endif %}
+#   {% raw %} ... {% endraw %}                                          其中的内容原样输出, 不做解析(例如正文中需要出现"{{")
+# 模板在创建推广任务时解析校验, 编译结果按模板内容的哈希缓存; 执行器发送每封邮件时只需要填入合并字段
+
+
+class TemplateError(ValueError):
+    """模板语法错误"""
+
+
+class RecipientContext:
+    """渲染模板时使用的收件人数据"""
+
+    __slots__ = ("name", "email", "tags", "sender")
+
+    def __init__(self, name: str, email: str, tags: Iterable[str], sender: str):
+        self.name = name
+        self.email = email
+        self.tags: FrozenSet[str] = frozenset(tags)
+        self.sender = sender
+
+
+# 可用的合并字段 -> 取值函数
+_FIELDS: Dict[str, Callable[[RecipientContext], str]] = {
+    "customer.name": lambda ctx: ctx.name,
+    "customer.email": lambda ctx: ctx.email,
+    "sender.email": lambda ctx: ctx.sender,
+}
+
+_TOKEN_RE = re.compile(r"\{%\s*raw\s*%\}(.*?)\{%\s*endraw\s*%\}|\{\{(.*?)\}\}|\{%(.*?)%\}", re.S)
+_IF_TAG_RE = re.compile(r"""^if\s+(not\s+)?tag\s+(?:"([^"]*)"|'([^']*)')$""")
+
+# 编译后的模板片段: 常量文本, 或根据收件人生成文本的函数
+_Part = Union[str, Callable[[RecipientContext], str]]
+
+
+def _join(parts: List[_Part]) -> _Part:
+    """合并相邻的常量文本; 全部是常量时结果也是常量"""
+    merged: List[_Part] = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    if not merged:
+        return ""
+    if len(merged) == 1:
+        return merged[0]
+    pieces = tuple(merged)
+    return lambda ctx: "".join([piece if isinstance(piece, str) else piece(ctx) for piece in pieces])
+
+
+def _field(getter: Callable[[RecipientContext], str], escape: bool) -> _Part:
+    if escape:
+        return lambda ctx: html.escape(getter(ctx) or "")
+    return lambda ctx: getter(ctx) or ""
+
+
+def _condition(tag: str, negate: bool, then_part: _Part, else_part: _Part) -> _Part:
+    def render_part(part: _Part, ctx: RecipientContext) -> str:
+        return part if isinstance(part, str) else part(ctx)
+
+    return lambda ctx: render_part(then_part if (tag in ctx.tags) != negate else else_part, ctx)
+
+
+class CompiledTemplate:
+    """编译后的模板: 常量文本已合并, 渲染时只计算合并字段和标签条件"""
+
+    __slots__ = ("_part",)
+
+    def __init__(self, part: _Part):
+        self._part = part
+
+    @property
+    def is_static(self) -> bool:
+        """模板中没有合并字段和条件, 渲染结果与收件人无关"""
+        return isinstance(self._part, str)
+
+    def render(self, ctx: Optional[RecipientContext]) -> str:
+        if isinstance(self._part, str):
+            return self._part
+        if ctx is None:
+            raise TemplateError("渲染模板需要收件人数据")
+        return self._part(ctx)
+
+
+def compile_template(source: str, escape: bool) -> CompiledTemplate:
+    """
+    解析并编译模板, 语法错误时抛出 TemplateError
+    :param escape: 合并字段是否做HTML转义(正文为HTML, 主题不需要转义)
+    """
+    # 栈中每一层: [当前分支的片段, if分支的片段(进入else后才有), 标签, 是否取反]
+    stack: List[list] = [[[], None, None, False]]
+    position = 0
+    for match in _TOKEN_RE.finditer(source):
+        stack[-1][0].append(source[position : match.start()])
+        position = match.end()
+        line = source.count("\n", 0, match.start()) + 1
+        raw, expression, statement = match.group(1), match.group(2), match.group(3)
+        if raw is not None:
+            stack[-1][0].append(raw)
+            continue
+        if expression is not None:
+            getter = _FIELDS.get(expression.strip())
+            if getter is None:
+                raise TemplateError(
+                    f"第{line}行: 未知的模板变量 {expression.strip()!r}, 可用变量: {', '.join(_FIELDS)}"
+                )
+            stack[-1][0].append(_field(getter, escape))
+            continue
+
+        statement = statement.strip()
+        if_match = _IF_TAG_RE.match(statement)
+        if if_match:
+            tag = if_match.group(2) if if_match.group(2) is not None else if_match.group(3)
+            stack.append([[], None, tag, bool(if_match.group(1))])
+        elif statement == "else":
+            if len(stack) == 1 or stack[-1][1] is not None:
+                raise TemplateError(f"第{line}行: 多余的 {{% else %}}")
+            stack[-1][1], stack[-1][0] = stack[-1][0], []
+        elif statement == "endif":
+            if len(stack) == 1:
+                raise TemplateError(f"第{line}行: 多余的 {{% endif %}}")
+            parts, then_parts, tag, negate = stack.pop()
+            if then_parts is None:
+                then_parts, parts = parts, []
+            stack[-1][0].append(_condition(tag, negate, _join(then_parts), _join(parts)))
+        elif statement == "raw":
+            raise TemplateError(f"第{line}行: {{% raw %}} 缺少 {{% endraw %}}")
+        elif statement == "endraw":
+            raise TemplateError(f"第{line}行: 多余的 {{% endraw %}}")
+        else:
+            raise TemplateError(f'第{line}行: 无法识别的语句 {{% {statement} %}}, 支持 if tag "标签"/else/endif/raw')
+    if len(stack) > 1:
+        raise TemplateError("模板中有未结束的 {% if %}, 缺少 {% endif %}")
+    stack[0][0].append(source[position:])
+    return CompiledTemplate(_join(stack[0][0]))
+
+
+class TemplateCache:
+    """
+    编译结果的LRU缓存, key 为模板内容的 SHA-256 摘要(加上是否转义)
+    同样内容的推广任务重复创建时不再重新解析
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, CompiledTemplate]" = OrderedDict()
+        self._lock = threading.Lock()  # 请求线程校验模板、执行器线程渲染, 需要加锁
+
+    def get(self, source: str, escape: bool) -> CompiledTemplate:
+        key = hashlib.sha256(source.encode()).digest() + (b"\x01" if escape else b"\x00")
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = compile_template(source, escape)
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = compiled
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return compiled
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+template_cache = TemplateCache(max_size=config.EMAIL_TEMPLATE_CACHE_SIZE)
+
+
+def compile_email(subject: str, body: str) -> Tuple[CompiledTemplate, CompiledTemplate]:
+    """编译(或从缓存取出)邮件主题和正文模板, 语法错误时抛出 TemplateError"""
+    return template_cache.get(subject, escape=False), template_cache.get(body, escape=True)
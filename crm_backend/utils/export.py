@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Iterator, Literal
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from crm_backend.db.db import read_engine
+
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# 服务端游标每次从数据库取出的行数, 也是每次写给客户端的行数
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value: Any):
+    # 列表、字典等JSON列在CSV中以JSON字符串输出
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_rows(statement, export_format: ExportFormat) -> Iterator[bytes]:
+    """
+    通过服务端游标(yield_per)逐块读取查询结果并编码输出,
+    内存中只保留一块数据, 与导出的总行数无关
+    会话在生成器内部创建, 因为响应开始发送时请求的会话可能已经关闭
+    """
+    with Session(read_engine) as session:
+        result = session.exec(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        columns = list(result.keys())
+        writer = None
+        buffer = io.StringIO()
+        if export_format == "csv":
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+
+        for partition in result.partitions():
+            for row in partition:
+                if writer:
+                    writer.writerow([_csv_value(value) for value in row])
+                else:
+                    buffer.write(
+                        json.dumps(
+                            dict(zip(columns, row)),
+                            ensure_ascii=False,
+                            default=_json_default,
+                        )
+                    )
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+
+def export_response(
+    statement, export_format: ExportFormat, filename: str
+) -> StreamingResponse:
+    """把查询结果以 NDJSON 或 CSV 流式返回"""
+    return StreamingResponse(
+        stream_rows(statement, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{export_format}"'
+        },
+    )
@@ -0,0 +1,91 @@
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+
+ImportFormat = Literal["ndjson", "csv"]
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """把请求体的字节流按行切分(UTF-8, 支持 BOM), 不把整个请求体读入内存"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+def _parse_tags(value: Any) -> Any:
+    # CSV 中的标签可以是JSON数组(与导出格式一致), 也可以用 | 分隔
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    if not value:
+        return []
+    if value.startswith("["):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return [tag.strip() for tag in value.split("|") if tag.strip()]
+
+
+def _parse_bool(value: Any) -> Any:
+    if isinstance(value, str) and value.strip().lower() in ("", "0", "false", "否"):
+        return False
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "是"):
+        return True
+    return value
+
+
+async def iter_record_chunks(
+    stream: AsyncIterator[bytes], import_format: ImportFormat, chunk_size: int
+) -> AsyncIterator[List[Tuple[int, Dict[str, Any] | str]]]:
+    """
+    流式解析 NDJSON 或 CSV(首行为表头), 每凑满 chunk_size 行产出一块
+    每条记录为 (行号, 字段字典) 或 (行号, 解析错误信息); 空行会被跳过
+    CSV 按行解析, 不支持字段内换行
+    """
+    header: Optional[List[str]] = None
+    chunk: List[Tuple[int, Dict[str, Any] | str]] = []
+    row_number = 0
+    async for line in iter_lines(stream):
+        row_number += 1
+        if not line.strip():
+            continue
+
+        record: Dict[str, Any] | str
+        if import_format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                record = f"列数({len(values)})与表头({len(header)})不一致"
+            else:
+                record = dict(zip(header, values))
+                if "tags" in record:
+                    record["tags"] = _parse_tags(record["tags"])
+                if "is_blacklist" in record:
+                    record["is_blacklist"] = _parse_bool(record["is_blacklist"])
+        else:
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    record = "每行必须是一个JSON对象"
+            except json.JSONDecodeError as e:
+                record = f"JSON解析失败: {e.msg}"
+
+        chunk.append((row_number, record))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
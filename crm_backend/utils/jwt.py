@@ -1,5 +1,5 @@
 # 用于加密Token的密匙(生产环境要用更复杂的值)
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict
 from jose import JWTError, jwt
 
@@ -10,8 +10,11 @@ ALGORITHM = "HS256"
 
 def jwt_encode(data: dict, expires_delta: timedelta) -> str:
     to_encode = data.copy()  # 复制数据 避免修改原数据
-    expire = datetime.utcnow() + expires_delta  # 计算过期时间(当前时间＋有效期)
-    to_encode.update({"exp": expire})  # 添加过期时间字段
+    now = datetime.utcnow()
+    expire = now + expires_delta  # 计算过期时间(当前时间＋有效期)
+    # 添加过期时间和签发时间字段; 签发时间保留小数(JWT 的 NumericDate 允许小数),
+    # 吊销检查需要区分吊销前后同一秒内签发的token
+    to_encode.update({"exp": expire, "iat": now.replace(tzinfo=timezone.utc).timestamp()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)  # 生成Token
 
 
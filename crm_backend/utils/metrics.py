@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+
+# 请求耗时直方图的桶上限(秒), 与 Prometheus 客户端的默认桶一致
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# 没有匹配到任何路由的请求统一归到这个标签下, 避免任意URL把指标撑爆
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+
+class RequestMetrics:
+    """
+    按 (请求方法, 路由模板) 统计的请求指标: 耗时直方图、各状态码数量, 以及正在处理的请求数
+
+    路由模板取自匹配到的路由(例如 /api/customers/query/{customer_id}), 而不是实际URL,
+    因此标签数量是固定的. 所有更新都发生在事件循环线程中, 不需要加锁,
+    每个请求只有几次字典查找和一次二分查找
+    """
+
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str], _Histogram] = defaultdict(_Histogram)
+        self._status: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.in_flight = 0
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status_code: int, latency: float):
+        self.in_flight -= 1
+        histogram = self._latency[(method, route)]
+        histogram.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        histogram.count += 1
+        histogram.sum += latency
+        self._status[(method, route, status_code)] += 1
+
+    def render(self) -> List[str]:
+        """输出 Prometheus 文本格式的指标行"""
+        lines = [
+            "# HELP crm_http_request_duration_seconds 请求处理耗时(秒)",
+            "# TYPE crm_http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self._latency.items()):
+            labels = _labels(method=method, route=route)
+            cumulative = 0
+            for upper, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(
+                    f'crm_http_request_duration_seconds_bucket{{{labels},le="{upper}"}} {cumulative}'
+                )
+            lines.append(
+                f'crm_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}'
+            )
+            lines.append(f"crm_http_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"crm_http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [
+            "# HELP crm_http_requests_total 按状态码统计的请求数",
+            "# TYPE crm_http_requests_total counter",
+        ]
+        for (method, route, status_code), count in sorted(self._status.items()):
+            labels = _labels(method=method, route=route, status=str(status_code))
+            lines.append(f"crm_http_requests_total{{{labels}}} {count}")
+
+        lines += [
+            "# HELP crm_http_requests_in_flight 正在处理的请求数",
+            "# TYPE crm_http_requests_in_flight gauge",
+            f"crm_http_requests_in_flight {self.in_flight}",
+        ]
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def render_gauges(name: str, help_text: str, values: Iterable[Tuple[str, float]]) -> List[str]:
+    """
+    把一组 (key, 数值) 输出为同一个指标下的多条数据, key 作为 name 标签,
+    用于导出执行器、token缓存、密码哈希线程池等组件已有的统计数据
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in values:
+        lines.append(f'{name}{{{_labels(name=key)}}} {float(value)}')
+    return lines
+
+
+request_metrics = RequestMetrics()
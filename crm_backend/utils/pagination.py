@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import tuple_
+
+from crm_backend.models.crm_http_exception import CrmHTTPException
+
+
+# 游标分页(keyset pagination)
+# 列表按一组唯一且有索引的排序列(例如 (created_at, id))排序,
+# 下一页从上一页最后一行的排序值之后开始查, 不再使用 OFFSET,
+# 因此无论翻到第几页, 每页的查询代价都一样
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """把排序列的值编码为不透明的游标字符串"""
+    raw = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> List[Any]:
+    """解析游标字符串, 并按排序列的类型还原出对应的值"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("游标长度与排序列不一致")
+        return [
+            datetime.fromisoformat(value)
+            if column.type.python_type is datetime
+            else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise CrmHTTPException(status_code=400, detail="分页游标不合法")
+
+
+def paginate(
+    statement,
+    columns: Sequence[Any],
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+):
+    """
+    给查询语句加上排序和分页条件
+    传入 cursor 时使用游标分页(忽略 offset), 否则退回到 offset 分页
+    会多取一行, 用于判断是否还有下一页(见 page_result)
+    :param columns: 排序列, 最后一列必须唯一(通常为主键 id)
+    """
+    statement = statement.order_by(*columns)
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        statement = statement.where(tuple_(*columns) > tuple_(*values))
+    elif offset:
+        statement = statement.offset(offset)
+    return statement.limit(limit + 1)
+
+
+def page_result(
+    rows: Sequence[Any], columns: Sequence[Any], limit: int
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    截取当前页的数据, 并生成下一页的游标(没有下一页时为 None)
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last_row = rows[-1]
+    return rows, encode_cursor([getattr(last_row, column.key) for column in columns])
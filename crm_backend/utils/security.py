@@ -1,5 +1,15 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
 from passlib.context import CryptContext
 
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.utils.config import load_config
+
+config = load_config()
+
 # 配置密码哈希方式 推荐bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -12,3 +22,86 @@ def verify_passwd(plain_passwd: str, hashed_passwd: str) -> bool:
 def get_passwd_hash(passwd: str) -> str:
     """生成密码的哈希值"""
     return pwd_context.hash(passwd)
+
+
+class PasswdHashPool:
+    """
+    执行bcrypt计算的有界线程池
+
+    bcrypt 每次计算耗时约 100~300ms, 直接在事件循环中执行会阻塞所有请求;
+    这里把计算交给固定大小的线程池, 并限制排队数量, 排满时直接返回503,
+    同时统计排队等待时间和哈希计算耗时
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix="passwd_hash"
+        )
+        # 正在计算 + 排队中的任务总数上限
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max(queue_limit, 0))
+        self._lock = threading.Lock()
+        self._stats = {
+            "completed": 0,
+            "rejected": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "hash_latency_total": 0.0,
+            "hash_latency_max": 0.0,
+        }
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise CrmHTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+
+        submitted_at = time.perf_counter()
+
+        def run():
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                self._slots.release()
+                self._record(started_at - submitted_at, finished_at - started_at)
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            self._slots.release()
+            raise
+
+    def _record(self, queue_wait: float, hash_latency: float):
+        with self._lock:
+            stats = self._stats
+            stats["completed"] += 1
+            stats["queue_wait_total"] += queue_wait
+            stats["queue_wait_max"] = max(stats["queue_wait_max"], queue_wait)
+            stats["hash_latency_total"] += hash_latency
+            stats["hash_latency_max"] = max(stats["hash_latency_max"], hash_latency)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats["completed"] or 1
+        stats["queue_wait_avg"] = stats["queue_wait_total"] / completed
+        stats["hash_latency_avg"] = stats["hash_latency_total"] / completed
+        return stats
+
+
+passwd_hash_pool = PasswdHashPool(
+    workers=config.PASSWD_HASH_WORKERS, queue_limit=config.PASSWD_HASH_QUEUE_LIMIT
+)
+
+
+async def verify_passwd_async(plain_passwd: str, hashed_passwd: str) -> bool:
+    """在线程池中验证密码, 供 async 路由使用, 不阻塞事件循环"""
+    return await asyncio.wrap_future(
+        passwd_hash_pool.submit(verify_passwd, plain_passwd, hashed_passwd)
+    )
+
+
+def get_passwd_hash_bounded(passwd: str) -> str:
+    """在线程池中生成密码哈希, 供同步路由使用, 受线程池大小和排队上限约束"""
+    return passwd_hash_pool.submit(get_passwd_hash, passwd).result()
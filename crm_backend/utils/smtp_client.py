@@ -0,0 +1,352 @@
+import asyncio
+import base64
+import re
+import socket
+import ssl
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+
+
+# SMTP连接的加密方式
+SMTP_SECURITY_NONE = "none"  # 明文
+SMTP_SECURITY_STARTTLS = "starttls"  # 明文连接后通过 STARTTLS 升级
+SMTP_SECURITY_TLS = "tls"  # 直接建立TLS连接(通常为465端口)
+
+
+class SmtpError(Exception):
+    """
+    SMTP错误, code 为服务器返回的状态码, 连接失败、超时等网络错误时为 None
+    网络错误和4xx为临时错误, 换一个连接重试可能成功; 5xx为永久错误, 不再重试
+    after_data 为真表示邮件正文和结束符"."已经写出: 服务器可能已经接收了邮件,
+    重试会重复发送, 这类错误一律不重试
+    """
+
+    def __init__(self, code: Optional[int], message: str, after_data: bool = False):
+        super().__init__(f"{code} {message}" if code else message)
+        self.code = code
+        self.message = message
+        self.after_data = after_data
+
+    @property
+    def transient(self) -> bool:
+        if self.after_data:
+            return False
+        return self.code is None or 400 <= self.code < 500
+
+
+def _dot_stuff(message: bytes) -> bytes:
+    """DATA 内容统一为 CRLF 换行, 以"."开头的行前面再加一个"."(RFC 5321 4.5.2)"""
+    message = re.sub(rb"\r?\n", b"\r\n", message)
+    message = re.sub(rb"(?m)^\.", b"..", message)
+    if not message.endswith(b"\r\n"):
+        message += b"\r\n"
+    return message
+
+
+class SmtpConnection:
+    """
+    一个已登录的SMTP连接(基于 asyncio streams), 可以连续发送多封邮件
+    服务器支持 PIPELINING 时, MAIL FROM、RCPT TO、DATA 三条命令一次写出, 再依次读取回复,
+    每封邮件只需要两次网络往返
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        security: str = SMTP_SECURITY_NONE,
+        username: str = "",
+        password: str = "",
+        timeout: float = 30.0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.security = security
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.extensions: Dict[str, str] = {}  # EHLO 返回的扩展 -> 参数
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+        self.broken = False  # 发生过网络错误或协议错乱, 不能再使用
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    def _tls_context(self) -> ssl.SSLContext:
+        return self.ssl_context or ssl.create_default_context()
+
+    async def connect(self):
+        """建立连接: 问候 -> EHLO -> (STARTTLS -> EHLO) -> AUTH"""
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    self.host,
+                    self.port,
+                    ssl=self._tls_context() if self.security == SMTP_SECURITY_TLS else None,
+                ),
+                timeout=self.timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            self.broken = True
+            raise SmtpError(None, f"连接SMTP服务器 {self.host}:{self.port} 失败: {e!r}")
+
+        self._expect(await self._read_reply(), 220)
+        await self._ehlo()
+        if self.security == SMTP_SECURITY_STARTTLS:
+            if "starttls" not in self.extensions:
+                raise SmtpError(None, "SMTP服务器不支持 STARTTLS")
+            self._expect(await self._command("STARTTLS"), 220)
+            try:
+                await asyncio.wait_for(
+                    self._writer.start_tls(self._tls_context(), server_hostname=self.host),
+                    timeout=self.timeout,
+                )
+            except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+                self.broken = True
+                raise SmtpError(None, f"STARTTLS 握手失败: {e!r}")
+            await self._ehlo()  # TLS建立后扩展列表可能不同, 需要重新 EHLO
+        if self.username:
+            await self._login()
+        self.last_used = time.monotonic()
+
+    async def _ehlo(self):
+        code, text = await self._command(f"EHLO {socket.getfqdn()}")
+        self._expect((code, text), 250)
+        self.extensions = {}
+        for line in text.splitlines()[1:]:
+            name, _, params = line.partition(" ")
+            self.extensions[name.lower()] = params
+
+    async def _login(self):
+        mechanisms = self.extensions.get("auth", "").upper().split()
+        if "PLAIN" in mechanisms or "LOGIN" not in mechanisms:
+            token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+            self._expect(await self._command(f"AUTH PLAIN {token}"), 235)
+        else:
+            self._expect(await self._command("AUTH LOGIN"), 334)
+            self._expect(
+                await self._command(base64.b64encode(self.username.encode()).decode()), 334
+            )
+            self._expect(
+                await self._command(base64.b64encode(self.password.encode()).decode()), 235
+            )
+
+    def _write(self, data: bytes):
+        assert self._writer is not None
+        self._writer.write(data)
+
+    async def _drain(self):
+        assert self._writer is not None
+        try:
+            await asyncio.wait_for(self._writer.drain(), timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.broken = True
+            raise SmtpError(None, f"写入SMTP连接失败: {e!r}")
+
+    async def _read_reply(self) -> Tuple[int, str]:
+        """读取一条(可能多行的)回复, 返回状态码和去掉状态码后的文本"""
+        assert self._reader is not None
+        lines: List[str] = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), timeout=self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.broken = True
+                raise SmtpError(None, f"读取SMTP回复失败: {e!r}")
+            if not line:
+                self.broken = True
+                raise SmtpError(None, "SMTP服务器关闭了连接")
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            if len(text) < 3 or not text[:3].isdigit():
+                self.broken = True
+                raise SmtpError(None, f"无法解析的SMTP回复: {text!r}")
+            lines.append(text[4:])
+            if text[3:4] != "-":
+                return int(text[:3]), "\n".join(lines)
+
+    async def _command(self, line: str) -> Tuple[int, str]:
+        self._write(line.encode() + b"\r\n")
+        await self._drain()
+        return await self._read_reply()
+
+    def _expect(self, reply: Tuple[int, str], code: int):
+        if reply[0] != code:
+            raise SmtpError(reply[0], reply[1])
+
+    async def send_message(self, mail_from: str, rcpt_to: str, message: bytes):
+        """
+        发送一封邮件, 失败时抛出 SmtpError
+        服务器拒绝发件人或收件人时先 RSET 结束本次事务, 连接仍然可以继续使用
+        """
+        for address in (mail_from, rcpt_to):
+            if any(char in address for char in "\r\n<>"):
+                raise SmtpError(501, f"邮箱地址不合法: {address!r}")
+        commands = [f"MAIL FROM:<{mail_from}>", f"RCPT TO:<{rcpt_to}>", "DATA"]
+        if "pipelining" in self.extensions:
+            self._write("".join(f"{command}\r\n" for command in commands).encode())
+            await self._drain()
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            replies = []
+            for command in commands:
+                replies.append(await self._command(command))
+                if replies[-1][0] >= 400:
+                    break  # 逐条发送时, 前面的命令失败就不再继续
+
+        (mail_code, mail_text), *rest = replies
+        rcpt_code, rcpt_text = rest[0] if rest else (mail_code, mail_text)
+        data_code, data_text = rest[1] if len(rest) > 1 else (503, "")
+        if mail_code != 250 or rcpt_code not in (250, 251):
+            if data_code == 354:
+                # 收件人被拒绝但服务器仍接受了 DATA, 发送空内容结束
+                self._write(b".\r\n")
+                await self._drain()
+                await self._read_reply()
+            await self._command("RSET")
+            if mail_code != 250:
+                raise SmtpError(mail_code, mail_text)
+            raise SmtpError(rcpt_code, rcpt_text)
+        if data_code != 354:
+            await self._command("RSET")
+            raise SmtpError(data_code, data_text)
+
+        self._write(_dot_stuff(message) + b".\r\n")
+        try:
+            await self._drain()
+            self._expect(await self._read_reply(), 250)
+        except SmtpError as e:
+            raise SmtpError(e.code, e.message, after_data=True) from e
+        self.messages_sent += 1
+        self.last_used = time.monotonic()
+
+    async def close(self):
+        """发送 QUIT 并关闭连接, 连接已损坏时直接关闭"""
+        if self._writer is None:
+            return
+        try:
+            if not self.broken:
+                self._write(b"QUIT\r\n")
+                await self._drain()
+                await self._read_reply()
+        except SmtpError:
+            pass
+        finally:
+            self._writer.close()
+            try:
+                await asyncio.wait_for(self._writer.wait_closed(), timeout=self.timeout)
+            except (OSError, ssl.SSLError, asyncio.TimeoutError):
+                pass
+            self._writer = None
+
+
+class SmtpConnectionPool:
+    """
+    SMTP连接池: 最多 size 个连接同时发送, 空闲连接放回池中给后续邮件复用,
+    不再每封邮件都建立一次TCP/TLS连接并登录.
+    一个连接发送了 max_messages_per_connection 封邮件(很多服务器有单连接邮件数限制)
+    或空闲超过 idle_timeout 秒后关闭重建; 网络错误和4xx临时错误换一个新连接重试 retries 次,
+    正文已经写出后的错误不重试(服务器可能已经接收, 重试会重复发送)
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable[[], SmtpConnection],
+        size: int,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        retries: int = 2,
+    ):
+        self._connection_factory = connection_factory
+        self.size = max(size, 1)
+        self.max_messages_per_connection = max_messages_per_connection
+        self.idle_timeout = idle_timeout
+        self.retries = max(retries, 0)
+        self._slots = asyncio.Semaphore(self.size)
+        self._idle: Deque[SmtpConnection] = deque()
+        self._open = 0
+        self._closed = False
+        self.connects = 0  # 累计建立的连接数
+        self.reconnects = 0  # 因错误丢弃连接后重试的次数
+        self.messages = 0  # 累计发送成功的邮件数
+
+    async def _acquire(self) -> SmtpConnection:
+        # 优先复用最近使用的连接; 空闲太久的连接可能已被服务器断开, 直接关闭
+        while self._idle:
+            connection = self._idle.pop()
+            if time.monotonic() - connection.last_used < self.idle_timeout:
+                return connection
+            await self._discard(connection)
+        connection = self._connection_factory()
+        self._open += 1
+        self.connects += 1
+        try:
+            await connection.connect()
+        except BaseException:
+            await self._discard(connection)
+            raise
+        return connection
+
+    async def _release(self, connection: SmtpConnection):
+        if (
+            self._closed
+            or connection.broken
+            or (
+                self.max_messages_per_connection > 0
+                and connection.messages_sent >= self.max_messages_per_connection
+            )
+        ):
+            await self._discard(connection)
+        else:
+            self._idle.append(connection)
+
+    async def _discard(self, connection: SmtpConnection):
+        self._open -= 1
+        await connection.close()
+
+    async def send(self, mail_from: str, rcpt_to: str, message: bytes):
+        """通过池中的连接发送一封邮件, 重试后仍失败时抛出 SmtpError"""
+        for attempt in range(self.retries + 1):
+            async with self._slots:
+                connection: Optional[SmtpConnection] = None
+                try:
+                    connection = await self._acquire()
+                    await connection.send_message(mail_from, rcpt_to, message)
+                except SmtpError as e:
+                    if not e.transient or attempt >= self.retries:
+                        raise
+                    self.reconnects += 1
+                    logger.warning(
+                        f"发送邮件到 {rcpt_to} 失败, 更换连接重试({attempt + 1}/{self.retries}): {e}"
+                    )
+                    if connection is not None:
+                        connection.broken = True  # 临时错误后不再复用这个连接
+                except BaseException:
+                    # 被取消(例如执行器关闭)时连接可能停在一条命令的中间, 不能再放回池中复用
+                    if connection is not None:
+                        connection.broken = True
+                    raise
+                else:
+                    self.messages += 1
+                    return
+                finally:
+                    if connection is not None:
+                        await self._release(connection)
+
+    async def close(self):
+        """关闭全部空闲连接, 正在发送的连接在发送完成后直接关闭, 不再放回池中"""
+        self._closed = True
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "smtp_connections_open": self._open,
+            "smtp_connections_idle": len(self._idle),
+            "smtp_connects": self.connects,
+            "smtp_reconnects": self.reconnects,
+            "smtp_messages": self.messages,
+        }
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+from crm_backend.utils.config import load_config
+from crm_backend.utils.jwt import jwt_decode
+
+
+config = load_config()
+
+# 吊销检查函数: 传入token解析出的数据, 返回 True 表示该token已被吊销
+RevocationHook = Callable[[Dict], bool]
+
+# 用户吊销记录的保留时间(秒), 不短于token的有效期(1天), 之前签发的token已经全部过期
+USER_REVOCATION_TTL = 24 * 3600
+
+
+class VerifiedTokenCache:
+    """
+    已验证token的LRU缓存
+
+    key 为 token 的 SHA-256 摘要(不在内存中保存原始token), value 为验签后解析出的数据和过期时间;
+    命中缓存时跳过签名校验, 过期的条目在读取时淘汰. 只缓存验证成功的token.
+    吊销检查函数在每次鉴权时都会执行(命中缓存也一样), 因此需要足够轻量
+
+    注意: 缓存和用户吊销记录都只在当前进程内有效. 多进程部署(多个 worker)时,
+    在一个进程中吊销的用户, 其旧token在其他进程中仍然有效, 直到token过期(最长1天)
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[bytes, Tuple[Dict, float]]" = OrderedDict()
+        self._revocation_hooks: List[RevocationHook] = [self._is_user_revoked]
+        # 用户ID -> 吊销时间, 该时间之前签发的token全部失效(修改、禁用或删除用户时记录)
+        self._revoked_users: Dict[int, float] = {}
+        self._lock = threading.Lock()  # 同步路由运行在线程池中, 需要加锁
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def register_revocation_hook(self, hook: RevocationHook):
+        self._revocation_hooks.append(hook)
+
+    def _is_revoked(self, claims: Dict) -> bool:
+        return any(hook(claims) for hook in self._revocation_hooks)
+
+    def invalidate(self, token: str):
+        """从缓存中移除某个token(例如用户登出或被吊销时)"""
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def revoke_user(self, user_id: int):
+        """
+        吊销用户已签发的token: 从缓存中移除该用户的所有条目, 之后再出现的旧token也会被拒绝
+        修改用户信息(密码、权限、禁用)和删除用户时调用; 吊销记录只保存在当前进程中, 对其他进程无效
+        """
+        now = time.time()
+        with self._lock:
+            self._revoked_users[user_id] = now
+            for key in [key for key, (claims, _) in self._entries.items() if claims.get("user_id") == user_id]:
+                del self._entries[key]
+            for revoked_id in [
+                revoked_id
+                for revoked_id, revoked_at in self._revoked_users.items()
+                if revoked_at < now - USER_REVOCATION_TTL
+            ]:
+                del self._revoked_users[revoked_id]
+
+    def _is_user_revoked(self, claims: Dict) -> bool:
+        revoked_at = self._revoked_users.get(claims.get("user_id"))  # type: ignore
+        # iat 带小数, 按签发的先后精确比较; 旧版本签发的token的 iat 是整数秒,
+        # 与吊销同一秒签发的也视为已吊销
+        return revoked_at is not None and float(claims.get("iat", 0)) < revoked_at
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def decode(self, token: str) -> tuple[bool, Dict | None]:
+        """与 jwt_decode 返回值相同, 命中缓存时不再验签"""
+        if self.max_size <= 0:
+            is_valid, claims = jwt_decode(token)
+            if is_valid and claims and self._is_revoked(claims):
+                return False, None
+            return is_valid, claims
+
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                claims = entry[0]
+            else:
+                if entry:
+                    del self._entries[key]  # 已过期
+                self.misses += 1
+                claims = None
+
+        if claims is None:
+            is_valid, claims = jwt_decode(token)
+            if not is_valid or not claims:
+                return is_valid, claims
+            expires_at = float(claims.get("exp", now))
+            if expires_at > now:
+                with self._lock:
+                    self._entries[key] = (claims, expires_at)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+
+        if self._is_revoked(claims):
+            self.invalidate(token)
+            return False, None
+        return True, claims
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = VerifiedTokenCache(max_size=config.TOKEN_CACHE_SIZE)
@@ -3,14 +3,24 @@ from fastapi import FastAPI
 import uvicorn
 from crm_backend.controls.ctr_users import user_router
 from crm_backend.controls.ctr_customers import customer_router
-from crm_backend.controls.ctr_email_task import email_router
+from crm_backend.controls.ctr_email_task import email_router, email_task_execer
+from crm_backend.controls.ctr_metrics import metrics_router
+from crm_backend.controls.ctr_stats import stats_router
 from fastapi.middleware.cors import CORSMiddleware
+from crm_backend.db.customer_search import ensure_customer_fts
+from crm_backend.db.customer_tags import backfill_customer_tags
 from crm_backend.db.db import create_db_and_tables
+from crm_backend.db.email_task_batch import fail_interrupted_batch_jobs
+from crm_backend.db.email_task_stats import ensure_email_task_stats
 from crm_backend.db.init_data import init_all_sample_data
+from crm_backend.db.row_counters import ensure_row_counters
+from crm_backend.middleware.request_metrics import RequestMetricsMiddleware
+from crm_backend.middleware.sql_profiler import SqlProfilerMiddleware
 from loguru import logger
 
 from crm_backend.utils.config import load_config
 from crm_backend.utils.logger import init_logger
+from crm_backend.utils.metrics import request_metrics
 
 app = FastAPI()
 
@@ -39,6 +49,15 @@ app.add_middleware(
 app.include_router(prefix="/api", router=user_router)
 app.include_router(prefix="/api", router=customer_router)
 app.include_router(prefix="/api", router=email_router)
+app.include_router(prefix="/api", router=stats_router)
+
+# 按请求统计SQL条数和耗时, 超出预算或疑似N+1查询时输出警告
+app.add_middleware(SqlProfilerMiddleware)
+
+# 请求耗时、状态码和并发数统计, 通过 /metrics 以 Prometheus 文本格式输出
+if load_config().METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+    app.include_router(router=metrics_router)
 
 
 # 在启动时创建数据库表
@@ -47,6 +66,10 @@ def on_startup():
     logger.info("服务启动成功")
     logger.info("开始初始化数据表...")
     create_db_and_tables()
+    backfill_customer_tags()
+    ensure_customer_fts()
+    ensure_row_counters()
+    ensure_email_task_stats()
     logger.info("数据表初始化成功")
     
     # 根据配置决定是否初始化示例数据
@@ -58,6 +81,17 @@ def on_startup():
     else:
         logger.info("跳过示例数据初始化（配置中已禁用）")
 
+    # 数据表就绪后再启动邮件任务执行器, 并恢复上次未完成的任务
+    fail_interrupted_batch_jobs()
+    email_task_execer.start()
+
+
+# 在关闭时把邮件任务执行器中尚未落库的任务状态写入数据库
+@app.on_event("shutdown")
+def on_shutdown():
+    email_task_execer.stop()
+    logger.info("服务已关闭")
+
 
 if __name__ == "__main__":
     config = load_config()
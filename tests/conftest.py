@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+# 测试使用临时目录中的独立数据库; 配置在导入 crm_backend 时读取, 必须在导入之前设置
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)  # .env 按当前目录读取
+sys.path.insert(0, str(ROOT))
+os.environ["SQLITE_FILE_NAME"] = os.path.join(tempfile.mkdtemp(prefix="crm_test_"), "crm.db")
+os.environ["INIT_SAMPLE_DATA"] = "false"
+os.environ["LOG_CONSOLE_LEVEL"] = "WARNING"
+
+
+@pytest.fixture(scope="session")
+def database():
+    """创建数据表和触发器(整个测试会话只创建一次)"""
+    from crm_backend.db.db import create_db_and_tables
+    from crm_backend.db.email_task_stats import ensure_email_task_stats
+    from crm_backend.db.row_counters import ensure_row_counters
+    from crm_backend.models import (  # noqa: F401  注册全部数据表
+        customer,
+        email_batch_job,
+        email_content,
+        email_task,
+        email_task_stat,
+        row_counter,
+        user,
+    )
+
+    create_db_and_tables()
+    ensure_row_counters()
+    ensure_email_task_stats()
+
+
+@pytest.fixture
+def db(database):
+    """
+    使用测试数据库; 测试结束后清空全部数据表, 各测试之间互不影响
+    写引擎只有一个连接, 测试中的会话要及时关闭, 不能在整个测试期间占用
+    """
+    yield
+    from sqlmodel import Session, SQLModel
+
+    from crm_backend.db.db import engine
+
+    with Session(engine) as session:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            session.exec(table.delete())  # type: ignore
+        session.commit()
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """接口测试客户端; 启动事件(建表、全文索引、执行器)整个测试会话只运行一次"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(db):
+    """创建用户并返回 (用户ID, 请求头), 请求头中的token与登录接口签发的一致"""
+    from datetime import timedelta
+
+    from sqlmodel import Session
+
+    from crm_backend.db.db import engine
+    from crm_backend.models.user import User
+    from crm_backend.utils.jwt import jwt_encode
+
+    def make(name: str, is_admin: bool = False, passwd: str = "x"):
+        with Session(engine) as session:
+            user = User(name=name, passwd=passwd, email=f"{name}@example.com", is_admin=is_admin)
+            session.add(user)
+            session.commit()
+            payload = {"user_id": user.id, "user_email": user.email, "username": user.name, "is_admin": is_admin}
+        return payload["user_id"], {"X-Auth-Token": jwt_encode(payload, timedelta(days=1))}
+
+    return make
@@ -0,0 +1,151 @@
+import asyncio
+from typing import List
+
+from sqlmodel import Session, select, text
+
+from crm_backend.db.customer_import import upsert_customer_chunk
+from crm_backend.db.db import engine
+from crm_backend.models.customer import Customer, CustomerTag
+from crm_backend.utils.import_stream import iter_record_chunks
+
+
+def parse(body: bytes, import_format: str, chunk_size: int = 100, piece: int = 7) -> List[list]:
+    """把请求体切成小块模拟流式上传, 返回解析出的全部记录块"""
+
+    async def stream():
+        for start in range(0, len(body), piece):
+            yield body[start : start + piece]
+
+    async def collect():
+        return [chunk async for chunk in iter_record_chunks(stream(), import_format, chunk_size)]
+
+    return asyncio.run(collect())
+
+
+def test_ndjson_row_errors_keep_line_numbers():
+    body = '{"name": "张三", "email": "a@example.com"}\n\nnot json\n[1, 2]\r\n{"name": "李四", "email": "b@example.com"}'
+    (chunk,) = parse(body.encode(), "ndjson")
+    assert [row for row, _ in chunk] == [1, 3, 4, 5]
+    assert chunk[0][1] == {"name": "张三", "email": "a@example.com"}
+    assert chunk[1][1].startswith("JSON解析失败")
+    assert chunk[2][1] == "每行必须是一个JSON对象"
+    assert chunk[3][1]["name"] == "李四"
+
+
+def test_csv_parsing_and_column_errors():
+    body = (
+        "\ufeffname,email,is_blacklist,tags\n"  # 带 BOM 的 UTF-8
+        '张三,a@example.com,是,"[""VIP客户"", ""北京""]"\n'
+        "李四,b@example.com,0,潜在客户|上海\n"
+        "王五,c@example.com\n"
+    )
+    (chunk,) = parse(body.encode(), "csv")
+    assert [row for row, _ in chunk] == [2, 3, 4]
+    assert chunk[0][1] == {"name": "张三", "email": "a@example.com", "is_blacklist": True, "tags": ["VIP客户", "北京"]}
+    assert chunk[1][1]["is_blacklist"] is False
+    assert chunk[1][1]["tags"] == ["潜在客户", "上海"]
+    assert chunk[2][1] == "列数(2)与表头(4)不一致"
+
+
+def test_records_are_split_into_chunks():
+    body = "".join(f'{{"name": "c{number}", "email": "c{number}@example.com"}}\n' for number in range(25))
+    chunks = parse(body.encode(), "ndjson", chunk_size=10)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert chunks[-1][-1][0] == 25
+
+
+def test_upsert_reports_row_errors_and_writes_valid_rows(db):
+    with Session(engine) as session:
+        session.add(Customer(name="老客户", email="old@example.com", created_by=1, tags=["旧标签"]))
+        session.add(Customer(name="另一个", email="other@example.com", created_by=1))
+        session.commit()
+
+    records = [
+        (1, "JSON解析失败: Expecting value"),
+        (2, {"name": "", "email": "x@example.com"}),  # 名称为空
+        (3, {"name": "新客户", "email": "new@example.com", "tags": ["VIP客户", "VIP客户"]}),
+        (4, {"name": "老客户改名", "email": "old@example.com", "tags": ["VIP客户"], "is_blacklist": True}),
+        (5, {"name": "另一个", "email": "old2@example.com"}),  # 名称匹配到另一个客户, 与第4行不冲突
+        (6, {"name": "另一个", "email": "dup@example.com"}),  # 与第5行名称重复
+        (7, {"name": "老客户改名", "email": "other@example.com"}),  # 名称和邮箱分别属于不同客户
+    ]
+    inserted, updated, errors = upsert_customer_chunk(records, created_by=1)
+
+    assert (inserted, updated) == (1, 2)
+    error_rows = {error["row"]: error["error"] for error in errors}
+    assert sorted(error_rows) == [1, 2, 6, 7]
+    assert error_rows[1] == "JSON解析失败: Expecting value"
+    assert error_rows[2].startswith("name:")
+    assert error_rows[6] == "客户名称与第 5 行重复"
+
+    with Session(engine) as session:
+        customers = {customer.email: customer for customer in session.exec(select(Customer))}
+        tags = sorted(session.exec(select(CustomerTag.tag, CustomerTag.customer_id)).all())
+    assert customers["old@example.com"].name == "老客户改名"
+    assert customers["old@example.com"].is_blacklist
+    assert customers["old2@example.com"].name == "另一个"  # 按名称匹配, 更新了邮箱
+    assert customers["new@example.com"].tags == ["VIP客户"]
+    assert tags == sorted(
+        [("VIP客户", customers["new@example.com"].id), ("VIP客户", customers["old@example.com"].id)]
+    )
+
+
+def test_upsert_same_customer_matched_twice(db):
+    with Session(engine) as session:
+        session.add(Customer(name="张三", email="zhangsan@example.com", created_by=1))
+        session.commit()
+
+    records = [
+        (1, {"name": "张三", "email": "zhangsan2@example.com"}),
+        (2, {"name": "张三丰", "email": "zhangsan@example.com"}),
+    ]
+    inserted, updated, errors = upsert_customer_chunk(records, created_by=1)
+    assert (inserted, updated) == (0, 1)
+    assert errors == [{"row": 2, "error": "与第 1 行匹配到同一个已有客户"}]
+
+
+def test_duplicate_email_in_chunk_keeps_last_row(db):
+    records = [
+        (1, {"name": "张三", "email": "a@example.com"}),
+        (2, {"name": "李四", "email": "b@example.com"}),
+        (3, {"name": "张三丰", "email": "a@example.com"}),
+    ]
+    inserted, updated, errors = upsert_customer_chunk(records, created_by=1)
+    assert (inserted, updated) == (2, 0)
+    assert errors == [{"row": 1, "error": "与第 3 行邮箱重复, 以后者为准"}]
+    with Session(engine) as session:
+        assert session.exec(select(Customer.name).where(Customer.email == "a@example.com")).one() == "张三丰"
+
+
+def test_integrity_error_only_fails_conflicting_rows(db):
+    with Session(engine) as session:
+        session.add(Customer(name="老客户", email="old@example.com", created_by=1))
+        session.commit()
+        # 模拟查询之后才出现的并发冲突: 预检查发现不了, 只能在写入时报唯一约束错误
+        session.exec(
+            text(
+                "CREATE TEMP TRIGGER import_conflict BEFORE INSERT ON customer "
+                "WHEN NEW.email LIKE 'bad%' BEGIN SELECT RAISE(ABORT, 'conflict'); END"
+            )
+        )
+        session.commit()
+    try:
+        records = [(number, {"name": f"c{number}", "email": f"c{number}@example.com"}) for number in range(1, 8)]
+        records[0][1]["tags"] = ["VIP客户"]
+        records[2] = (3, {"name": "c3", "email": "bad3@example.com", "tags": ["VIP客户"]})
+        records[5] = (6, {"name": "c6", "email": "bad6@example.com"})
+        records.append((8, {"name": "老客户改名", "email": "old@example.com"}))
+        inserted, updated, errors = upsert_customer_chunk(records, created_by=1)
+    finally:
+        with Session(engine) as session:
+            session.exec(text("DROP TRIGGER IF EXISTS temp.import_conflict"))
+            session.commit()
+
+    assert (inserted, updated) == (5, 1)
+    assert [error["row"] for error in errors] == [3, 6]
+    assert all(error["error"].startswith("写入失败") for error in errors)
+    with Session(engine) as session:
+        names = set(session.exec(select(Customer.name)))
+        tags = session.exec(select(CustomerTag.tag, Customer.name).join(Customer)).all()
+    assert names == {"c1", "c2", "c4", "c5", "c7", "老客户改名"}
+    assert tags == [("VIP客户", "c1")]
@@ -0,0 +1,90 @@
+import pytest
+from sqlmodel import Session, select, text
+
+from crm_backend.db.customer_search import apply_customer_search, build_match_query, ensure_customer_fts
+from crm_backend.db.db import engine
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.models.customer import Customer
+
+
+@pytest.fixture
+def fts(db):
+    ensure_customer_fts()
+
+
+def search(q: str):
+    with Session(engine) as session:
+        return session.exec(apply_customer_search(select(Customer.name), q)).all()
+
+
+@pytest.mark.parametrize(
+    "q, match",
+    [
+        ("zhang@company", '"zhang"* "company"*'),
+        ('张三 "OR" NOT', '"张三"* "OR"* "NOT"*'),  # 运算符和引号都按普通词处理
+        ("name:abc* (x) NEAR/2 y", '"name"* "abc"* "x"* "NEAR"* "2"* "y"*'),
+        ("a_b-c", '"a"* "b"* "c"*'),
+    ],
+)
+def test_build_match_query_quotes_every_token(q, match):
+    assert build_match_query(q) == match
+
+
+@pytest.mark.parametrize("q", ["", "  ", '"*()^:-', "___"])
+def test_build_match_query_rejects_queries_without_words(q):
+    with pytest.raises(CrmHTTPException) as error:
+        build_match_query(q)
+    assert error.value.status_code == 400
+
+
+def test_search_index_follows_customer_writes(fts):
+    with Session(engine) as session:
+        session.add(Customer(name="张三", email="zhang@company.com", created_by=1, tags=["VIP客户"]))
+        session.add(Customer(name="李四", email="li@other.com", created_by=1))
+        session.commit()
+    assert search("zhang") == ["张三"]
+    assert search("VIP") == ["张三"]
+    assert search('com "OR"') == []
+
+    with Session(engine) as session:
+        customer = session.exec(select(Customer).where(Customer.name == "李四")).one()
+        customer.tags = ["VIP客户", "北京"]
+        customer.email = "li@company.com"
+        session.add(customer)
+        session.commit()
+    assert search("company") == ["张三", "李四"]
+    assert search("北京") == ["李四"]
+    assert search("other") == []
+
+    with Session(engine) as session:
+        session.delete(session.exec(select(Customer).where(Customer.name == "张三")).one())
+        session.commit()
+    assert search("VIP") == ["李四"]
+    assert search("zhang") == []
+
+
+def test_search_ranks_name_matches_first(fts):
+    with Session(engine) as session:
+        session.add(Customer(name="other", email="wang@example.com", created_by=1))
+        session.add(Customer(name="wang", email="w@example.com", created_by=1))
+        session.commit()
+    assert search("wang") == ["wang", "other"]
+
+
+def test_ensure_customer_fts_rebuilds_missing_index(fts):
+    with Session(engine) as session:
+        session.add(Customer(name="张三", email="zhang@company.com", created_by=1))
+        session.commit()
+        session.exec(text("INSERT INTO customer_fts(customer_fts) VALUES ('delete-all')"))
+        session.commit()
+    assert search("zhang") == []
+    ensure_customer_fts()
+    assert search("zhang") == ["张三"]
+
+
+def test_search_cannot_be_combined_with_cursor(client, make_user):
+    _, headers = make_user("admin", is_admin=True)
+    response = client.get("/api/customers/query", params={"q": "zhang", "cursor": "abc"}, headers=headers)
+    assert response.status_code == 400
+    response = client.get("/api/customers/query", params={"q": "zhang"}, headers=headers)
+    assert response.status_code == 200
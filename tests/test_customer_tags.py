@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select
+
+from crm_backend.db import customer_tags
+from crm_backend.db.customer_tags import backfill_customer_tags, customer_ids_with_tags, normalize_tags
+from crm_backend.db.db import engine
+from crm_backend.models.customer import Customer, CustomerTag
+
+
+def tag_rows():
+    with Session(engine) as session:
+        return sorted(session.exec(select(CustomerTag.tag, CustomerTag.customer_id)).all())
+
+
+@pytest.mark.parametrize(
+    "tags, expected",
+    [
+        (None, []),
+        ("", []),
+        (["VIP客户", "北京", "VIP客户", "", 1], ["VIP客户", "北京"]),
+        ('["VIP客户", "北京"]', ["VIP客户", "北京"]),  # 历史数据中的JSON字符串
+        ('"VIP客户"', ["VIP客户"]),
+        ("VIP客户", ["VIP客户"]),  # 普通字符串
+        ('{"a": 1}', []),
+    ],
+)
+def test_normalize_tags(tags, expected):
+    assert normalize_tags(tags) == expected
+
+
+def test_tag_index_follows_customer_api_writes(client, make_user):
+    _, headers = make_user("admin", is_admin=True)
+    body = {"name": "张三", "email": "a@example.com", "tags": ["VIP客户", "北京", "VIP客户"]}
+    response = client.post("/api/customers/add", json=body, headers=headers)
+    customer_id = response.json()["data"]["customer"]["id"]
+    assert tag_rows() == [("VIP客户", customer_id), ("北京", customer_id)]
+
+    body = {"update_key": ["tags"], "update_Customer": {"tags": ["上海"]}}
+    assert client.post(f"/api/customers/update/{customer_id}", json=body, headers=headers).status_code == 200
+    assert tag_rows() == [("上海", customer_id)]
+
+    response = client.get("/api/customers/query", params={"tags": ["上海"]}, headers=headers)
+    assert [customer["id"] for customer in response.json()["data"]] == [customer_id]
+
+    assert client.post(f"/api/customers/delete/{customer_id}", headers=headers).status_code == 200
+    assert tag_rows() == []
+
+
+def test_backfill_from_legacy_tags_in_chunks(db, monkeypatch):
+    monkeypatch.setattr(customer_tags, "BACKFILL_CHUNK_SIZE", 2)
+    with Session(engine) as session:
+        session.exec(  # 绕过模型, 模拟旧版本写入的各种 tags 格式
+            insert(Customer),  # type: ignore
+            params=[
+                {"name": "a", "email": "a@example.com", "created_by": 1, "tags": ["VIP客户", "北京"]},
+                {"name": "b", "email": "b@example.com", "created_by": 1, "tags": "潜在客户"},
+                {"name": "c", "email": "c@example.com", "created_by": 1, "tags": None},
+                {"name": "d", "email": "d@example.com", "created_by": 1, "tags": ["VIP客户"]},
+                {"name": "e", "email": "e@example.com", "created_by": 1, "tags": ["上海"]},
+            ],
+        )
+        session.exec(delete(CustomerTag))  # type: ignore
+        session.commit()
+        ids = {name: customer_id for customer_id, name in session.exec(select(Customer.id, Customer.name))}
+
+    backfill_customer_tags()
+    assert tag_rows() == sorted(
+        [
+            ("VIP客户", ids["a"]),
+            ("北京", ids["a"]),
+            ("潜在客户", ids["b"]),
+            ("VIP客户", ids["d"]),
+            ("上海", ids["e"]),
+        ]
+    )
+    with Session(engine) as session:
+        assert sorted(session.exec(customer_ids_with_tags(["VIP客户", "上海"])).all()) == sorted(
+            [ids["a"], ids["d"], ids["e"]]
+        )
+
+
+def test_backfill_skips_when_index_has_rows(db):
+    with Session(engine) as session:
+        session.add(Customer(name="a", email="a@example.com", created_by=1, tags=["VIP客户"]))
+        session.add(CustomerTag(tag="北京", customer_id=999))
+        session.commit()
+    backfill_customer_tags()
+    assert tag_rows() == [("北京", 999)]
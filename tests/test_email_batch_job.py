@@ -0,0 +1,68 @@
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from crm_backend.db import email_task_batch
+from crm_backend.db.customer_tags import sync_customer_tags
+from crm_backend.db.db import engine
+from crm_backend.db.email_task_batch import run_email_batch_job
+from crm_backend.models.customer import Customer
+from crm_backend.models.email_batch_job import JOB_STATUS_DONE, EmailBatchJob
+from crm_backend.models.email_task import EmailTask
+
+
+def test_batch_job_reads_customers_off_the_writer(db, monkeypatch):
+    monkeypatch.setattr(email_task_batch, "BATCH_INSERT_CHUNK_SIZE", 2)
+    with Session(engine) as session:
+        for number in range(5):
+            customer = Customer(
+                name=f"c{number}",
+                email=f"c{number}@example.com",
+                created_by=1,
+                tags=["VIP客户"],
+                is_blacklist=number == 3,
+            )
+            session.add(customer)
+            sync_customer_tags(session, customer)
+        session.add(Customer(name="d", email="d@example.com", created_by=1))
+        job = EmailBatchJob(name="推广", created_by="sales@example.com")
+        session.add(job)
+        session.commit()
+        job_id = job.id
+
+    statements = []
+
+    def listener(connection, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    created = []
+    try:
+        run_email_batch_job(
+            job_id,  # type: ignore
+            tags=["VIP客户"],
+            emails=["d@example.com", "c0@example.com"],
+            content_id=1,
+            on_tasks_created=lambda first, last: created.append((first, last)),
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements == []  # 只用执行器的写连接和只读连接, 不占用请求的写连接
+
+    with Session(engine) as session:
+        job = session.get(EmailBatchJob, job_id)
+        tasks = session.exec(select(EmailTask).order_by(EmailTask.id)).all()  # type: ignore
+    assert (job.status, job.total_customers, job.created_count, job.skipped_count) == (
+        JOB_STATUS_DONE,
+        6,
+        5,
+        1,
+    )
+    assert sorted(task.send_to for task in tasks) == [
+        "c0@example.com",
+        "c1@example.com",
+        "c2@example.com",
+        "c4@example.com",
+        "d@example.com",
+    ]
+    assert {(task.job_id, task.send_by, task.name) for task in tasks} == {(job_id, "sales@example.com", "推广")}
+    assert len(created) == 3 and created[0][0] == tasks[0].id and created[-1][1] == tasks[-1].id
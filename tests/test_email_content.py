@@ -0,0 +1,102 @@
+import pytest
+from sqlmodel import Session, func, select
+
+from crm_backend.controls.ctr_email_task import resolve_email_content
+from crm_backend.db.db import engine
+from crm_backend.db.email_content import (
+    email_content_hash,
+    email_task_list_statement,
+    email_task_rows_to_dicts,
+    get_or_create_email_content,
+    load_email_content,
+    task_email,
+)
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.models.email_content import EmailContent
+from crm_backend.models.email_task import Email, EmailTask
+
+
+@pytest.fixture
+def content_cache(db):
+    # 清空数据后内容ID会被重新使用, 缓存不能带到其他测试中
+    load_email_content.cache_clear()
+    yield
+    load_email_content.cache_clear()
+
+
+def content_count() -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(EmailContent)).one()
+
+
+def test_hash_depends_on_every_field():
+    email = Email(subject="你好", body="<p>hi</p>")
+    assert email_content_hash(email) == email_content_hash(Email(subject="你好", body="<p>hi</p>"))
+    variants = [
+        email,
+        Email(subject="你好", body="<p>hi!</p>"),
+        Email(subject="您好", body="<p>hi</p>"),
+        Email(subject="你好", body="<p>hi</p>", use_template=True),
+    ]
+    assert len({email_content_hash(variant) for variant in variants}) == 4
+
+
+def test_same_content_is_stored_once(db):
+    with Session(engine) as session:
+        first = get_or_create_email_content(session, Email(subject="s", body="b"))
+        session.commit()
+    with Session(engine) as session:
+        again = get_or_create_email_content(session, Email(subject="s", body="b"))
+        other = get_or_create_email_content(session, Email(subject="s", body="b", use_template=True))
+        session.commit()
+    assert again == first
+    assert other != first
+    assert content_count() == 2
+
+
+def test_resolve_email_content_by_id(db):
+    with Session(engine) as session:
+        content_id = resolve_email_content(session, Email(subject="s", body="b"), None)
+        assert resolve_email_content(session, None, content_id) == content_id
+        for email, missing_id, status_code in [(None, None, 400), (None, 999999, 404)]:
+            with pytest.raises(CrmHTTPException) as error:
+                resolve_email_content(session, email, missing_id)
+            assert error.value.status_code == status_code
+        session.commit()
+    assert content_count() == 1
+
+
+def test_task_email_reads_content_or_legacy_json(content_cache):
+    with Session(engine) as session:
+        content_id = get_or_create_email_content(session, Email(subject="新", body="内容"))
+        session.commit()
+
+    with pytest.raises(LookupError):
+        load_email_content(999999)
+    new_task = EmailTask(name="t", send_by="a@example.com", send_to="c@example.com", content_id=content_id)
+    legacy_task = EmailTask(
+        name="t", send_by="a@example.com", send_to="c@example.com", email={"subject": "旧", "body": "正文"}
+    )
+    assert task_email(new_task) == Email(subject="新", body="内容")
+    assert task_email(new_task) == Email(subject="新", body="内容")
+    assert load_email_content.cache_info().hits == 1
+    assert task_email(legacy_task) == Email(subject="旧", body="正文")
+
+
+def test_task_list_includes_content_only_on_request(db):
+    with Session(engine) as session:
+        content_id = get_or_create_email_content(session, Email(subject="新", body="内容"))
+        session.add(EmailTask(name="new", send_by="a@example.com", send_to="c@example.com", content_id=content_id))
+        session.add(
+            EmailTask(name="legacy", send_by="a@example.com", send_to="c@example.com", email={"subject": "旧", "body": "正文"})
+        )
+        session.commit()
+
+        plain = email_task_rows_to_dicts(session.exec(email_task_list_statement(False)).all(), False)
+        full = email_task_rows_to_dicts(session.exec(email_task_list_statement(True)).all(), True)
+    assert all("email" not in task for task in plain)
+    assert {task["name"]: task["content_id"] for task in plain} == {"new": content_id, "legacy": None}
+    assert {task["name"]: task["email"] for task in full} == {
+        "new": {"subject": "新", "body": "内容"},
+        "legacy": {"subject": "旧", "body": "正文"},
+    }
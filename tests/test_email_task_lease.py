@@ -0,0 +1,172 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlmodel import Session, select
+
+from crm_backend.db.db import engine
+from crm_backend.db.email_task_batch import fail_interrupted_batch_jobs
+from crm_backend.db.email_task_lease import (
+    claim_email_tasks,
+    reclaim_expired_email_tasks,
+    release_email_task_leases,
+    renew_batch_job_leases,
+    renew_email_task_leases,
+)
+from crm_backend.models.email_batch_job import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    EmailBatchJob,
+)
+from crm_backend.models.email_task import (
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SENDING,
+    TASK_STATUS_SUCCESS,
+    EmailTask,
+)
+from crm_backend.utils.email_status_writer import EmailStatusWriter
+
+
+def add_tasks(count: int, send_by: str = "a@example.com") -> List[int]:
+    with Session(engine) as session:
+        tasks = [
+            EmailTask(name="t", send_by=send_by, send_to=f"c{number}@example.com")
+            for number in range(count)
+        ]
+        session.add_all(tasks)
+        session.commit()
+        return [task.id for task in tasks]  # type: ignore
+
+
+def set_task(task_id: int, **values):
+    with Session(engine) as session:
+        task = session.get(EmailTask, task_id)
+        for key, value in values.items():
+            setattr(task, key, value)
+        session.add(task)
+        session.commit()
+
+
+def load_tasks() -> Dict[int, EmailTask]:
+    with Session(engine) as session:
+        return {task.id: task for task in session.exec(select(EmailTask))}  # type: ignore
+
+
+def expired() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=1)
+
+
+def test_claims_do_not_overlap(db):
+    ids = add_tasks(5)
+    first = claim_email_tasks("A", 60, limit=3)
+    second = claim_email_tasks("B", 60, limit=10)
+    assert first == ids[:3]
+    assert second == ids[3:]
+    assert claim_email_tasks("C", 60, limit=10) == []
+    assert {task.lease_owner for task in load_tasks().values()} == {"A", "B"}
+
+
+def test_claim_after_id_and_excluded_senders(db):
+    a_ids = add_tasks(2, send_by="a@example.com")
+    b_ids = add_tasks(2, send_by="b@example.com")
+    assert claim_email_tasks("A", 60, limit=10, after_id=a_ids[0]) == [a_ids[1], *b_ids]
+    assert claim_email_tasks("B", 60, limit=10, exclude_senders=["a@example.com"]) == []
+    assert claim_email_tasks("B", 60, limit=10) == [a_ids[0]]
+
+
+def test_expired_lease_can_be_claimed_again(db):
+    ids = add_tasks(2)
+    claim_email_tasks("A", 60, limit=10)
+    set_task(ids[0], lease_expires_at=expired())
+    assert claim_email_tasks("B", 60, limit=10) == [ids[0]]
+
+
+def test_renew_extends_only_own_unfinished_tasks(db):
+    ids = add_tasks(3)
+    claim_email_tasks("A", 1, limit=2)
+    claim_email_tasks("B", 1, limit=1)
+    set_task(ids[1], status=TASK_STATUS_SUCCESS)
+    before = load_tasks()
+
+    assert renew_email_task_leases("A", 60) == 1
+    after = load_tasks()
+    assert after[ids[0]].lease_expires_at > before[ids[0]].lease_expires_at + timedelta(seconds=30)
+    assert after[ids[1]].lease_expires_at == before[ids[1]].lease_expires_at
+    assert after[ids[2]].lease_expires_at == before[ids[2]].lease_expires_at
+
+
+def test_reclaim_only_expired_sending_tasks(db):
+    ids = add_tasks(3)
+    claim_email_tasks("A", 60, limit=3)
+    set_task(ids[1], status=TASK_STATUS_SENDING, lease_expires_at=expired())
+    set_task(ids[2], status=TASK_STATUS_SENDING)
+
+    assert reclaim_expired_email_tasks() == ids[1]
+    tasks = load_tasks()
+    assert (tasks[ids[1]].status, tasks[ids[1]].lease_owner) == (TASK_STATUS_PENDING, None)
+    assert (tasks[ids[2]].status, tasks[ids[2]].lease_owner) == (TASK_STATUS_SENDING, "A")
+    assert tasks[ids[0]].lease_owner == "A"  # 待处理任务的租约未过期, 不受影响
+    assert reclaim_expired_email_tasks() is None
+
+
+def test_release_keeps_sending_tasks_leased(db):
+    ids = add_tasks(2)
+    claim_email_tasks("A", 60, limit=2)
+    set_task(ids[1], status=TASK_STATUS_SENDING)
+
+    assert release_email_task_leases("A") == 1
+    tasks = load_tasks()
+    assert tasks[ids[0]].lease_owner is None
+    assert (tasks[ids[1]].status, tasks[ids[1]].lease_owner) == (TASK_STATUS_SENDING, "A")
+
+
+def test_status_writes_require_a_live_lease(db):
+    ids = add_tasks(4)
+    claim_email_tasks("A", 60, limit=3)
+    set_task(ids[1], lease_expires_at=expired())  # 租约已过期
+    set_task(ids[2], lease_owner="B")  # 已被其他执行器认领
+
+    async def write():
+        writer = EmailStatusWriter(flush_interval=1.0, batch_size=100, lease_owner="A")
+        writer.put(ids[0], TASK_STATUS_SUCCESS)
+        writer.put(ids[1], TASK_STATUS_SUCCESS)
+        writer.put(ids[2], TASK_STATUS_SUCCESS)
+        writer.put(ids[3], TASK_STATUS_SENDING)  # 从未认领
+        await writer.flush()
+        return writer
+
+    writer = asyncio.run(write())
+    assert writer.lease_lost == 3
+    tasks = load_tasks()
+    assert tasks[ids[0]].status == TASK_STATUS_SUCCESS
+    assert tasks[ids[0]].lease_owner is None and tasks[ids[0]].sended_at is not None
+    assert [tasks[task_id].status for task_id in ids[1:]] == [TASK_STATUS_PENDING] * 3
+
+
+def test_only_batch_jobs_with_expired_leases_are_failed(db):
+    live = datetime.utcnow() + timedelta(seconds=60)
+    with Session(engine) as session:
+        for name, status, owner, expires_at in [
+            ("live", JOB_STATUS_RUNNING, "A", live),
+            ("dead", JOB_STATUS_RUNNING, "B", expired()),
+            ("renewed", JOB_STATUS_QUEUED, "C", expired()),
+            ("legacy", JOB_STATUS_QUEUED, None, None),  # 旧版本创建的作业没有租约
+        ]:
+            session.add(
+                EmailBatchJob(
+                    name=name, created_by="x", status=status, lease_owner=owner, lease_expires_at=expires_at
+                )
+            )
+        session.commit()
+
+    assert renew_batch_job_leases("C", 60) == 1
+    fail_interrupted_batch_jobs()
+    with Session(engine) as session:
+        status = {job.name: job.status for job in session.exec(select(EmailBatchJob))}
+    assert status == {
+        "live": JOB_STATUS_RUNNING,
+        "dead": JOB_STATUS_FAILED,
+        "renewed": JOB_STATUS_QUEUED,
+        "legacy": JOB_STATUS_FAILED,
+    }
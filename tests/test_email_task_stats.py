@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, select, text
+
+from crm_backend.db.db import engine
+from crm_backend.db.email_task_batch import get_job_task_counts
+from crm_backend.db.email_task_stats import ensure_email_task_stats, read_email_task_stats
+from crm_backend.models.email_task import (
+    TASK_STATUS_FAILED,
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SUCCESS,
+    EmailTask,
+)
+from crm_backend.models.email_task_stat import (
+    STAT_BY_JOB,
+    STAT_BY_NAME,
+    STAT_BY_SENDED_HOUR,
+    STAT_BY_SENDER,
+)
+
+
+HOUR = datetime(2025, 1, 1, 8, 30)
+
+
+def stats(dimension: str, **kwargs):
+    with Session(engine) as session:
+        return read_email_task_stats(session, dimension, **kwargs)
+
+
+def add_tasks(*tasks: EmailTask):
+    with Session(engine) as session:
+        session.add_all(tasks)
+        session.commit()
+        return [task.id for task in tasks]
+
+
+def update_task(task_id: int, **values):
+    with Session(engine) as session:
+        task = session.get(EmailTask, task_id)
+        for key, value in values.items():
+            setattr(task, key, value)
+        session.add(task)
+        session.commit()
+
+
+def test_stats_follow_inserts_updates_and_deletes(db):
+    first, second, third = add_tasks(
+        EmailTask(name="春节", send_by="a@example.com", send_to="c1@example.com", job_id=7),
+        EmailTask(name="春节", send_by="a@example.com", send_to="c2@example.com", job_id=7),
+        EmailTask(name="中秋", send_by="b@example.com", send_to="c3@example.com"),
+    )
+    assert stats(STAT_BY_NAME) == {"中秋": {TASK_STATUS_PENDING: 1}, "春节": {TASK_STATUS_PENDING: 2}}
+    assert stats(STAT_BY_JOB) == {"7": {TASK_STATUS_PENDING: 2}}
+    assert stats(STAT_BY_SENDED_HOUR) == {}  # 未发送完成的任务不按发送时间统计
+
+    update_task(first, status=TASK_STATUS_SUCCESS, sended_at=HOUR)
+    update_task(second, status=TASK_STATUS_FAILED, sended_at=HOUR + timedelta(hours=1))
+    update_task(third, name="元宵", send_by="a@example.com")
+    assert stats(STAT_BY_NAME) == {
+        "元宵": {TASK_STATUS_PENDING: 1},
+        "春节": {TASK_STATUS_SUCCESS: 1, TASK_STATUS_FAILED: 1},
+    }
+    assert stats(STAT_BY_SENDER) == {
+        "a@example.com": {TASK_STATUS_SUCCESS: 1, TASK_STATUS_FAILED: 1, TASK_STATUS_PENDING: 1}
+    }
+    assert stats(STAT_BY_SENDED_HOUR) == {
+        "2025-01-01 08:00": {TASK_STATUS_SUCCESS: 1},
+        "2025-01-01 09:00": {TASK_STATUS_FAILED: 1},
+    }
+    assert stats(STAT_BY_SENDED_HOUR, key_from="2025-01-01 09:00") == {
+        "2025-01-01 09:00": {TASK_STATUS_FAILED: 1}
+    }
+    with Session(engine) as session:
+        assert get_job_task_counts(session, 7) == {"queued": 0, "sent": 1, "failed": 1}
+
+    update_task(second, job_id=None)
+    with Session(engine) as session:
+        session.delete(session.get(EmailTask, first))
+        session.commit()
+    assert stats(STAT_BY_JOB) == {}
+    assert stats(STAT_BY_SENDED_HOUR) == {"2025-01-01 09:00": {TASK_STATUS_FAILED: 1}}
+    assert stats(STAT_BY_NAME, key="春节") == {"春节": {TASK_STATUS_FAILED: 1}}
+
+
+def test_stats_are_rebuilt_when_triggers_are_created(db):
+    add_tasks(
+        EmailTask(name="春节", send_by="a@example.com", send_to="c1@example.com"),
+        EmailTask(
+            name="春节", send_by="a@example.com", send_to="c2@example.com", status=TASK_STATUS_SUCCESS, sended_at=HOUR
+        ),
+    )
+    expected = {dimension: stats(dimension) for dimension in (STAT_BY_NAME, STAT_BY_SENDER, STAT_BY_SENDED_HOUR)}
+
+    # 模拟从旧版本升级: 没有触发器, 统计表为空
+    with Session(engine) as session:
+        for name in ("emailtaskstat_ai", "emailtaskstat_ad", "emailtaskstat_au"):
+            session.exec(text(f"DROP TRIGGER {name}"))
+        session.exec(text("DELETE FROM emailtaskstat"))
+        session.commit()
+    ensure_email_task_stats()
+
+    assert {dimension: stats(dimension) for dimension in expected} == expected
+    with Session(engine) as session:
+        triggers = session.exec(
+            text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'emailtaskstat_%'")
+        ).one()
+    assert triggers == (3,)
+
+
+def test_dashboard_reads_stats(client, make_user):
+    now = datetime.utcnow()
+    add_tasks(
+        EmailTask(
+            name="春节", send_by="a@example.com", send_to="c1@example.com", status=TASK_STATUS_SUCCESS, sended_at=now
+        ),
+        EmailTask(
+            name="春节",
+            send_by="a@example.com",
+            send_to="c2@example.com",
+            status=TASK_STATUS_SUCCESS,
+            sended_at=now - timedelta(hours=3),
+        ),
+        EmailTask(name="中秋", send_by="b@example.com", send_to="c3@example.com"),
+    )
+    _, headers = make_user("user")
+    assert client.get("/api/email_tasks/dashboard", headers=headers).status_code == 403
+
+    _, headers = make_user("admin", is_admin=True)
+    response = client.get("/api/email_tasks/dashboard", params={"hours": 2, "name": "春节"}, headers=headers)
+    data = response.json()["data"]
+    assert data["by_status"] == {TASK_STATUS_SUCCESS: 2, TASK_STATUS_PENDING: 1}
+    assert data["by_name"] == {"春节": {TASK_STATUS_SUCCESS: 2}}
+    assert data["by_send_by"] == {"a@example.com": {TASK_STATUS_SUCCESS: 2}, "b@example.com": {TASK_STATUS_PENDING: 1}}
+    assert data["by_sended_hour"] == {now.strftime("%Y-%m-%d %H:00"): {TASK_STATUS_SUCCESS: 1}}
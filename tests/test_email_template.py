@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from crm_backend.utils.email_template import RecipientContext, TemplateError, compile_template
+
+
+def context(tags=(), name="张三", email="zhangsan@example.com"):
+    return RecipientContext(name=name, email=email, tags=tags, sender="sales@example.com")
+
+
+def render(source: str, ctx: RecipientContext, escape: bool = True) -> str:
+    return compile_template(source, escape=escape).render(ctx)
+
+
+def test_merge_fields():
+    template = compile_template("{{ customer.name }} <{{customer.email}}> from {{ sender.email }}", escape=False)
+    assert not template.is_static
+    assert template.render(context()) == "张三 <zhangsan@example.com> from sales@example.com"
+
+
+def test_static_template_does_not_need_recipient():
+    template = compile_template("<p>hello</p>", escape=True)
+    assert template.is_static
+    assert template.render(None) == "<p>hello</p>"
+
+
+def test_nested_if_else():
+    source = (
+        '{% if tag "VIP客户" %}'
+        '{% if not tag "已流失" %}A{% else %}B{% endif %}'
+        "{% else %}"
+        '{% if tag "潜在客户" %}C{% else %}D{% endif %}'
+        "{% endif %}"
+    )
+    assert render(source, context({"VIP客户"})) == "A"
+    assert render(source, context({"VIP客户", "已流失"})) == "B"
+    assert render(source, context({"潜在客户"})) == "C"
+    assert render(source, context()) == "D"
+
+
+def test_merge_fields_are_html_escaped_only_in_body():
+    ctx = context(name='<b>"Tom" & Jerry</b>')
+    assert render("<p>{{ customer.name }}</p>", ctx) == "<p>&lt;b&gt;&quot;Tom&quot; &amp; Jerry&lt;/b&gt;</p>"
+    assert render("{{ customer.name }}", ctx, escape=False) == '<b>"Tom" & Jerry</b>'
+
+
+def test_raw_block_is_output_verbatim():
+    source = '{% raw %}{{ customer.name }} {% if tag "x" %}{% endraw %} {{ customer.name }}'
+    assert render(source, context()) == '{{ customer.name }} {% if tag "x" %} 张三'
+
+
+@pytest.mark.parametrize(
+    "source, message",
+    [
+        ("{{ customer.phone }}", "未知的模板变量 'customer.phone'"),
+        ('第一行\n{% if tag "VIP" %}', "未结束的 {% if %}"),
+        ("a\nb\n{% endif %}", "第3行: 多余的 {% endif %}"),
+        ('{% if tag "a" %}x{% else %}y{% else %}z{% endif %}', "多余的 {% else %}"),
+        ("{% for x in y %}", "无法识别的语句"),
+        ("{% raw %}{{ x }}", "缺少 {% endraw %}"),
+        ("{% endraw %}", "多余的 {% endraw %}"),
+    ],
+)
+def test_compile_errors(source, message):
+    with pytest.raises(TemplateError, match=re.escape(message)):
+        compile_template(source, escape=True)
@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, select
+
+from crm_backend.db.db import engine
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.models.customer import Customer
+from crm_backend.utils.pagination import decode_cursor, encode_cursor, page_result, paginate
+
+
+ORDER_COLUMNS = (Customer.created_at, Customer.id)
+
+
+def raw_cursor(payload: bytes) -> str:
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = encode_cursor([created_at, 42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, ORDER_COLUMNS) == [created_at, 42]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "!!!",  # 不是 base64
+        raw_cursor(b"not json"),
+        raw_cursor(b"\xff\xfe"),  # 不是UTF-8
+        raw_cursor(json.dumps({"id": 1}).encode()),  # 不是列表
+        raw_cursor(json.dumps(["2024-05-01T12:30:15"]).encode()),  # 长度与排序列不一致
+        raw_cursor(json.dumps(["2024-05-01T12:30:15", 1, 2]).encode()),
+        raw_cursor(json.dumps(["yesterday", 1]).encode()),  # 日期格式不对
+        raw_cursor(json.dumps([12345, 1]).encode()),  # 日期类型不对
+        raw_cursor(json.dumps([None, 1]).encode()),
+    ],
+)
+def test_decode_cursor_rejects_bad_input(cursor):
+    with pytest.raises(CrmHTTPException) as error:
+        decode_cursor(cursor, ORDER_COLUMNS)
+    assert error.value.status_code == 400
+
+
+def test_cursor_pages_cover_every_row_once(db):
+    # 一半客户的创建时间相同, 翻页必须靠 id 区分, 不能重复或遗漏
+    base = datetime(2024, 1, 1)
+    with Session(engine) as session:
+        for number in range(25):
+            session.add(
+                Customer(
+                    name=f"c{number}",
+                    email=f"c{number}@example.com",
+                    created_by=1,
+                    created_at=base if number % 2 else base + timedelta(minutes=number),
+                )
+            )
+        session.commit()
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = page_result(
+                session.exec(paginate(select(Customer), ORDER_COLUMNS, 10, cursor=cursor)).all(),
+                ORDER_COLUMNS,
+                10,
+            )
+            seen.extend(customer.id for customer in rows)
+            pages += 1
+            if cursor is None:
+                break
+        expected = session.exec(select(Customer.id).order_by(*ORDER_COLUMNS)).all()
+
+    assert pages == 3
+    assert seen == list(expected)
+
+
+def test_last_full_page_has_no_next_cursor(db):
+    with Session(engine) as session:
+        for number in range(10):
+            session.add(Customer(name=f"c{number}", email=f"c{number}@example.com", created_by=1))
+        session.commit()
+        rows, cursor = page_result(
+            session.exec(paginate(select(Customer), ORDER_COLUMNS, 10)).all(), ORDER_COLUMNS, 10
+        )
+    assert len(rows) == 10
+    assert cursor is None
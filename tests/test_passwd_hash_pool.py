@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+import pytest
+
+from crm_backend.models.crm_http_exception import CrmHTTPException
+from crm_backend.utils import security
+from crm_backend.utils.security import PasswdHashPool, get_passwd_hash_bounded, verify_passwd_async
+
+
+def test_full_pool_rejects_with_503_and_frees_slots():
+    pool = PasswdHashPool(workers=1, queue_limit=1)
+    release = threading.Event()
+    running = pool.submit(release.wait)
+    queued = pool.submit(lambda: "queued")
+
+    with pytest.raises(CrmHTTPException) as error:
+        pool.submit(lambda: "rejected")
+    assert error.value.status_code == 503
+    assert pool.stats()["rejected"] == 1
+
+    release.set()
+    assert running.result(timeout=5) is True
+    assert queued.result(timeout=5) == "queued"
+    assert pool.submit(lambda: "again").result(timeout=5) == "again"
+    assert pool.stats()["completed"] == 3
+
+
+def test_failed_hash_releases_its_slot():
+    pool = PasswdHashPool(workers=1, queue_limit=0)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        pool.submit(fail).result(timeout=5)
+    assert pool.submit(lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_hash_and_verify_round_trip():
+    hashed = get_passwd_hash_bounded("secret")
+    assert hashed != "secret"
+    assert asyncio.run(verify_passwd_async("secret", hashed))
+    assert not asyncio.run(verify_passwd_async("wrong", hashed))
+
+
+def test_login_returns_503_when_pool_is_saturated(client, make_user, monkeypatch):
+    make_user("alice", passwd=security.get_passwd_hash("secret"))
+    pool = PasswdHashPool(workers=1, queue_limit=0)
+    release = threading.Event()
+    pool.submit(release.wait)
+    monkeypatch.setattr(security, "passwd_hash_pool", pool)
+    try:
+        response = client.post("/api/users/login", json={"name": "alice", "passwd": "secret"})
+        assert response.status_code == 503
+    finally:
+        release.set()
+    response = client.post("/api/users/login", json={"name": "alice", "passwd": "secret"})
+    assert response.status_code == 200
@@ -0,0 +1,124 @@
+from sqlmodel import Session, select
+
+from crm_backend.db.customer_tags import delete_customer_tags, sync_customer_tags
+from crm_backend.db.db import engine
+from crm_backend.db.row_counters import ensure_row_counters, read_counter, read_counters_by_key
+from crm_backend.models.customer import Customer, CustomerTag
+from crm_backend.models.email_task import (
+    TASK_STATUS_PENDING,
+    TASK_STATUS_SENDING,
+    TASK_STATUS_SUCCESS,
+    EmailTask,
+)
+from crm_backend.models.row_counter import (
+    COUNTER_CUSTOMERS,
+    COUNTER_CUSTOMERS_BY_TAG,
+    COUNTER_TASKS_BY_SENDER,
+    COUNTER_TASKS_BY_STATUS,
+    COUNTER_USERS,
+    RowCounter,
+)
+from crm_backend.models.user import User
+
+
+def counters(kind: str):
+    with Session(engine) as session:
+        return read_counters_by_key(session, kind)
+
+
+def total(kind: str) -> int:
+    with Session(engine) as session:
+        return read_counter(session, kind)
+
+
+def add_customer(session: Session, name: str, tags) -> Customer:
+    customer = Customer(name=name, email=f"{name}@example.com", created_by=1, tags=tags)
+    session.add(customer)
+    sync_customer_tags(session, customer)
+    return customer
+
+
+def test_customer_and_tag_counters_follow_writes(db):
+    with Session(engine) as session:
+        first_id = add_customer(session, "a", ["VIP客户", "北京"]).id
+        add_customer(session, "b", ["VIP客户"])
+        session.commit()
+    assert total(COUNTER_CUSTOMERS) == 2
+    assert counters(COUNTER_CUSTOMERS_BY_TAG) == {"VIP客户": 2, "北京": 1}
+
+    with Session(engine) as session:
+        customer = session.get(Customer, first_id)
+        customer.tags = ["上海"]  # type: ignore
+        sync_customer_tags(session, customer)  # type: ignore
+        session.exec(  # 直接改标签索引行也会更新计数
+            CustomerTag.__table__.update()  # type: ignore
+            .where(CustomerTag.tag == "上海")
+            .values(tag="广州")
+        )
+        session.commit()
+    assert counters(COUNTER_CUSTOMERS_BY_TAG) == {"VIP客户": 1, "广州": 1}
+
+    with Session(engine) as session:
+        delete_customer_tags(session, first_id)  # type: ignore
+        session.delete(session.get(Customer, first_id))
+        session.commit()
+    assert total(COUNTER_CUSTOMERS) == 1
+    assert counters(COUNTER_CUSTOMERS_BY_TAG) == {"VIP客户": 1}
+
+
+def test_user_counter(db):
+    with Session(engine) as session:
+        for name in ("u1", "u2", "u3"):
+            session.add(User(name=name, passwd="x", email=f"{name}@example.com"))
+        session.commit()
+        session.delete(session.exec(select(User).where(User.name == "u2")).one())
+        session.commit()
+    assert total(COUNTER_USERS) == 2
+
+
+def test_email_task_counters_follow_status_and_sender(db):
+    with Session(engine) as session:
+        tasks = [
+            EmailTask(name="t", send_by="a@example.com", send_to=f"c{number}@example.com")
+            for number in range(3)
+        ]
+        session.add_all(tasks)
+        session.commit()
+        tasks[0].status = TASK_STATUS_SENDING
+        tasks[1].status = TASK_STATUS_SUCCESS
+        tasks[2].send_by = "b@example.com"
+        session.add_all(tasks)
+        session.commit()
+    assert counters(COUNTER_TASKS_BY_STATUS) == {
+        TASK_STATUS_PENDING: 1,
+        TASK_STATUS_SENDING: 1,
+        TASK_STATUS_SUCCESS: 1,
+    }
+    assert counters(COUNTER_TASKS_BY_SENDER) == {"a@example.com": 2, "b@example.com": 1}
+    assert total(COUNTER_TASKS_BY_STATUS) == 3
+
+
+def test_ensure_row_counters_rebuilds_only_when_inconsistent(db):
+    with Session(engine) as session:
+        add_customer(session, "a", ["VIP客户"])
+        session.add(EmailTask(name="t", send_by="a@example.com", send_to="c@example.com"))
+        session.commit()
+
+    def set_counter(kind: str, key: str, value: int):
+        with Session(engine) as session:
+            counter = session.get(RowCounter, (kind, key))
+            counter.value = value  # type: ignore
+            session.add(counter)
+            session.commit()
+
+    # 用户数和客户数一致时不重建: 其他计数器上的偏差保持不变
+    set_counter(COUNTER_TASKS_BY_STATUS, TASK_STATUS_PENDING, 5)
+    ensure_row_counters()
+    assert counters(COUNTER_TASKS_BY_STATUS) == {TASK_STATUS_PENDING: 5}
+
+    # 客户数不一致时重建全部计数器
+    set_counter(COUNTER_CUSTOMERS, "", 10)
+    ensure_row_counters()
+    assert total(COUNTER_CUSTOMERS) == 1
+    assert counters(COUNTER_TASKS_BY_STATUS) == {TASK_STATUS_PENDING: 1}
+    assert counters(COUNTER_CUSTOMERS_BY_TAG) == {"VIP客户": 1}
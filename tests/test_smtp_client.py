@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from benchmarks.smtp_stub import SmtpStubServer
+from crm_backend.utils.smtp_client import SmtpConnection, SmtpConnectionPool, SmtpError
+
+
+def run_with_stub(scenario, **stub_options):
+    """在同一个事件循环中启动SMTP替身服务器并执行 scenario(server)"""
+
+    async def main():
+        server = SmtpStubServer(**stub_options)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def make_pool(server: SmtpStubServer, timeout: float = 5.0, retries: int = 2) -> SmtpConnectionPool:
+    return SmtpConnectionPool(
+        lambda: SmtpConnection(server.host, server.port, timeout=timeout),
+        size=1,
+        retries=retries,
+    )
+
+
+def test_pipelining_writes_envelope_commands_at_once():
+    async def scenario(server):
+        connection = SmtpConnection(server.host, server.port, timeout=5.0)
+        await connection.connect()
+        assert "pipelining" in connection.extensions
+
+        writes = []
+        write = connection._write
+        connection._write = lambda data: (writes.append(data), write(data))[1]
+        await connection.send_message("from@example.com", "to@example.com", b"Subject: s\r\n\r\nbody")
+        await connection.close()
+        return writes
+
+    writes = run_with_stub(scenario)
+    assert writes[0] == b"MAIL FROM:<from@example.com>\r\nRCPT TO:<to@example.com>\r\nDATA\r\n"
+    assert writes[1].endswith(b"\r\n.\r\n")
+
+
+def test_dot_stuffing_round_trip():
+    body = b"Subject: s\n\n.leading dot\n..two dots\n.\nlast line"
+
+    async def scenario(server):
+        connection = SmtpConnection(server.host, server.port, timeout=5.0)
+        await connection.connect()
+        await connection.send_message("from@example.com", "to@example.com", body)
+        await connection.close()
+        return server.messages[0]
+
+    mail_from, recipients, received = run_with_stub(scenario, keep_messages=1)
+    assert (mail_from, recipients) == ("from@example.com", ["to@example.com"])
+    assert received == body.replace(b"\n", b"\r\n") + b"\r\n"
+
+
+def test_rejected_recipient_resets_and_keeps_connection():
+    async def scenario(server):
+        connection = SmtpConnection(server.host, server.port, timeout=5.0)
+        await connection.connect()
+        with pytest.raises(SmtpError) as error:
+            await connection.send_message("from@example.com", "reject@example.com", b"body")
+        # RSET 之后同一个连接可以继续发送
+        await connection.send_message("from@example.com", "ok@example.com", b"body")
+        await connection.close()
+        return error.value, dict(server.stats)
+
+    error, stats = run_with_stub(scenario, reject_pattern="reject")
+    assert error.code == 550 and not error.transient
+    assert stats["connections"] == 1
+    assert stats["rejected"] == 1
+    assert stats["messages"] == 1
+
+
+def test_pool_does_not_retry_permanent_errors():
+    async def scenario(server):
+        pool = make_pool(server)
+        with pytest.raises(SmtpError):
+            await pool.send("from@example.com", "reject@example.com", b"body")
+        await pool.close()
+        return pool
+
+    pool = run_with_stub(scenario, reject_pattern="reject")
+    assert pool.reconnects == 0
+    assert pool.connects == 1
+
+
+def test_pool_retries_transient_errors_on_new_connection():
+    async def scenario(server):
+        pool = make_pool(server)
+        # 替身服务器每个连接只接收一封邮件, 之后返回421并断开
+        await pool.send("from@example.com", "a@example.com", b"body")
+        await pool.send("from@example.com", "b@example.com", b"body")
+        await pool.close()
+        return pool, dict(server.stats)
+
+    pool, stats = run_with_stub(scenario, max_messages_per_connection=1)
+    assert pool.reconnects == 1
+    assert pool.messages == 2
+    assert stats["messages"] == 2
+
+
+def test_pool_does_not_retry_after_data_was_sent():
+    async def scenario(server):
+        pool = make_pool(server, timeout=0.2)
+        with pytest.raises(SmtpError) as error:
+            await pool.send("from@example.com", "to@example.com", b"body")
+        await asyncio.sleep(0.5)  # 等替身服务器处理完这封邮件
+        await pool.close()
+        return pool, error.value, dict(server.stats)
+
+    pool, error, stats = run_with_stub(scenario, data_latency=0.4)
+    assert error.after_data and not error.transient
+    assert pool.reconnects == 0
+    assert stats["messages"] == 1  # 服务器已经接收, 没有重复发送
+
+
+def test_cancelled_send_does_not_return_connection_to_pool():
+    async def scenario(server):
+        pool = make_pool(server)
+        send = asyncio.create_task(pool.send("from@example.com", "to@example.com", b"body"))
+        await asyncio.sleep(0.1)
+        send.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await send
+        stats = pool.stats()
+        await pool.close()
+        return stats
+
+    stats = run_with_stub(scenario, data_latency=0.5)
+    assert stats["smtp_connections_idle"] == 0
+    assert stats["smtp_connections_open"] == 0
@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+from jose import jwt
+
+from crm_backend.utils import token_cache as token_cache_module
+from crm_backend.utils.jwt import ALGORITHM, SECRET_KEY, jwt_encode
+from crm_backend.utils.token_cache import VerifiedTokenCache
+
+
+def token(user_id: int = 1, seconds: int = 3600) -> str:
+    return jwt_encode({"user_id": user_id}, timedelta(seconds=seconds))
+
+
+def test_cache_hits_skip_decoding_and_evict_least_recent():
+    cache = VerifiedTokenCache(max_size=2)
+    first, second, third = token(1), token(2), token(3)
+    assert cache.decode(first)[1]["user_id"] == 1  # type: ignore
+    cache.decode(second)
+    cache.decode(first)  # first 变为最近使用
+    cache.decode(third)  # 淘汰 second
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 3}
+    cache.decode(second)
+    assert cache.stats()["misses"] == 4
+
+
+def test_invalid_and_expired_tokens_are_not_cached():
+    cache = VerifiedTokenCache(max_size=10)
+    assert cache.decode("not a token") == (False, None)
+    assert cache.decode(token(seconds=-10)) == (False, None)
+    assert cache.stats()["size"] == 0
+
+
+def test_cached_entry_expires_with_the_token(monkeypatch):
+    cache = VerifiedTokenCache(max_size=10)
+    value = token(seconds=60)
+    assert cache.decode(value)[0]
+    assert cache.stats()["size"] == 1
+
+    monkeypatch.setattr(token_cache_module, "time", SimpleNamespace(time=lambda: time.time() + 120))
+    monkeypatch.setattr(token_cache_module, "jwt_decode", lambda _: (False, None))
+    assert cache.decode(value) == (False, None)  # 缓存条目过期后重新验签
+    assert cache.stats() == {"size": 0, "hits": 0, "misses": 2}
+
+
+def test_revoke_user_rejects_only_tokens_issued_before():
+    cache = VerifiedTokenCache(max_size=10)
+    old, other = token(1), token(2)
+    cache.decode(old)
+    cache.decode(other)
+
+    cache.revoke_user(1)
+    new = token(1)  # 与吊销在同一秒内签发
+    assert cache.decode(old) == (False, None)
+    assert cache.decode(new)[0]
+    assert cache.decode(other)[0]
+    assert cache.stats()["size"] == 2
+
+
+def test_revocation_applies_to_whole_second_iat_and_uncached_mode():
+    cache = VerifiedTokenCache(max_size=0)
+    now = time.time()
+    legacy = jwt.encode({"user_id": 1, "iat": int(now), "exp": now + 60}, SECRET_KEY, algorithm=ALGORITHM)
+    assert cache.decode(legacy)[0]
+    cache.revoke_user(1)
+    assert cache.decode(legacy) == (False, None)
+
+
+def test_revocation_hooks_run_on_cache_hits():
+    cache = VerifiedTokenCache(max_size=10)
+    blocked = set()
+    cache.register_revocation_hook(lambda claims: claims["user_id"] in blocked)
+    value = token(1)
+    assert cache.decode(value)[0]
+    blocked.add(1)
+    assert cache.decode(value) == (False, None)
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,34 @@
+from sqlmodel import Session
+
+from crm_backend.controls import ctr_users
+from crm_backend.db.db import engine
+from crm_backend.models.user import User
+
+
+def test_update_other_user_is_rejected_before_hashing(client, make_user, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(ctr_users, "get_passwd_hash_bounded", lambda passwd: hashed.append(passwd) or "hash")
+    _, headers = make_user("alice")
+    bob_id, _ = make_user("bob")
+
+    body = {"update_key": ["passwd"], "update_user": {"passwd": "new-passwd"}}
+    response = client.post(f"/api/users/update/{bob_id}", json=body, headers=headers)
+    assert response.status_code == 403
+    response = client.post("/api/users/update/999999", json=body, headers=headers)
+    assert response.status_code == 404
+    assert hashed == []
+
+
+def test_update_with_empty_passwd_is_a_client_error(client, make_user, monkeypatch):
+    monkeypatch.setattr(ctr_users, "get_passwd_hash_bounded", lambda passwd: "hash:" + passwd)
+    alice_id, headers = make_user("alice")
+
+    for passwd in (None, ""):
+        body = {"update_key": ["passwd"], "update_user": {"passwd": passwd}}
+        response = client.post(f"/api/users/update/{alice_id}", json=body, headers=headers)
+        assert response.status_code == 400
+
+    body = {"update_key": ["passwd"], "update_user": {"passwd": "new-passwd"}}
+    assert client.post(f"/api/users/update/{alice_id}", json=body, headers=headers).status_code == 200
+    with Session(engine) as session:
+        assert session.get(User, alice_id).passwd == "hash:new-passwd"  # type: ignore